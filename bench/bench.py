@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB benchmarks.
+
+Usage: bench/bench.py [--hosts 10k|100k|1M|<n>] [--probes <n>] [--phases <phase>,<phase>…] [--output <file.json>]
+       bench/bench.py --generate --hosts <n>
+       bench/bench.py --compare <old.json> <new.json>
+
+A synthetic database (see synthetic.py) is generated once per size in bench/data/, then copied before every run
+so all runs start from the same state. The network phases probe the first --probes hosts (1000 by default) through
+the local stand-ins (see standins.py), the others work on the whole database. Each phase reports its number of
+operations, its wall time and its operations per second. The results are written as JSON, to compare releases.
+The start time of the command line itself is measured by startup.py.
+
+Phases: updateHosts, hostsByTags, list, pingAddr, getSNMP, getURLs, execute, purgeHosts (the last one deletes hosts)."""
+import sys
+from os import path
+bench_dir = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.join(bench_dir, '..', 'src'))
+sys.path.insert(0, bench_dir)
+try:
+    import os
+    import json
+    import random
+    import shutil
+    import platform
+    import tempfile
+    import subprocess
+    from contextlib import contextmanager, redirect_stdout
+    from time import time, strftime
+    import Logger, Cmdline, Host
+    from SQLite import SQLite
+    import OSMDB
+    import synthetic, standins
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+phases = ['updateHosts', 'hostsByTags', 'list', 'pingAddr', 'getSNMP', 'getURLs', 'execute', 'purgeHosts']
+tag_queries = ['web', 'linux&prod', 'web|db|dns', '(linux|bsd)&!decommissioned', 'switch&!router&!test']
+
+def size(text):
+    """Return the number of hosts of a size like “10k” or “1M”."""
+    units = {'k': 1000, 'K': 1000, 'M': 1000000}
+    if text[-1] in units: return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+def version():
+    """Return the version of OSMDB being measured, as told by git."""
+    try: return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=bench_dir, stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError): return 'unknown'
+
+class Bench:
+    """Run the phases on a copy of a synthetic database."""
+
+    def __init__(self, configuration, work_dir, probes = 1000, logger = Logger.Logger()):
+
+        self.configuration = configuration
+        self.work_dir = work_dir
+        self.probes = probes
+        self.logger = logger
+        self.db = SQLite(configuration, logger)
+        self.osmdb = OSMDB.OSMDB(configuration, self.db, logger)
+        self.results = {}
+
+    def __repr__(self): return 'Bench'
+
+    def close(self): self.osmdb.close()
+
+    @contextmanager
+    def measure(self, name, ops = 0):
+        """Time the block of a phase. The block may update the operations count and add figures to the result."""
+        result = {'ops': ops}
+        start = time()
+        try: yield result
+        except Exception as e:
+            result['error'] = '{}: {}'.format(type(e).__name__, e)
+            self.logger.log('Phase {} failed: {}'.format(name, result['error']), 4)
+        result['seconds'] = round(time() - start, 6)
+        result['ops_per_second'] = round(result['ops'] / result['seconds'], 2) if result['seconds'] else 0
+        self.results[name] = result
+        print('{:12} {:>10} ops in {:>10.3f}s, {:>12.2f} ops/s'.format(name, result['ops'], result['seconds'], result['ops_per_second']), file=sys.stderr)
+
+    def addresses(self):
+
+        return [ip for ip, in self.db.cursor.execute("""SELECT ip FROM host WHERE fqdn LIKE '%.bench.invalid' ORDER BY rowid LIMIT ?""", (self.probes,))]
+
+    def updateHosts(self):
+
+        rand = random.Random(1)
+        delays = [(hostname, fqdn, -1 if rand.random() < 0.1 else rand.uniform(0.0001, 0.01), ip) for hostname, fqdn, ip in self.db.cursor.execute("""SELECT hostname, fqdn, ip FROM host""")]
+        with self.measure('updateHosts', len(delays)): self.osmdb.updateHosts(delays, 'bench')
+
+    def hostsByTags(self):
+
+        with self.measure('hostsByTags', len(tag_queries)) as result:
+            result['rows'] = sum(len(self.db.hostsByTags(query)) for query in tag_queries)
+
+    def list(self):
+
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            with self.measure('list') as result:
+                result['ops'] = self.osmdb.listHosts('', False) + self.osmdb.listExecutions() + self.osmdb.listHostUpdates()
+
+    def pingAddr(self):
+
+        addresses = self.addresses()
+        with self.measure('pingAddr', len(addresses)) as result:
+            result['replies'] = len([host for host in self.osmdb.pingAddr(addresses) if host[2] != -1])
+
+    def getSNMP(self):
+
+        addresses = self.addresses()
+        agent = standins.SNMPAgent(int(self.configuration['snmp']['port']), self.configuration['snmp'].get('community', 'public'), self.logger).start()
+        try:
+            with self.measure('getSNMP', len(addresses)) as result:
+                responses = self.osmdb.getSNMP(addresses, [('SNMPv2-MIB', 'sysDescr'), ('SNMPv2-MIB', 'sysUpTime')])
+                result['replies'] = len([response for response in responses if response[4] != ''])
+        finally: agent.stop()
+
+    def getURLs(self):
+
+        port = int(self.configuration['bench']['https_port'])
+        self.db.cursor.execute("""DELETE FROM url WHERE rowid NOT IN (SELECT rowid FROM url ORDER BY rowid LIMIT ?)""", (self.probes,))
+        self.db.cursor.execute("""UPDATE url SET port = ?""", (port,))
+        self.db.commit()
+        server = standins.HTTPSServer(port, *standins.selfSigned(self.work_dir), logger=self.logger).start()
+        try:
+            with self.measure('getURLs') as result:
+                result['replies'] = 0
+                for url in self.osmdb.getURLs():
+                    result['ops'] += 1
+                    if url['status'] == 200: result['replies'] += 1
+        finally: server.stop()
+
+    def execute(self):
+
+        import SSHClient
+        server = standins.SSHServer(int(self.configuration['ssh']['port']), self.logger).start()
+        try:
+            hosts = []
+            for address in self.addresses():
+                host = Host.Host((address, address, address))
+                host.user = 'bench'
+                hosts.append(host)
+            self.osmdb.ssh = SSHClient.SSHClient(logger=self.logger, configuration=self.configuration)
+            with self.measure('execute', len(hosts)) as result:
+                result['replies'] = sum(len([run for run in runs if run[3] == 0]) for runs in self.osmdb.ssh.execute('uname -a', hosts))
+        finally: server.stop()
+
+    def purgeHosts(self):
+
+        hosts = self.db.cursor.execute("""SELECT COUNT(*) FROM host""").fetchone()[0]
+        with self.measure('purgeHosts', hosts) as result: result['deleted'] = len(self.db.purgeHosts('%'))
+
+    def run(self, names):
+
+        for name in names:
+            try: getattr(self, name)()
+            except Exception as e:
+                self.results[name] = {'ops': 0, 'seconds': 0, 'ops_per_second': 0, 'error': '{}: {}'.format(type(e).__name__, e)}
+                self.logger.log('Phase {} failed: {}'.format(name, self.results[name]['error']), 4)
+        return self.results
+
+def compare(old_file, new_file):
+    """Print the operations per second of two result files, phase by phase."""
+    with open(old_file) as f: old = json.load(f)
+    with open(new_file) as f: new = json.load(f)
+    print('{:12} {:>14} {:>14} {:>8}'.format('', old.get('version', old_file)[:14], new.get('version', new_file)[:14], 'ratio'))
+    for name in phases:
+        if name not in old['phases'] and name not in new['phases']: continue
+        before = old['phases'].get(name, {}).get('ops_per_second', 0)
+        after = new['phases'].get(name, {}).get('ops_per_second', 0)
+        print('{:12} {:>14.2f} {:>14.2f} {:>8}'.format(name, before, after, '{:.2f}'.format(after / before) if before else '-'))
+
+def main():
+
+    cmdline = Cmdline.Cmdline(sys.argv, {'--hosts': '-n', '--probes': '-p', '--phases': '-P', '--output': '-o', '--generate': '-g',
+                                         '--compare': '-c', '--config': '-f', '--verbose': '-v', '--help': '-h'})
+    if cmdline.option('h'):
+        print(__doc__, file=sys.stderr)
+        return 1
+    if cmdline.option('c'):
+        if cmdline.option('c') is True or len(cmdline.tags) != 1:
+            print('Usage: {} --compare <old.json> <new.json>'.format(sys.argv[0]), file=sys.stderr)
+            return 1
+        compare(cmdline.option('c'), cmdline.tags[0])
+        return 0
+    logger = Logger.Logger()
+    # OSMDB logs every host state change: only errors are shown, unless --verbose.
+    logger.level = 0 if cmdline.option('v') else 4
+    try:
+        hosts = size(cmdline.option('n')) if cmdline.option('n') not in [True, False] else 10000
+        probes = int(cmdline.option('p')) if cmdline.option('p') not in [True, False] else 1000
+    except ValueError as e:
+        print('Invalid number: {}'.format(e), file=sys.stderr)
+        return 1
+    selected = cmdline.option('P').split(',') if cmdline.option('P') not in [True, False] else phases
+    unknown = [name for name in selected if name not in phases]
+    if unknown:
+        print('Unknown phase(s): {}. Valid phases are: {}.'.format(', '.join(unknown), ', '.join(phases)), file=sys.stderr)
+        return 1
+    config_file = cmdline.option('f') if cmdline.option('f') not in [True, False] else path.join(bench_dir, '..', 'osmdb.conf')
+    with open(config_file) as f: configuration = json.load(f)
+    configuration['bench'] = dict({'https_port': 18443}, **configuration.get('bench', {}))
+    configuration['snmp']['port'] = configuration['bench'].get('snmp_port', 16161)
+    configuration['ssh']['port'] = configuration['bench'].get('ssh_port', 12222)
+
+    data_dir = path.join(bench_dir, 'data')
+    os.makedirs(data_dir, exist_ok=True)
+    db_file = path.join(data_dir, 'osmdb-{}.db'.format(hosts))
+    if cmdline.option('g') or not path.exists(db_file):
+        synthetic.generate(db_file, hosts, configuration['bench']['https_port'], logger=logger)
+        if cmdline.option('g'): return 0
+
+    work_dir = tempfile.mkdtemp(prefix='osmdb-bench-')
+    try:
+        configuration['db_file'] = path.join(work_dir, 'osmdb.db')
+        configuration['ssh']['default_key'] = path.join(work_dir, 'osmdb_id')
+        configuration['ssh']['default_pubkey'] = path.join(work_dir, 'osmdb_id.pub')
+        configuration['ssh']['default_user'] = 'bench'
+        shutil.copyfile(db_file, configuration['db_file'])
+        bench = Bench(configuration, work_dir, probes, logger)
+        start = time()
+        results = {'version': version(), 'date': strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': platform.python_version(), 'platform': platform.platform(),
+                   'hosts': hosts, 'probes': probes, 'phases': bench.run(selected)}
+        results['seconds'] = round(time() - start, 6)
+        bench.close()
+    finally: shutil.rmtree(work_dir, ignore_errors=True)
+    output = json.dumps(results, indent=2)
+    if cmdline.option('o') not in [True, False]:
+        with open(cmdline.option('o'), 'w') as f: f.write(output + '\n')
+    else: print(output)
+    return 0 if not any('error' in result for result in results['phases'].values()) else 2
+
+if __name__ == '__main__': sys.exit(main())
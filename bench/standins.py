@@ -0,0 +1,272 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Local stand-ins of the devices OSMDB probes, for the benchmarks.
+
+Linux answers ICMP echo requests on every address of 127.0.0.0/8: the synthetic hosts have loopback addresses,
+so the sweep engine is measured as is. The other services listen on all the loopback addresses at once, and
+ignore the clients which are not on the loopback network:
+    - SNMPAgent answers the GET requests of SNMPv1 and v2c for sysDescr.0 and sysUpTime.0, from the address they were sent to;
+    - HTTPSServer serves a small page with an ETag over TLS, with a self-signed certificate;
+    - SSHServer accepts any key or password and answers every command with its own command line."""
+import sys
+try:
+    import os
+    import socket
+    import ssl
+    import struct
+    import threading
+    from time import time
+    from datetime import datetime, timedelta
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    import Logger
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+def loopback(address): return address.startswith('127.')
+
+## BER encoding, just what a GET response needs.
+def berLength(length):
+
+    if length < 0x80: return bytes([length])
+    data = length.to_bytes((length.bit_length() + 7) // 8, 'big')
+    return bytes([0x80 | len(data)]) + data
+
+def ber(tag, value): return bytes([tag]) + berLength(len(value)) + value
+
+def berInteger(value, tag = 0x02): return ber(tag, value.to_bytes(value.bit_length() // 8 + 1, 'big', signed=True))
+
+def berItems(data):
+    """Yield the (tag, value) items of a constructed value."""
+    offset = 0
+    while offset < len(data):
+        tag, length = data[offset], data[offset + 1]
+        offset += 2
+        if length & 0x80:
+            size = length & 0x7f
+            length = int.from_bytes(data[offset:offset + size], 'big')
+            offset += size
+        yield tag, data[offset:offset + length]
+        offset += length
+
+SYS_DESCR  = bytes([0x2b, 6, 1, 2, 1, 1, 1, 0]) # 1.3.6.1.2.1.1.1.0
+SYS_UPTIME = bytes([0x2b, 6, 1, 2, 1, 1, 3, 0]) # 1.3.6.1.2.1.1.3.0
+GET_REQUEST, GET_RESPONSE = 0xa0, 0xa2
+IP_PKTINFO = getattr(socket, 'IP_PKTINFO', 8)
+
+class SNMPAgent:
+    """Minimal SNMP agent. The other requests (GETNEXT, GETBULK…) are answered with endOfMibView in SNMPv2c, noSuchName in SNMPv1."""
+
+    def __init__(self, port = 16161, community = 'public', logger = Logger.Logger()):
+
+        self.port = port
+        self.community = community.encode()
+        self.logger = logger
+        self.start_time = time()
+        self.requests = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        # The destination address of each request, to answer from it.
+        self.sock.setsockopt(socket.IPPROTO_IP, IP_PKTINFO, 1)
+        self.sock.bind(('0.0.0.0', port))
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def __repr__(self): return 'SNMPAgent'
+
+    def start(self):
+
+        self.thread.start()
+        return self
+
+    def stop(self): self.sock.close()
+
+    def values(self):
+
+        return {SYS_DESCR: ber(0x04, b'Linux OSMDB benchmark stand-in'), SYS_UPTIME: berInteger(int((time() - self.start_time) * 100), 0x43)}
+
+    def respond(self, data):
+        """Return the response to a request, None if it must be ignored."""
+        (_, message), = berItems(data)
+        (_, version), (_, community), (pdu_type, pdu) = berItems(message)
+        if community != self.community: return None
+        (_, request_id), _, _, (_, varbinds) = berItems(pdu)
+        oids = [next(berItems(varbind))[1] for _, varbind in berItems(varbinds)]
+        values = self.values() if pdu_type == GET_REQUEST else {}
+        error_status = error_index = 0
+        bindings = []
+        for index, oid in enumerate(oids, 1):
+            if oid in values: value = values[oid]
+            elif version != b'\x00': value = ber(0x80 if pdu_type == GET_REQUEST else 0x82, b'') # noSuchObject, endOfMibView
+            else:
+                # SNMPv1: the whole request fails, its variables are sent back unset.
+                error_status, error_index = 2, index # noSuchName
+                bindings = [ber(0x30, ber(0x06, oid) + ber(0x05, b'')) for oid in oids]
+                break
+            bindings.append(ber(0x30, ber(0x06, oid) + value))
+        pdu = ber(0x02, request_id) + berInteger(error_status) + berInteger(error_index) + ber(0x30, b''.join(bindings))
+        return ber(0x30, ber(0x02, version) + ber(0x04, community) + ber(GET_RESPONSE, pdu))
+
+    def serve(self):
+
+        while True:
+            try: data, ancillary, _, client = self.sock.recvmsg(65536, socket.CMSG_SPACE(12))
+            except OSError: return
+            if not loopback(client[0]): continue
+            destination = b'\0' * 4
+            for level, kind, info in ancillary:
+                if level == socket.IPPROTO_IP and kind == IP_PKTINFO: destination = info[8:12]
+            try: response = self.respond(data)
+            except (ValueError, IndexError, StopIteration) as e:
+                self.logger.log('Malformed request from {}: {}'.format(client[0], e), 0)
+                continue
+            if not response: continue
+            self.requests += 1
+            try: self.sock.sendmsg([response], [(socket.IPPROTO_IP, IP_PKTINFO, struct.pack('=I4s4s', 0, destination, b'\0' * 4))], 0, client)
+            except OSError as e: self.logger.log('Can’t answer {}: {}'.format(client[0], e), 0)
+
+def selfSigned(directory, name = 'bench.invalid'):
+    """Write a self-signed certificate and its key in directory. Return the paths of both files."""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    now = datetime.utcnow()
+    cert = (x509.CertificateBuilder().subject_name(subject).issuer_name(subject).public_key(key.public_key())
+            .serial_number(x509.random_serial_number()).not_valid_before(now - timedelta(days=1)).not_valid_after(now + timedelta(days=30))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(name)]), critical=False)
+            .sign(key, hashes.SHA256(), default_backend()))
+    cert_file, key_file = os.path.join(directory, 'bench.crt'), os.path.join(directory, 'bench.key')
+    with open(cert_file, 'wb') as f: f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_file, 'wb') as f: f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL, serialization.NoEncryption()))
+    return cert_file, key_file
+
+class PageHandler(BaseHTTPRequestHandler):
+    """Serve the same small page on every path, or 304 when the client has it already."""
+    protocol_version = 'HTTP/1.1'
+    page = b'<html><head><title>OSMDB benchmark</title></head><body>' + b'x' * 2048 + b'</body></html>'
+    etag = '"bench-1"'
+
+    def do_GET(self):
+
+        if self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.send_header('ETag', self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.page)))
+        self.send_header('ETag', self.etag)
+        self.end_headers()
+        self.wfile.write(self.page)
+
+    def log_message(self, format, *args): pass
+
+class HTTPSServer(ThreadingHTTPServer):
+    """HTTPS server. The TLS handshakes are made by the threads serving the connections, not by the one accepting them."""
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, port, cert_file, key_file, logger = Logger.Logger()):
+
+        super().__init__(('0.0.0.0', port), PageHandler)
+        self.logger = logger
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(cert_file, key_file)
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def __repr__(self): return 'HTTPSServer'
+
+    def start(self):
+
+        self.thread.start()
+        return self
+
+    def stop(self):
+
+        self.shutdown()
+        self.server_close()
+
+    def verify_request(self, request, client_address): return loopback(client_address[0])
+
+    def get_request(self):
+
+        conn, client = self.socket.accept()
+        return self.context.wrap_socket(conn, server_side=True, do_handshake_on_connect=False), client
+
+    def finish_request(self, request, client_address):
+
+        try: request.do_handshake()
+        except (ssl.SSLError, OSError): return
+        super().finish_request(request, client_address)
+
+    def handle_error(self, request, client_address): self.logger.log('HTTPS error with {}: {}'.format(client_address[0], sys.exc_info()[1]), 0)
+
+class SSHServer:
+    """SSH server. Each connection is served by its own thread; each command gets its command line back, and return code 0."""
+
+    def __init__(self, port = 2222, logger = Logger.Logger()):
+
+        import paramiko
+        self.paramiko = paramiko
+        self.port = port
+        self.logger = logger
+        self.host_key = paramiko.RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('0.0.0.0', port))
+        self.sock.listen(1024)
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    def __repr__(self): return 'SSHServer'
+
+    def start(self):
+
+        self.thread.start()
+        return self
+
+    def stop(self): self.sock.close()
+
+    def serve(self):
+
+        while True:
+            try: conn, client = self.sock.accept()
+            except OSError: return
+            if not loopback(client[0]):
+                conn.close()
+                continue
+            threading.Thread(target=self.session, args=(conn,), daemon=True).start()
+
+    def session(self, conn):
+
+        paramiko = self.paramiko
+        class Interface(paramiko.ServerInterface):
+            def get_allowed_auths(self, username): return 'publickey,password'
+            def check_auth_publickey(self, username, key): return paramiko.AUTH_SUCCESSFUL
+            def check_auth_password(self, username, password): return paramiko.AUTH_SUCCESSFUL
+            def check_channel_request(self, kind, chanid):
+                if kind == 'session': return paramiko.OPEN_SUCCEEDED
+                return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+            def check_channel_exec_request(self, channel, command):
+                # Answered from another thread: the request must be acknowledged before the channel is closed.
+                threading.Thread(target=reply, args=(channel, command), daemon=True).start()
+                return True
+        def reply(channel, command):
+            try:
+                channel.sendall(command + b'\n')
+                channel.send_exit_status(0)
+            finally: channel.close()
+        transport = paramiko.Transport(conn)
+        transport.add_server_key(self.host_key)
+        try:
+            transport.start_server(server=Interface())
+            while transport.is_active(): transport.accept(1)
+        except (paramiko.SSHException, EOFError, OSError) as e: self.logger.log('SSH error: {}'.format(e), 0)
+        finally: transport.close()
+
+if __name__ == '__main__': sys.exit(100)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB start time benchmark.
+
+Usage: bench/startup.py [--runs <n>] [--budget <ms>] [--hosts 10k|100k|1M|<n> [--wall-budget <ms>]] [--output <file.json>] [-- <osmdb arguments>]
+
+Run `osmdb --list hosts` (or the given arguments) --runs times (20 by default) on an empty database, with
+`python -X importtime`, and report the median wall time and the median time spent importing modules,
+together with the heaviest imports. The command fails (exit code 2) if the import time is over the budget
+(100 ms by default), or if one of the probe libraries was imported: a listing needs none of them.
+The first run, not counted, creates the database and the byte code caches.
+
+With --hosts, the runs work on a copy of the synthetic database of that size (see bench.py), history included,
+and the default command is `osmdb --list hosts --limit 10`: a first page must not cost a pass over the whole database.
+The command then also fails if the median wall time is over --wall-budget (1000 ms by default)."""
+import sys
+from os import path
+bench_dir = path.dirname(path.abspath(__file__))
+sys.path.insert(0, path.join(bench_dir, '..', 'src'))
+try:
+    import os
+    import json
+    import shutil
+    import platform
+    import tempfile
+    import subprocess
+    from statistics import median
+    from time import perf_counter, strftime
+    import Cmdline
+    import synthetic
+    from bench import version, size
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+# Libraries only the probes need: SNMP, HTTP and SSH.
+probe_modules = ['pysnmp', 'pyasn1', 'requests', 'urllib3', 'cryptography', 'paramiko']
+
+def importTimes(stderr):
+    """Return the (self, cumulative) import times, in seconds, of each module listed by `python -X importtime`, and the total time."""
+    modules, total = {}, 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line: continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = (int(own) / 1e6, int(cumulative) / 1e6)
+        # Top level imports are not indented: their cumulative times add up to the total.
+        if not name[1:].startswith(' '): total += int(cumulative) / 1e6
+    return modules, total
+
+def setup(work_dir, db_file = None):
+    """Lay out a copy of the command line in work_dir, using the sources of the tree and a configuration of its own,
+       and a copy of db_file if given."""
+    root = path.abspath(path.join(bench_dir, '..'))
+    os.symlink(path.join(root, 'src'), path.join(work_dir, 'src'))
+    os.symlink(path.join(root, 'osmdb'), path.join(work_dir, 'osmdb'))
+    with open(path.join(root, 'osmdb.conf')) as f: configuration = json.load(f)
+    configuration['db_file'] = path.join(work_dir, 'osmdb.db')
+    configuration['log_file'] = '&2'
+    configuration['metrics'] = {'textfile': '', 'port': 0}
+    with open(path.join(work_dir, 'osmdb.conf'), 'w') as f: json.dump(configuration, f)
+    if db_file: shutil.copyfile(db_file, configuration['db_file'])
+
+def run(work_dir, arguments):
+    """Run the command line once. Return its wall time and the import times."""
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    start = perf_counter()
+    process = subprocess.run([sys.executable, '-X', 'importtime', './osmdb'] + arguments, cwd=work_dir, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = perf_counter() - start
+    if process.returncode: print(process.stderr, file=sys.stderr)
+    return (wall,) + importTimes(process.stderr)
+
+def main():
+
+    arguments = None
+    if '--' in sys.argv:
+        arguments = sys.argv[sys.argv.index('--') + 1:]
+        sys.argv = sys.argv[:sys.argv.index('--')]
+    cmdline = Cmdline.Cmdline(sys.argv, {'--runs': '-r', '--budget': '-b', '--hosts': '-n', '--wall-budget': '-w', '--output': '-o', '--help': '-h'})
+    if cmdline.option('h'):
+        print(__doc__, file=sys.stderr)
+        return 1
+    try:
+        runs = int(cmdline.option('r')) if cmdline.option('r') not in [True, False] else 20
+        budget = float(cmdline.option('b')) if cmdline.option('b') not in [True, False] else 100
+        hosts = size(cmdline.option('n')) if cmdline.option('n') not in [True, False] else None
+        wall_budget = float(cmdline.option('w')) if cmdline.option('w') not in [True, False] else 1000
+    except ValueError as e:
+        print('Invalid number: {}'.format(e), file=sys.stderr)
+        return 1
+    if arguments is None: arguments = ['--list', 'hosts'] + (['--limit', '10'] if hosts else [])
+
+    db_file = None
+    if hosts:
+        data_dir = path.join(bench_dir, 'data')
+        os.makedirs(data_dir, exist_ok=True)
+        db_file = path.join(data_dir, 'osmdb-{}.db'.format(hosts))
+        if not path.exists(db_file): synthetic.generate(db_file, hosts)
+    work_dir = tempfile.mkdtemp(prefix='osmdb-startup-')
+    try:
+        setup(work_dir, db_file)
+        run(work_dir, arguments)
+        samples = [run(work_dir, arguments) for _ in range(max(1, runs))]
+    finally: shutil.rmtree(work_dir, ignore_errors=True)
+
+    modules = samples[-1][1]
+    heaviest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:10]
+    imported = sorted(name for name in set(name for _, names, _ in samples for name in names) if name.split('.')[0] in probe_modules)
+    import_seconds = median(sample[2] for sample in samples)
+    results = {'version': version(), 'date': strftime('%Y-%m-%dT%H:%M:%S%z'), 'python': platform.python_version(), 'platform': platform.platform(),
+               'command': ' '.join(['osmdb'] + arguments), 'runs': len(samples),
+               'wall_seconds': round(median(sample[0] for sample in samples), 6), 'min_wall_seconds': round(min(sample[0] for sample in samples), 6),
+               'import_seconds': round(import_seconds, 6), 'budget_seconds': budget / 1000, 'hosts': hosts or 0,
+               'heaviest': [{'module': name, 'self_seconds': own, 'cumulative_seconds': cumulative} for name, (own, cumulative) in heaviest],
+               'probe_modules_imported': imported}
+    print('{}: {:.1f} ms wall, {:.1f} ms importing (budget: {:.0f} ms), median of {} runs.'.format(results['command'], results['wall_seconds'] * 1000, import_seconds * 1000, budget, len(samples)), file=sys.stderr)
+    if imported: print('Probe modules imported: {}.'.format(', '.join(imported)), file=sys.stderr)
+    slow = hosts and results['wall_seconds'] * 1000 > wall_budget
+    if hosts: results['wall_budget_seconds'] = wall_budget / 1000
+    if slow: print('Over the wall time budget ({:.0f} ms) on {} hosts.'.format(wall_budget, hosts), file=sys.stderr)
+    output = json.dumps(results, indent=2)
+    if cmdline.option('o') not in [True, False]:
+        with open(cmdline.option('o'), 'w') as f: f.write(output + '\n')
+    else: print(output)
+    return 0 if import_seconds * 1000 <= budget and not imported and not slow else 2
+
+if __name__ == '__main__': sys.exit(main())
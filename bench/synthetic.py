@@ -0,0 +1,89 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Synthetic OSMDB databases for the benchmarks.
+
+Host n has the loopback address 127.a.b.c where a.b.c is n + 1, so every host answers ICMP echo requests
+and reaches the local stand-ins (see standins.py). Host names are under .bench.invalid and never resolve.
+The contents are drawn from a seeded generator: a database is the same from one run to the next."""
+import sys
+try:
+    import random
+    from os import path, remove
+    from time import time
+    from SQLite import SQLite, rollup_periods
+    import Logger
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+tags = ['linux', 'bsd', 'windows', 'web', 'db', 'dns', 'mail', 'switch', 'router', 'prod', 'dev', 'test', 'decommissioned']
+commands = ['uname -a', 'uptime', 'df -h /', 'cat /etc/os-release', 'systemctl is-system-running']
+url_paths = ['/', '/health', '/status', '/login', '/api/v1/ping']
+
+def address(n):
+    """Return the loopback address of host n."""
+    n += 1
+    return '127.{}.{}.{}'.format(n >> 16 & 255, n >> 8 & 255, n & 255)
+
+def hostname(n): return 'h{:07d}'.format(n)
+
+def fqdn(n): return hostname(n) + '.bench.invalid'
+
+def generate(db_file, hosts = 10000, https_port = 8443, seed = 0, history = 86400, logger = Logger.Logger()):
+    """Create a database of hosts, together with their tags, parameters, executions, URLs and ping history:
+        - 90% of the hosts are up, one in a hundred shares its address with an older record (work for purgeHosts);
+        - every host has 1 to 3 tags, one in 10 has a ssh_user and one in 20 a snmp_community parameter;
+        - one execution for 10 hosts, the outputs being drawn from a few hundred distinct texts;
+        - one URL for 100 hosts, served by the local HTTPS stand-in on https_port;
+        - the rollups of the ping series of every host over the last history seconds, as a sweep every 5 minutes would leave them."""
+    if hosts > 2 ** 24 - 2: raise ValueError('At most {} hosts fit in 127.0.0.0/8.'.format(2 ** 24 - 2))
+    if path.exists(db_file): remove(db_file)
+    rand = random.Random(seed)
+    now = int(time())
+    start = time()
+    db = SQLite({'db_file': db_file, 'icons': {'host_up': '+', 'host_down': '-'}, 'db': {'journal_mode': 'OFF', 'synchronous': 'OFF', 'temp_store': 'MEMORY', 'compression_level': 6}}, logger)
+    def host(n):
+        up = rand.random() < 0.9
+        first_up = now - rand.randrange(86400, 86400 * 365)
+        last_change = now - rand.randrange(3600, 86400 * 30)
+        adjacent = rand.randrange(1, 1000)
+        return (hostname(n), fqdn(n), address(n), rand.uniform(0.0001, 0.01) if up else -1, first_up, now - rand.randrange(0, 3600),
+                now if up else last_change, last_change if up else now, last_change, adjacent if up else 0, 0 if up else adjacent,
+                rand.randrange(1000, 100000), rand.randrange(0, 1000), 'root', now + rand.randrange(0, 86400))
+    query = """INSERT INTO host (hostname, fqdn, ip, ping_delay, first_up, last_check, last_up, last_down, last_change, adjacent_up, adjacent_down, up, down, user, next_check)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)"""
+    db.cursor.executemany(query, (host(n) for n in range(hosts)))
+    # Older records of some addresses, under another name.
+    db.cursor.executemany(query, ((hostname(n)+'-old', 'old-'+fqdn(n)) + host(n)[2:] for n in range(0, hosts, 100)))
+    db.cursor.executemany("""INSERT OR IGNORE INTO host_tag (host, tag, description, tag_time) VALUES (?,?,'',?)""",
+                          ((fqdn(n), tag, now) for n in range(hosts) for tag in rand.sample(tags, rand.randrange(1, 4))))
+    db.cursor.executemany("""INSERT INTO param (name, param, value) VALUES (?,?,?)""",
+                          ((fqdn(n), 'ssh_user', 'admin') for n in range(0, hosts, 10)))
+    db.cursor.executemany("""INSERT INTO param (name, param, value) VALUES (?,?,?)""",
+                          ((fqdn(n), 'snmp_community', 'public') for n in range(0, hosts, 20)))
+    outputs = [db.putBlob('{} {}\n'.format(rand.choice(commands), n) * rand.randrange(1, 50)) for n in range(300)]
+    def execution(n):
+        end = now - rand.uniform(0, 86400 * 30)
+        return ('root', fqdn(n), rand.choice(commands), 0, rand.choice(outputs), None, '', end - rand.uniform(0.05, 2), end)
+    db.cursor.executemany("""INSERT INTO execution (user, fqdn, cmdline, return_code, stdout_hash, stderr_hash, status, start, end) VALUES (?,?,?,?,?,?,?,?,?)""",
+                          (execution(n) for n in range(0, hosts, 10)))
+    db.cursor.executemany("""INSERT INTO url (proto, user, password, host, port, path, headers) VALUES ('https','','',?,?,?,'{}')""",
+                          ((address(n), https_port, rand.choice(url_paths)) for n in range(0, hosts, 100)))
+    series = db.seriesIds('ping', [fqdn(n) for n in range(hosts)])
+    def rollups(n):
+        lost = 0 if rand.random() < 0.9 else rand.randrange(0, 3)
+        for period in rollup_periods:
+            count = period // 300
+            for start in range(now - history - (now - history) % period, now, period):
+                delay = rand.uniform(0.0001, 0.01)
+                yield (series[fqdn(n)], period, start, count, min(lost, count), delay, delay * (count - min(lost, count)), delay)
+    db.cursor.executemany("""INSERT INTO rollup (series_id, period, time, count, lost, min, sum, max) VALUES (?,?,?,?,?,?,?,?)""",
+                          (rollup for n in range(hosts) for rollup in rollups(n)))
+    db.connection.commit()
+    db.cursor.execute('ANALYZE')
+    db.close()
+    logger.log('{} hosts generated in {}, in {:.1f}s.'.format(hosts, db_file, time() - start), 1)
+
+if __name__ == '__main__': sys.exit(100)
@@ -0,0 +1,93 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB address ranges.
+
+A network is swept from the integer form of its addresses: a block of addresses is two integers whatever its size,
+and each address is only written out when its request is sent. IPv6 prefixes are too large to be enumerated,
+but for the smallest ones: the addresses to sweep are then read from a hit list."""
+import sys
+try:
+    import socket
+    import struct
+    import ipaddress
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+# Largest IPv6 prefix swept without a hit list: a /112.
+MAX_IPV6_HOSTS = 65536
+
+def network(text):
+    """Return the IPv4Network or IPv6Network of text. ValueError is raised if it’s not a network, or has host bits set."""
+    return ipaddress.ip_network(text)
+
+def hostRange(net):
+    """Return the (first, last) integers of the addresses of net which ipaddress’ hosts() would give:
+       neither the network nor the broadcast address of an IPv4 network, nor the Subnet-Router anycast address of an IPv6 one."""
+    first, last = int(net.network_address), int(net.broadcast_address)
+    if net.version == 4 and net.prefixlen < 31: return first + 1, last - 1
+    if net.version == 6 and net.prefixlen < 127: return first + 1, last
+    return first, last
+
+def aton(address):
+    """Return the integer form of the text of an address."""
+    return int(ipaddress.ip_address(address))
+
+def isAddress(text):
+    """Tell if text is an IPv4 or IPv6 address, rather than a host name."""
+    try: ipaddress.ip_address(text)
+    except ValueError: return False
+    return True
+
+def ntoa(number, version = 4):
+    """Return the text of the address of an integer."""
+    if version == 4: return socket.inet_ntoa(struct.pack('!I', number))
+    return socket.inet_ntop(socket.AF_INET6, number.to_bytes(16, 'big'))
+
+class Block:
+    """Addresses first to last, in integer form. Iterating a block yields the text of its addresses, one at a time."""
+
+    def __init__(self, first, last, version = 4):
+
+        self.first   = first
+        self.last    = last
+        self.version = version
+
+    def __repr__(self): return '{}-{}'.format(ntoa(self.first, self.version), ntoa(self.last, self.version))
+
+    def __len__(self): return self.last - self.first + 1
+
+    def __getitem__(self, index):
+
+        if index < 0: index += len(self)
+        if not 0 <= index < len(self): raise IndexError(index)
+        return ntoa(self.first + index, self.version)
+
+    def __iter__(self):
+
+        if self.version == 4:
+            pack, inet_ntoa = struct.Struct('!I').pack, socket.inet_ntoa
+            for number in range(self.first, self.last + 1): yield inet_ntoa(pack(number))
+        else:
+            for number in range(self.first, self.last + 1): yield ntoa(number, 6)
+
+def blocks(net, size, first = None):
+    """Yield the host addresses of net in Blocks of at most size addresses, from first if given."""
+    low, last = hostRange(net)
+    first = max(first or 0, low)
+    for start in range(first, last + 1, max(1, size)): yield Block(start, min(start + size - 1, last), net.version)
+
+def hitlist(filename, net = None):
+    """Yield the addresses of a hit list, in their canonical text form, skipping those out of net.
+       The file has an address per line, “#” starting a comment; “-” is the standard input."""
+    with (sys.stdin if filename == '-' else open(filename)) as f:
+        for line in f:
+            line = line.split('#')[0].strip()
+            if not line: continue
+            try: address = ipaddress.ip_address(line)
+            except ValueError: continue
+            if net is None or (address.version == net.version and address in net): yield str(address)
+
+if __name__ == '__main__': sys.exit(100)
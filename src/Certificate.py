@@ -0,0 +1,42 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB TLS certificates"""
+import sys
+try:
+    import re
+    import ssl
+    from calendar import timegm
+    from hashlib import sha256
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+pem_re = re.compile('-----BEGIN CERTIFICATE-----.*?-----END CERTIFICATE-----', re.DOTALL)
+
+def fingerprint(der):
+    """Return the SHA-256 fingerprint of a DER certificate, as an hexadecimal string."""
+    return sha256(der).hexdigest()
+
+def splitPEM(pem):
+    """Return the DER certificates of a string holding one or more PEM certificates."""
+    return [ssl.PEM_cert_to_DER_cert(block) for block in pem_re.findall(pem or '')]
+
+def record(ders):
+    """Parse a certificate and its chain (DER, the peer’s certificate first). Return the dictionary of a `certificate` table row."""
+    cert = x509.load_der_x509_certificate(ders[0], default_backend())
+    try: san = ','.join(cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value.get_values_for_type(x509.DNSName))
+    except x509.ExtensionNotFound: san = ''
+    not_valid_after = getattr(cert, 'not_valid_after_utc', None) or cert.not_valid_after
+    return {'fingerprint':     fingerprint(ders[0]),
+            'pem':             ssl.DER_cert_to_PEM_cert(ders[0]),
+            'subject':         cert.subject.rfc4514_string(),
+            'san':             san,
+            'issuer':          cert.issuer.rfc4514_string(),
+            'chain':           ''.join([ssl.DER_cert_to_PEM_cert(der) for der in ders[1:]]),
+            'not_valid_after': timegm(not_valid_after.timetuple())}
+
+if __name__ == '__main__': sys.exit(100)
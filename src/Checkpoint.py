@@ -0,0 +1,72 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB sweep checkpoints.
+
+The progress of the sweep of a network or a selection is a position: every address before it was swept.
+Positions are the integer form of the addresses, or their rank in a hit list. Shards are swept several at a
+time and end in any order, so the position only moves past a shard once all the shards before it are over.
+It’s saved in the `sweep` table with each batch of results (see SQLite.updateHosts), in the same transaction:
+a sweep resumed after an interruption never skips an address whose result was not stored."""
+import sys
+try:
+    from time import time
+    from collections import deque
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+class Checkpoint:
+    """Progress of the sweep of a network or a selection, known by its name."""
+
+    def __init__(self, name):
+
+        self.name     = name
+        self.position = None # From the start.
+        self.swept    = 0
+        self.total    = None
+        self.started  = int(time())
+        self.finished = None
+        self.span     = None
+        self.issued   = deque() # [last position, over], in the order the shards were started.
+        self.next     = None
+
+    def __repr__(self): return 'Checkpoint'
+
+    def resume(self, record):
+        """Go on from a `sweep` table record."""
+        self.position = int(record['position'])
+        self.swept    = record['swept']
+        self.started  = record['started']
+
+    def start(self, origin, span = None, total = None):
+        """Set the first position of a sweep, the function giving the (first, last) positions of a shard, and the number of
+           addresses to sweep from the start. Shards are counted from the position if there is no span function.
+           Return the position to sweep from: the origin, unless the sweep was resumed."""
+        if self.position is None: self.position = origin
+        self.span  = span
+        self.total = total
+        self.next  = self.position
+        return self.position
+
+    def issue(self, shard):
+        """Record that a shard is started. Return its entry, to be completed."""
+        if self.span: first, last = self.span(shard)
+        else: first, last = self.next, self.next + len(shard) - 1
+        self.next = last + 1
+        entry = [last, len(shard), False]
+        self.issued.append(entry)
+        return entry
+
+    def complete(self, entry):
+        """Record that the results of a shard were all read, and move the position past the shards which are all over."""
+        entry[2] = True
+        while self.issued and self.issued[0][2]:
+            last, size, _ = self.issued.popleft()
+            self.position = last + 1
+            self.swept += size
+
+    def finish(self): self.finished = int(time())
+
+if __name__ == '__main__': sys.exit(100)
@@ -16,12 +16,16 @@ class Configuration():
             print('Can’t load configuration, will be using default values! ({})'.format(str(e)),file=sys.stderr)
             self.configuration['log_file'] = '&1'
             self.configuration['ping_chunk_size'] = 32
+            self.configuration['ping'] = { 'rate': 1000, 'timeout': 2, 'window': 4096, 'dns_workers': 32, 'processes': 4, 'min_interval': 60, 'base_interval': 300, 'max_interval': 86400, 'reload_interval': 3600 }
             self.configuration['url'] = { 'chunk_size': 32, 'verify_ssl': 'False' }
             self.configuration['ssh'] = { 'chunk_size': 32, 'default_user': 'osmdb' }
-            self.configuration['snmp'] = { 'chunk_size': 32, 'community': 'public' }
+            self.configuration['snmp'] = { 'chunk_size': 32, 'community': 'public', 'timeout': 2, 'retries': 2 }
             self.configuration['icons'] = { 'host_up': '✓', 'host_down': '❌' }
             self.configuration['exec_timeout'] = 60
             self.configuration['db_file'] = './osmdb.db'
+            self.configuration['history'] = { 'raw_retention': 172800, 'retention': {'300': 2592000, '3600': 31536000, '86400': 315360000}, 'availability_window': 86400 }
+            self.configuration['metrics'] = { 'textfile': '', 'port': 0, 'address': '127.0.0.1' }
+            self.configuration['db'] = { 'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'mmap_size': 268435456, 'cache_size': -65536, 'temp_store': 'MEMORY', 'compression_level': 6, 'batch_size': 10000 }
 
         limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
         if  limit < self.configuration['ping_chunk_size']:
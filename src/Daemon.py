@@ -0,0 +1,160 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB daemon mode.
+
+Jobs are read from the `daemon` section of the configuration:
+
+    "daemon": {
+      "jobs": [
+        {"name": "scan",   "update": "hosts",      "network": "10.0.0.0/8", "resume": true, "interval": 3600},
+        {"name": "scan6",  "update": "hosts",      "network": "2001:db8::/32", "hitlist": "/etc/osmdb/hosts6", "interval": 3600},
+        {"name": "known",  "update": "known",      "interval": 300},
+        {"name": "web",    "update": "selection",  "tags": "web&!decommissioned", "interval": 60},
+        {"name": "snmp",   "update": "snmp",       "selection": "hostname LIKE \"sw%\"", "interval": 600},
+        {"name": "ifs",    "update": "snmp-table", "table": "IF-MIB::ifTable", "tags": "switch", "interval": 300},
+        {"name": "urls",   "update": "url",        "interval": 900},
+        {"name": "due",    "update": "due",        "interval": 30}
+      ]
+    }
+
+The sweeps of the hosts, known and selection jobs save their progress as they go: with `"resume": true`,
+a sweep interrupted by a restart goes on from where it stopped. The known and selection jobs ping the hosts
+by name: their address is looked up at each run, so a host whose address changed is still found.
+
+Metrics are served on http://<address>:<port>/metrics if the `metrics` section has a port, and written
+to its textfile, if any, after each job.
+"""
+import sys
+try:
+    import signal
+    from ProbeQueue import ProbeQueue
+    from OSMDB import getDefaultRoute
+    from time import time
+    import Logger
+    import Metrics
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+job_seconds = Metrics.registry.histogram('osmdb_job_seconds', 'Run time of the daemon jobs, by job.')
+
+class Job:
+    """A periodic update. It’s due every `interval` seconds, its first run being right at start."""
+
+    def __init__(self, spec):
+
+        self.spec      = spec
+        self.update    = spec['update']
+        self.name      = spec.get('name', self.update)
+        self.interval  = float(spec.get('interval', 300))
+        self.next_run  = 0
+        self.last_time = None
+
+    def __repr__(self): return self.name
+
+class Daemon:
+    """Run the configured jobs, one at a time, in a single long-lived process, so the database connection,
+       the probe engines and their caches are kept from one run to the next.
+       A job is never run again before its previous run is over: the runs it missed meanwhile are skipped.
+       SIGTERM (or SIGINT) stops the daemon once the running job is over, a sweep being stopped after its current shard:
+       its checkpoint has recorded the progress, and a job with `"resume": true` goes on from there at the next start."""
+
+    def __init__(self, osmdb, configuration, logger = Logger.Logger()):
+
+        self.osmdb = osmdb
+        self.configuration = configuration
+        self.logger = logger
+        default_daemon_configuration = {'jobs': [{'name': 'due', 'update': 'due', 'interval': 30}]}
+        self.configuration['daemon'] = self.configuration.get('daemon', default_daemon_configuration)
+        self.jobs = [Job(spec) for spec in self.configuration['daemon'].get('jobs', [])]
+        self.metrics = self.configuration.get('metrics', {'textfile': '', 'port': 0, 'address': '127.0.0.1'})
+        # The sweeps of OSMDB check the same event between their shards.
+        self.stopping = osmdb.stopping
+        self.queue = None
+
+    def __repr__(self): return 'Daemon'
+
+    def stop(self, signum, frame):
+
+        self.logger.log('Signal {} received, stopping once the running job or sweep shard is over.'.format(signum), 1)
+        self.stopping.set()
+
+    def hosts(self, job):
+        """Return the FQDN of the hosts selected by the `selection` and `tags` of a job."""
+        hosts = set()
+        if job.spec.get('selection'):
+            for host in self.osmdb.selectHosts(job.spec['selection']): hosts.add(host[1])
+        if job.spec.get('tags'):
+            for host in self.osmdb.selectHostsByTags(job.spec['tags']): hosts.add(host[0])
+        return list(hosts)
+
+    def selectionName(self, job):
+
+        return '|'.join([job.spec[key] for key in ['selection', 'tags'] if job.spec.get(key)]) or job.name
+
+    def run(self, job):
+        """Run a job once."""
+        # Parameters may have been changed by another process since the last run.
+        self.osmdb.db.parameters = {}
+        if job.update == 'hosts':
+            network = job.spec.get('network') or getDefaultRoute()
+            hitlist = job.spec.get('hitlist')
+            checkpoint = self.osmdb.checkpoint(network + (' ' + hitlist if hitlist else ''), job.spec.get('resume', False))
+            self.osmdb.updateHosts(self.osmdb.pingHosts(network, hitlist, checkpoint), network, checkpoint)
+        elif job.update == 'known':
+            hosts = [host[1] for host in self.osmdb.selectHosts('ip LIKE "%"')]
+            checkpoint = self.osmdb.checkpoint('ip LIKE "%"', job.spec.get('resume', False))
+            self.osmdb.updateHosts(self.osmdb.pingAddresses(hosts, checkpoint), 'ip LIKE "%"', checkpoint)
+        elif job.update == 'selection':
+            checkpoint = self.osmdb.checkpoint(self.selectionName(job), job.spec.get('resume', False))
+            self.osmdb.updateHosts(self.osmdb.pingAddresses(self.hosts(job), checkpoint), self.selectionName(job), checkpoint)
+        elif job.update == 'snmp':
+            responses = self.osmdb.getSNMP(self.hosts(job), [('SNMPv2-MIB', 'sysDescr'), ('SNMPv2-MIB', 'sysUpTime')])
+            self.osmdb.updateSNMP(responses, self.selectionName(job))
+        elif job.update == 'snmp-table':
+            self.osmdb.walkSNMP(self.hosts(job), job.spec['table'])
+        elif job.update == 'due':
+            # Only the hosts whose next check time has come are probed. The queue is reloaded
+            # from time to time to pick up the hosts other jobs added.
+            if not self.queue or time() - self.queue.loaded > float(self.configuration.get('ping', {}).get('reload_interval', 3600)):
+                self.queue = ProbeQueue(self.osmdb.db, self.logger)
+                self.queue.load()
+            self.osmdb.updateDue(self.queue)
+        elif job.update in ['url', 'urls']:
+            self.osmdb.updateURLs()
+        else: self.logger.log('Job {}: unknown update “{}”.'.format(job, job.update), 3)
+
+    def loop(self):
+        """Run the jobs as they get due, until SIGTERM or SIGINT is received."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        if not self.jobs:
+            self.logger.log('No job configured in the “daemon” section. Exiting.', 3)
+            return False
+        if int(self.metrics.get('port', 0)):
+            try:
+                Metrics.registry.serve(self.metrics['port'], self.metrics.get('address', '127.0.0.1'))
+                self.logger.log('Metrics served on http://{}:{}/metrics.'.format(self.metrics.get('address', '127.0.0.1'), self.metrics['port']), 1)
+            except OSError as e: self.logger.log('Can’t serve the metrics on port {}: {}'.format(self.metrics['port'], e), 4)
+        self.logger.log('Daemon started with {} jobs: {}.'.format(len(self.jobs), ', '.join(map(str, self.jobs))), 1)
+        while not self.stopping.is_set():
+            for job in sorted(self.jobs, key=lambda job: job.next_run):
+                if self.stopping.is_set() or job.next_run > time(): break
+                start = time()
+                try: self.run(job)
+                except Exception as e: self.logger.log('Job {} failed: {}: {}'.format(job, type(e).__name__, e), 4)
+                job.last_time = time() - start
+                job_seconds.observe(job.last_time, job=job.name)
+                try: Metrics.registry.writeTextfile(self.metrics.get('textfile'))
+                except OSError as e: self.logger.log('Can’t write the metrics to {}: {}'.format(self.metrics.get('textfile'), e), 3)
+                if not job.next_run: job.next_run = start
+                job.next_run = max(job.next_run + job.interval, time())
+                self.logger.log('Job {} done in {:.1f}s, next run in {:.0f}s.'.format(job, job.last_time, job.next_run - time()), 0)
+            self.stopping.wait(max(0, min([job.next_run for job in self.jobs]) - time()))
+        self.osmdb.close()
+        self.logger.log('Daemon stopped.', 1)
+        return True
+
+if __name__ == '__main__': sys.exit(100)
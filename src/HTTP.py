@@ -0,0 +1,139 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB HTTP checker"""
+import sys
+try:
+    from time import time
+    from copy import copy
+    import ssl
+    import json
+    import requests
+    from requests.adapters import HTTPAdapter
+    import urllib3
+    import Certificate
+    from Scheduler import Scheduler
+    import Logger
+    import Metrics
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+USER_AGENT = 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36'
+
+def peerCertificates(response):
+    """Return the DER certificates (the peer’s one first, then its chain when Python can tell it) of the TLS connection which served response."""
+    connection = getattr(response.raw, 'connection', None) or getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+    if not sock or not hasattr(sock, 'getpeercert'): return []
+    # Python ≥ 3.13 gives the chain sent by the peer.
+    if hasattr(sock, 'get_unverified_chain'):
+        chain = [cert if isinstance(cert, bytes) else cert.public_bytes(ssl.ENCODING_DER) for cert in sock.get_unverified_chain() or []]
+        if chain: return chain
+    cert = sock.getpeercert(binary_form=True)
+    return [cert] if cert else []
+
+def failed(task, reason):
+    """Scheduler fallback for a check which did not return."""
+    url = task.args[0]
+    url['check_time'] = int(task.start)
+    url['content'] = None
+    url['status'] = -1
+    url['not_modified'] = False
+    url['get_error'] = reason
+    url['total_time'] = time() - task.start
+    return url
+
+class HTTP:
+    """URL checker. Requests share a session whose connections are kept alive and pooled per host.
+       The certificate is read from the TLS connection which served the request, no other handshake is made."""
+
+    def __init__(self, configuration, logger = Logger.Logger()):
+
+        self.configuration = configuration
+        self.logger = logger
+        self.concurrency = int(self.configuration.get('chunk_size', 32))
+        self.timeout = float(self.configuration.get('request_timeout', 10))
+        self.verify = str(self.configuration.get('verify_ssl', 'False')) == 'True'
+        self.certificates = {} # Expiry times of the known certificates, by fingerprint.
+        self.session = requests.Session()
+        # Every thread of the checker may be on the same host: a pool smaller than that would
+        # drop the connections it can’t keep, and open new ones on the next requests.
+        adapter = HTTPAdapter(pool_connections=int(self.configuration.get('pools', 256)),
+                              pool_maxsize=max(self.concurrency, int(self.configuration.get('connections_per_host', 8))))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+        if not self.verify: urllib3.disable_warnings()
+
+    def __repr__(self): return 'HTTP'
+
+    def close(self): self.session.close()
+
+    def get(self, url):
+        """Check an URL.URL object and fill in its status, times, headers, content, certificate and error. An updated copy is returned.
+           The certificate is a record to add to the database (see Certificate.record), or None if its fingerprint is already known.
+           The request is conditional if the headers of the last check have validators. If the page was not modified, the content
+           is None and the status is 200, not_modified telling the answer was a 304. Header names are stored in lower case."""
+        url = copy(url)
+        if not url['port']: url['port'] = '443'
+        url['check_time'] = int(time())
+        start = time()
+        certificates = []
+        def capture(response, *args, **kwargs):
+            # Called before the body is read, while the connection is still attached to the response.
+            # Only the first response is looked at: redirections may lead to other hosts.
+            if not certificates: certificates.append(peerCertificates(response))
+        try: headers = {name.lower(): value for name, value in json.loads(url['headers'] or '{}').items()}
+        except (ValueError, AttributeError): headers = {}
+        # Validators of the last response: the page is only sent again if it changed.
+        conditions = {}
+        if url.get('digest') and 'etag' in headers: conditions['If-None-Match'] = headers['etag']
+        if url.get('digest') and 'last-modified' in headers: conditions['If-Modified-Since'] = headers['last-modified']
+        url['not_modified'] = False
+        try:
+            if url['user']: auth = (url['user'], url['password'])
+            else: auth = None
+            res = self.session.get(str(url), auth=auth, headers=conditions, verify=self.verify, allow_redirects=True, timeout=self.timeout, hooks={'response': capture})
+            # A 304 only answers a request made with the validators of a 200: the page is still there, unchanged.
+            if res.status_code == 304:
+                url['content'] = None
+                url['not_modified'] = True
+                headers.update((name.lower(), value) for name, value in res.headers.items())
+                url['status']  = 200
+            else:
+                url['content'] = res.text
+                headers = {name.lower(): value for name, value in res.headers.items()}
+                url['status']  = res.status_code
+            url['headers'] = json.dumps(headers)
+            url['get_error']  = ''
+            url['response_time'] = res.elapsed.total_seconds()
+            Metrics.probe_seconds.observe(time() - start, probe='url')
+        except Exception as e:
+            if isinstance(e, requests.Timeout): Metrics.probe_timeouts.inc(probe='url')
+            else: Metrics.probe_errors.inc(probe='url')
+            self.logger.log('{}: {}'.format(url, e), 3)
+            url['content'] = None
+            url['status']  = -1
+            url['get_error'] = str(e)
+        url['certificate'] = None
+        if certificates and certificates[0]:
+            # Known certificates are not parsed again.
+            url['fingerprint'] = Certificate.fingerprint(certificates[0][0])
+            if url['fingerprint'] in self.certificates: url['expire'] = self.certificates[url['fingerprint']]
+            else:
+                try:
+                    url['certificate'] = Certificate.record(certificates[0])
+                    url['expire'] = self.certificates[url['fingerprint']] = url['certificate']['not_valid_after']
+                except ValueError as e: self.logger.log('{}: {}'.format(url, e), 3)
+        url['total_time'] = time() - start
+        return url
+
+    def check(self, urls, timeout = 60):
+        """Check URLs concurrently. Yield each URL.URL object as soon as it’s checked."""
+        scheduler = Scheduler(self.concurrency, timeout, self.logger, threads=True, name='url')
+        for url in urls: scheduler.submit(self.get, (url,), key=url, fallback=failed)
+        for _, url in scheduler.run(): yield url
+
+if __name__ == '__main__': sys.exit(100)
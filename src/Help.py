@@ -8,7 +8,8 @@ def helpAndExit(this):
     if this   == 'execute':            print("""Usage: {name} --execute <command> [--selection <hosts selection query>]
  {name} --execute <command> [--tags <hosts tag selection>]""".format(name=name), file=sys.stderr)
     elif this == 'selection':          print('Usage: {} --selection <hosts selection query>'.format(name), file=sys.stderr)
-    elif this == 'selection-by-tag':   print('Usage: {} --tags <tag query>'.format(name), file=sys.stderr)
+    elif this == 'selection-by-tag':   print("""Usage: {} --tags <tag query>
+A tag query combines tags with & (and), | (or), ! (not) and parentheses, e.g. 'linux&(web|db)&!old'""".format(name), file=sys.stderr)
     elif this == 'add':                print('Usage: {} --add <object type> <object 1> [<object 2> …]\nValid object types are: host, url'.format(name), file=sys.stderr)
     elif this == 'add-all':            print("""Usage:\n {} --add host <hostname|address> [<hostname|address> …]
  {} --add url <URL> [<URL> …]""".format(name,name), file=sys.stderr)
@@ -18,7 +19,10 @@ def helpAndExit(this):
  {} --delete tag <tag> --selection <hosts selection query>""".format(name,name,name,name), file=sys.stderr)
     elif this == 'add-url':            print("""Usage:\n {} --add url <URL> [<URL> …]""".format(name,name), file=sys.stderr)
     elif this == 'add-host':           print("""Usage:\n {} --add host <hostname|address> [<hostname|address> …]""".format(name,name), file=sys.stderr)
-    elif this == 'list':               print('Usage: {} --list <object type>\nValid object types are: host, execution, url, update'.format(name), file=sys.stderr)
+    elif this == 'list':               print('''Usage: {} --list <object type> [--limit <rows>] [--offset <rows>] [--after <key>] [--format text|json|csv|tsv]
+Valid object types are: host, execution, url, update, rates, changes, certs, history, sweeps
+Hosts, executions and updates are paged: when a page is full, the --after key of the next one is printed on stderr.'''.format(name), file=sys.stderr)
+    elif this == 'list-certs':         print('Usage: {} --list certs [--expiring <days>]'.format(name), file=sys.stderr)
     elif this == 'delete-url':         print('Usage: {} --delete url <URLs selection query>'.format(name), file=sys.stderr)
     elif this == 'delete-host':        print("""Usage:\n {} --delete host <FQDN> [<FQDN> …]
  {} --delete host --selection <hosts selection query>""".format(name,name,name), file=sys.stderr)
@@ -27,6 +31,8 @@ def helpAndExit(this):
  {} --set-tag <tag> --selection <hosts selection query> --tags <tag query> [--description <description>]""".format(name,name), file=sys.stderr)
     elif this == 'set-param':          print("""Usage: {} --set-param <hostname|domain|*> <param>=<value>""".format(name), file=sys.stderr)
     elif this == 'get-param':          print("""Usage: {} --get-param <parameter> <hostname|domain>""".format(name), file=sys.stderr)
+    elif this == 'snmp-table':         print("""Usage: {name} --update/-u snmp-table <MIB::table> --selection/-s <hosts selection query>
+ {name} --update/-u snmp-table <MIB::table> --tags/-t <tag query>""".format(name=name), file=sys.stderr)
     elif this == 'deploy':             print("""Usage: {name} --deploy/-d <hosts selection query>""".format(name=name), file=sys.stderr)
     sys.exit(99)
 
@@ -39,9 +45,14 @@ def GeneralHelp():
 The Overly Simple Management Database
 
 Scan network for hosts:       {name} --update/-u host [--network/-n <network range>]
+Scan IPv6 prefix for hosts:   {name} --update/-u host --network/-n <IPv6 prefix> --hitlist <file of addresses|->
+Resume an interrupted scan:   {name} --update/-u host [--network/-n <network range>] --resume
 Update known hosts:           {name} --update/-u
+Update hosts due for a check: {name} --update/-u due
 Update known URLs:            {name} --update/-u url
+Run periodic updates:         {name} --daemon
 Update host selection:        {name} --update/-u selection <hosts selection query>
+Walk SNMP table on selection: {name} --update/-u snmp-table <MIB::table> --selection/-s <hosts selection query>
 List hosts using SQL:         {name} --selection/-s <hosts selection query>
 List hosts using tags:        {name} --tags/-t <tag query>
 Add host(s) in database:      {name} --add/-A host <hostname|address> [<hostname|address> …]
@@ -54,6 +65,11 @@ Remove tag from host(s):      {name} --delete/-D tag <tag> <hosts selection quer
 Execute command on host(s):   {name} --execute/-e <commande> --selection/-s <hosts selection query>
 List last updates             {name} --list/-l update
 List last executions:         {name} --list/-l execution
+List a page, as JSON/CSV/TSV: {name} --list/-l execution --limit <rows> [--offset <rows>|--after <key>] [--format json|csv|tsv]
+List SNMP counter rates:      {name} --list/-l rates [<column>]
+List URL content changes:     {name} --list/-l changes
+List history over a window:   {name} --list/-l history [ping|uptime|url] [<window, e.g. 24h, 7d>]
+List expiring certificates:   {name} --list/-l certs [--expiring/-E <days>]
 Set parameter for host(s):    {name} --set-param/-X <hostname|domain|*> <param>=<value>
 Get parameters for host:      {name} --get-param/-x <parameter> <hostname|domain>
 Deploy on host(s):            {name} --deploy/-d <hosts selection query>
@@ -1,24 +1,51 @@
 # pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
 # -*- coding: UTF-8 -*-
+import os
 import sys
 import time
 import socket
 import random
 import struct
 import select
+from array import array
 from itertools import zip_longest
+import Metrics
 
-def chk(data):
+def csum(data):
+    """Return the unfolded sum of the 16-bit words of data, in native byte order.
+       Partial sums may be added together and folded later with fold()."""
+    if len(data) % 2: data += b'\0'
+    return sum(array('H', data))
 
-    x = sum(x << 8 if i % 2 else x for i, x in enumerate(data)) & 0xFFFFFFFF
+def fold(x):
+    """Fold a sum returned by csum() into an Internet checksum."""
     x = (x >> 16) + (x & 0xFFFF)
     x = (x >> 16) + (x & 0xFFFF)
-    return struct.pack('<H', ~x & 0xFFFF)
+    return struct.pack('=H', ~x & 0xFFFF)
+
+def chk(data): return fold(csum(data))
+
+def pingGroupAllowed():
+    """Tell if one of our groups is in the range allowed to open unprivileged ICMP sockets (sysctl net.ipv4.ping_group_range)."""
+    try:
+        with open('/proc/sys/net/ipv4/ping_group_range') as f: low, high = map(int, f.read().split())
+    except (OSError, ValueError): return False
+    return any(low <= gid <= high for gid in [os.getgid()] + os.getgroups())
+
+def icmpSocket(family = socket.AF_INET):
+    """Return a couple (socket, raw). A raw ICMP (or ICMPv6) socket is used when allowed, else a Linux datagram ICMP socket.
+       With the latter the kernel sets the identifier of echo requests and only hands us our own replies, without IP header.
+       PermissionError is raised if neither is allowed."""
+    proto = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+    try: return (socket.socket(family, socket.SOCK_RAW, proto), True)
+    except PermissionError:
+        return (socket.socket(family, socket.SOCK_DGRAM, proto), False)
 
 def ping(addr, timeout=5, number=1, data=b''):
     """ICMP ping."""
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP) as conn:
+        conn, raw = icmpSocket()
+        with conn:
             payload = struct.pack('!HH', random.randrange(0, 65536), number) + data
 
             conn.connect((addr, 80))
@@ -26,9 +53,13 @@ def ping(addr, timeout=5, number=1, data=b''):
             start = time.time()
             while select.select([conn], [], [], max(0, start + timeout - time.time()))[0]:
                 data = conn.recv(65536)
-                if len(data) < 20 or len(data) < struct.unpack_from('!xxH', data)[0]:
-                    continue
-                if data[20:] == b'\0\0' + chk(b'\0\0\0\0' + payload) + payload:
+                if raw:
+                    if len(data) < 20 or len(data) < struct.unpack_from('!xxH', data)[0]:
+                        continue
+                    if data[20:] == b'\0\0' + chk(b'\0\0\0\0' + payload) + payload:
+                        return time.time() - start
+                # The identifier was set by the kernel, only compare the sequence and the data.
+                elif data[:1] == b'\0' and data[6:] == payload[2:]:
                     return time.time() - start
             return -1
     except PermissionError as e: return tcp_connect(addr)
@@ -51,6 +82,25 @@ def tcp_connect(addr, port = 22, timeout = 10):
     
     return time.time() - start
 
+def resolve(address):
+    """Return the couple (hostname, fqdn) of an address. Both are the address itself if it has no reverse record."""
+    address = str(address)
+    try:
+        with Metrics.dns_seconds.time(kind='reverse'):
+            hostname = socket.gethostbyaddr(address)[0]
+            return (hostname, socket.getfqdn(hostname).lower())
+    except (socket.herror, socket.gaierror, OSError): return (address, address)
+
+def lookup(name):
+    """Return the address of a host name, the name itself if it’s an address, None if it can’t be resolved."""
+    name = str(name)
+    for family in [socket.AF_INET, socket.AF_INET6]:
+        try: return socket.inet_ntop(family, socket.inet_pton(family, name))
+        except OSError: pass
+    try:
+        with Metrics.dns_seconds.time(kind='forward'): return socket.gethostbyname(name)
+    except (OSError, UnicodeError): return None
+
 class Host:
 
     def __init__(self, host = None):
@@ -71,17 +121,13 @@ class Host:
             except IndexError: pass
             try:
                 self.user = host[13]
+                self.key_file = host[14]
             except IndexError: pass
             
     def process(self, address, queue):
     
         self.address = str(address)
-        try:
-            self.hostname = socket.gethostbyaddr(self.address)[0]
-            self.fqdn = socket.getfqdn(self.hostname).lower()
-        except (socket.herror, socket.gaierror):
-            self.hostname = self.address
-            self.fqdn = self.address
+        try: self.hostname, self.fqdn = resolve(self.address)
         finally:
             queue.put((self.hostname,self.fqdn,self.ping(),self.address))
 
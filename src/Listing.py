@@ -0,0 +1,71 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB listing output: plain text, JSON, CSV or TSV, written row by row."""
+import sys
+import csv
+import json
+
+formats = ['text', 'json', 'csv', 'tsv']
+
+def options(cmdline):
+    """Return the listing options of the command line: limit, offset, after (the key of the last row of the previous page) and format."""
+    listing = {'limit': None, 'offset': 0, 'after': None, 'format': 'text'}
+    try:
+        if cmdline.option('limit') not in [True, False]: listing['limit'] = max(0, int(cmdline.option('limit')))
+        if cmdline.option('offset') not in [True, False]: listing['offset'] = max(0, int(cmdline.option('offset')))
+        if cmdline.option('after') not in [True, False]: listing['after'] = json.loads(cmdline.option('after'))
+    except ValueError as e: raise ValueError('Invalid listing option: {}'.format(e))
+    if listing['after'] is not None and not isKey(listing['after']):
+        raise ValueError('Invalid listing option: --after expects the [order, id] key of a row, as printed after a page, not “{}”.'.format(cmdline.option('after')))
+    if cmdline.option('format') not in [True, False]:
+        if cmdline.option('format') not in formats: raise ValueError('Unknown format “{}”, expected one of: {}.'.format(cmdline.option('format'), ', '.join(formats)))
+        listing['format'] = cmdline.option('format')
+    return listing
+
+def record(row):
+    """Return a listed row (a sqlite3.Row or a dictionary) as a dictionary, without its key columns."""
+    return {name: row[name] for name in row.keys() if not name.startswith('_')}
+
+def key(row):
+    """Return the key of a listed row: its `_order` and `_id` columns."""
+    return [row['_order'], row['_id']]
+
+def isKey(value):
+    """Tell if a decoded --after argument is the key of a row: a list of its order (a number, a text or null) and its integer id."""
+    return (isinstance(value, list) and len(value) == 2 and (value[0] is None or isinstance(value[0], (int, float, str)))
+            and isinstance(value[1], int) and not any(isinstance(item, bool) for item in value))
+
+def encodeKey(key):
+    """Return the --after argument to get the page following a row having key."""
+    return json.dumps(list(key))
+
+class Writer:
+    """Write listed rows to a file as soon as they come. Rows are dictionaries; the text format prints their given text instead."""
+
+    def __init__(self, format = 'text', file = None):
+
+        self.format = format
+        self.file = file or sys.stdout
+        self.writer = None
+        self.count = 0
+
+    def __repr__(self): return 'Writer'
+
+    def write(self, row, text = None):
+
+        if self.format == 'json':
+            self.file.write(('[\n' if self.count == 0 else ',\n') + json.dumps(row, default=str))
+        elif self.format in ['csv', 'tsv']:
+            if not self.writer:
+                self.writer = csv.DictWriter(self.file, fieldnames=list(row.keys()), delimiter=',' if self.format == 'csv' else '\t', extrasaction='ignore')
+                self.writer.writeheader()
+            self.writer.writerow(row)
+        else: print(text if text is not None else row, file=self.file)
+        self.count += 1
+
+    def close(self):
+
+        if self.format == 'json': self.file.write('[]\n' if self.count == 0 else '\n]\n')
+        self.file.flush()
+
+if __name__ == '__main__': sys.exit(100)
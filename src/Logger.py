@@ -2,42 +2,152 @@
 # -*- coding: UTF-8 -*-
 """OSMDB Logger."""
 import sys
-from time import strftime
-from inspect import currentframe
+import os
+import json
+import atexit
+from time import time, strftime, localtime
+from threading import Thread, Lock, Event
+from collections import deque
+
+# Records a child process writes at once are never interleaved with those of another one.
+PIPE_BUF = 4096
+# Records waiting to be written before the writer thread is woken up early.
+BACKLOG = 16384
+
 class Logger:
-    """Log messages."""
+    """Log messages. Messages under the level are dropped before anything is done with them.
+       The others are queued, then formatted and written in batches by a background thread, a few times a second: log() never waits for the disk.
+       Child processes forked after share() send their records to that thread through a pipe rather than writing to the file themselves.
+       When the log file is the standard output or error, records are written as they come instead: what the command line prints
+       there (the listings, on stdout) must come in the order it was printed, with the records in between."""
     def __init__(self):
         self.logfile  = sys.stderr
+        self.synchronous = True
         self.log_time = False
         self.level = 0
+        self.pid = os.getpid()
+        self.records = deque()
+        self.lock = Lock()
+        self.wake = Event()
+        self.writer = None
+        self.pipe = None
+        self.second = None
+        self.timestamp = ''
 
     def __del__(self): self.logfile.close()
 
+    def __getstate__(self):
+        # Only the settings go to a child process: it sends its records to the parent if the pipe was shared, else writes them itself.
+        return {'log_time': self.log_time, 'level': self.level, 'pid': self.pid, 'pipe': self.pipe}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.__dict__.update(state)
+
     def log(self, message, level = 0, f = None):
         """Write a message to the logger’s output if its criticity is over the chosen level."""
-        prefix = ''
-        try: info = '{}|{}'.format(str(level),str(currentframe().f_back.f_locals['self']))
-        except KeyError: info = '{}|{}'.format(str(level),'')
-        if self.log_time: prefix = '{} {:12s} '.format(strftime("%Y-%m-%d %H:%M:%S"),info)
-        if level >= self.level:
-            if f: print(prefix+str(message), file=f)
-            else: print(prefix+str(message), file=self.logfile)
-        self.flush()
+        if level < self.level: return
+        caller = ''
+        if self.log_time:
+            try: caller = str(sys._getframe(1).f_locals['self'])
+            except KeyError: pass
+        record = (time(), level, caller, str(message))
+        if f:
+            self.flush()
+            print(self.format(record), end='', file=f)
+        elif os.getpid() != self.pid: self.send(record)
+        elif self.synchronous:
+            self.records.append(record)
+            self.drain()
+        else:
+            if not self.writer: self.start()
+            self.records.append(record)
+            if len(self.records) > BACKLOG: self.wake.set()
+
+    def format(self, record):
+        """Return the line of a record."""
+        when, level, caller, message = record
+        if not self.log_time: return message+'\n'
+        # The time stamp changes once a second at most.
+        if int(when) != self.second: self.second, self.timestamp = int(when), strftime("%Y-%m-%d %H:%M:%S", localtime(when))
+        return '{} {:12s} {}\n'.format(self.timestamp, '{}|{}'.format(level, caller), message)
+
+    def start(self):
+        """Start the writer thread."""
+        with self.lock:
+            if self.writer: return
+            self.writer = Thread(target=self.write, daemon=True)
+            self.writer.start()
+            atexit.register(self.flush)
+
+    def write(self):
+        """Writer thread."""
+        while True:
+            self.wake.wait(0.2)
+            self.wake.clear()
+            self.drain()
+
+    def drain(self):
+        """Write the queued records at once, then flush the file."""
+        with self.lock:
+            records = []
+            try:
+                while True: records.append(self.records.popleft())
+            except IndexError: pass
+            if not records: return
+            try:
+                self.logfile.write(''.join(map(self.format, records)))
+                self.logfile.flush()
+            except (OSError, ValueError): pass
+
+    def share(self):
+        """Open the pipe through which the child processes forked from now on send their records."""
+        with self.lock:
+            if self.pipe: return
+            reader, self.pipe = os.pipe()
+        Thread(target=self.collect, args=(reader,), daemon=True).start()
+
+    def send(self, record):
+        """Send a record of a child process to its parent, or write it if there is no pipe."""
+        if not self.pipe:
+            print(self.format(record), end='', file=self.logfile, flush=True)
+            return
+        data = (json.dumps(record) + '\n').encode('utf-8')
+        # A write of at most PIPE_BUF bytes to a pipe is atomic.
+        if len(data) > PIPE_BUF: data = (json.dumps(record[:3] + (record[3][:PIPE_BUF // 8] + '…',)) + '\n').encode('utf-8')
+        try: os.write(self.pipe, data)
+        except OSError: pass
+
+    def collect(self, reader):
+        """Collector thread: queue the records received from the child processes."""
+        if not self.writer: self.start()
+        with os.fdopen(reader, 'r', encoding='utf-8') as lines:
+            for line in lines:
+                try: self.records.append(tuple(json.loads(line)))
+                except ValueError: continue
+                if self.synchronous: self.drain()
 
     def setLogfile(self, filename):
         """Set Logger log file."""
+        self.flush()
         if filename == '&1': self.logfile = sys.stdout
         elif filename == '&2': self.logfile = sys.stderr
         else: self.logfile = open(filename,'a')
+        self.synchronous = filename in ['&1', '&2']
 
     def setLogLevel(self, level):
         """Set Logger minimum log level."""
         self.level = level
-        
-    def flush(self): self.logfile.flush()
+
+    def flush(self):
+        """Write the queued records now."""
+        if os.getpid() == self.pid: self.drain()
+        try: self.logfile.flush()
+        except (OSError, ValueError): pass
 
     def purge(self):
         """Purge logs."""
+        self.flush()
         self.logfile.seek(0)
         self.logfile.truncate()
 
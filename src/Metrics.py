@@ -0,0 +1,223 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB metrics: counters, gauges and histograms, exported in the Prometheus text format,
+   to a node_exporter textfile or from a local HTTP endpoint.
+
+Metrics recorded in the child processes of a Scheduler are sent back with their results and added to the parent’s."""
+import sys
+try:
+    import os
+    from time import time
+    from functools import wraps
+    from contextlib import contextmanager
+    from threading import Lock, Thread
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def labelKey(labels): return tuple(sorted(labels.items()))
+
+def formatLabels(key, extra = ()):
+
+    labels = list(key) + list(extra)
+    if not labels: return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in labels) + '}'
+
+class Metric:
+    """A metric and its values, by label set."""
+    kind = 'untyped'
+
+    def __init__(self, name, help, lock):
+
+        self.name = name
+        self.help = help
+        self.lock = lock
+        self.values = {}
+
+    def __repr__(self): return self.name
+
+    def header(self): return '# HELP {} {}\n# TYPE {} {}\n'.format(self.name, self.help, self.name, self.kind)
+
+class Counter(Metric):
+    """A count which only goes up."""
+    kind = 'counter'
+
+    def inc(self, value = 1, **labels):
+
+        key = labelKey(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + value
+
+    def merge(self, values):
+
+        for key, value in values.items(): self.values[key] = self.values.get(key, 0) + value
+
+    def text(self): return ''.join('{}{} {}\n'.format(self.name, formatLabels(key), value) for key, value in self.values.items())
+
+class Gauge(Metric):
+    """A value which goes up and down. Gauges of the child processes are not sent back."""
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+
+        with self.lock: self.values[labelKey(labels)] = value
+
+    def inc(self, value = 1, **labels):
+
+        key = labelKey(labels)
+        with self.lock: self.values[key] = self.values.get(key, 0) + value
+
+    def dec(self, value = 1, **labels): self.inc(-value, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the block as in flight while it runs."""
+        self.inc(**labels)
+        try: yield
+        finally: self.dec(**labels)
+
+    def merge(self, values): pass
+
+    def text(self): return ''.join('{}{} {}\n'.format(self.name, formatLabels(key), value) for key, value in self.values.items())
+
+class Histogram(Metric):
+    """Distribution of observed values (durations, in seconds), in cumulative buckets."""
+    kind = 'histogram'
+
+    def __init__(self, name, help, lock, buckets = BUCKETS):
+
+        super().__init__(name, help, lock)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+
+        key = labelKey(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None: counts = self.values[key] = [0] * (len(self.buckets) + 2) # buckets, count, sum
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block."""
+        start = time()
+        try: yield
+        finally: self.observe(time() - start, **labels)
+
+    def merge(self, values):
+
+        for key, counts in values.items():
+            mine = self.values.setdefault(key, [0] * len(counts))
+            for index, count in enumerate(counts): mine[index] += count
+
+    def text(self):
+
+        lines = []
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('{}_bucket{} {}\n'.format(self.name, formatLabels(key, [('le', bound)]), cumulative))
+            lines.append('{}_bucket{} {}\n'.format(self.name, formatLabels(key, [('le', '+Inf')]), counts[-2]))
+            lines.append('{}_sum{} {}\n'.format(self.name, formatLabels(key), counts[-1]))
+            lines.append('{}_count{} {}\n'.format(self.name, formatLabels(key), counts[-2]))
+        return ''.join(lines)
+
+class Registry:
+    """The metrics of a process."""
+
+    def __init__(self):
+
+        self.lock = Lock()
+        self.metrics = {}
+        self.server = None
+
+    def __repr__(self): return 'Metrics'
+
+    def add(self, metric):
+
+        with self.lock: return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help): return self.add(Counter(name, help, self.lock))
+
+    def gauge(self, name, help): return self.add(Gauge(name, help, self.lock))
+
+    def histogram(self, name, help, buckets = BUCKETS): return self.add(Histogram(name, help, self.lock, buckets))
+
+    def reset(self):
+        """Forget all the values, as a child process does when it starts."""
+        with self.lock:
+            for metric in self.metrics.values(): metric.values = {}
+
+    def snapshot(self):
+        """Return the values of the counters and histograms, to be merged in another process."""
+        with self.lock: return {name: dict(metric.values) for name, metric in self.metrics.items() if metric.kind != 'gauge' and metric.values}
+
+    def merge(self, snapshot):
+        """Add the values of a snapshot taken in another process."""
+        with self.lock:
+            for name, values in (snapshot or {}).items():
+                if name in self.metrics: self.metrics[name].merge(values)
+
+    def text(self):
+        """Return the metrics in the Prometheus text format."""
+        with self.lock: return ''.join(metric.header() + metric.text() for metric in self.metrics.values() if metric.values)
+
+    def writeTextfile(self, filename):
+        """Write the metrics to a file of the node_exporter textfile collector. The file is replaced at once, never read half written."""
+        if not filename: return
+        temporary = '{}.{}.tmp'.format(filename, os.getpid())
+        with open(temporary, 'w') as f: f.write(self.text())
+        os.replace(temporary, filename)
+
+    def serve(self, port, address = '127.0.0.1'):
+        """Serve the metrics over HTTP, on /metrics, from a background thread."""
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+        registry = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = registry.text().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, format, *args): pass
+        self.server = ThreadingHTTPServer((address, int(port)), Handler)
+        self.server.daemon_threads = True
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+registry = Registry()
+
+def timed(histogram, **labels):
+    """Decorator observing the duration of each call of a function."""
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels): return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# The metrics of OSMDB. Probes are labelled ping, snmp, url or ssh.
+probe_seconds      = registry.histogram('osmdb_probe_seconds', 'Round trip time of the probes which got an answer, by probe.')
+probe_timeouts     = registry.counter('osmdb_probe_timeouts_total', 'Probes which got no answer in time, by probe.')
+probe_errors       = registry.counter('osmdb_probe_errors_total', 'Probes which failed otherwise, by probe.')
+dns_seconds        = registry.histogram('osmdb_dns_seconds', 'Name resolution time, by kind (reverse or forward).')
+queue_wait_seconds = registry.histogram('osmdb_queue_wait_seconds', 'Time the tasks of a scheduler waited for a free slot, by scheduler.')
+in_flight          = registry.gauge('osmdb_in_flight', 'Probes or tasks in flight, by probe.')
+sql_seconds        = registry.histogram('osmdb_sql_seconds', 'Time spent in each method of the SQLite backend.')
+commit_seconds     = registry.histogram('osmdb_commit_seconds', 'Database commit time.')
+
+if __name__ == '__main__': sys.exit(100)
@@ -3,19 +3,20 @@
 """OSMDB"""
 import sys
 try:
-    import ipaddress
-    import subprocess
+    import os
     import Host, Logger
-    import socket, requests
-    from multiprocessing import Process, Queue
+    import socket
     from datetime import timedelta, datetime
     from time import time
-    import ssl
     import re
-    from cryptography import x509
-    from cryptography.hazmat.backends import default_backend
-    import Host, SSHClient, Execution, URL
-    from SNMP import getSNMP
+    from itertools import islice
+    from threading import Event
+    import Host, Execution, URL, Listing, Addresses
+    from Checkpoint import Checkpoint
+    from SQLite import humanTime
+    from Sweep import Sweep
+    from ProbeQueue import ProbeQueue
+    import Metrics
     from time import sleep
 
 except ImportError as e:
@@ -25,48 +26,28 @@ except ImportError as e:
 
 def getDefaultRoute(): 
     """Call the external command `ip route`. This only works with Linux. The default route is used if no network is given in the command line (--network)."""
+    import subprocess
     return str(subprocess.check_output(['ip','route'], universal_newlines=True).splitlines()[1]).split(' ')[0]
 
 def chunks(l, n):
-    """Yield successive n-sized chunks from l."""
-    for i in range(0, len(l), n): yield l[i:i + n]
+    """Yield successive n-sized chunks from l, which may be any iterable: it’s read one chunk at a time."""
+    l = iter(l)
+    chunk = list(islice(l, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(l, n))
 
 def lprint(l):
-    if type(l) is not list: l = list(l)
     for i in l: print(i)
 
 
-def GetURL(url, q = Queue(), verify = False):
-    """`url` is an URL.URL object. An URL.URL object is also both put in queue q and returned."""
-    # TODO : 
-    #  - make the use of user/password directly in URL optional
-    #  - make the SSL validity verification optional
-    if not url['port']: url['port'] = '443'
-    url['check_time'] = int(time())
-    start = time()
+def parseDuration(text, default = 86400):
+    """Return the number of seconds of a duration like “90”, “30m”, “24h”, “7d” or “2w”."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
     try:
-        #print('Processing {} …'.format(url),file=sys.stderr)
-        ssl_cert = ssl.get_server_certificate((url['host'], int(url['port'])), ca_certs=None)
-        #print('SSL cert for {} is {}'.format(url,ssl_cert),file=sys.stderr)
-        url['certificate'] = ssl_cert
-        cert = x509.load_pem_x509_certificate(bytes(ssl_cert,'utf-8'), default_backend())
-        url['expire'] = cert.not_valid_after.strftime('%s')
-        headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_6) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/61.0.3163.100 Safari/537.36'}
-        res = requests.get(str(url), headers=headers, auth=(url['user'],url['password']), verify=verify, allow_redirects=True, timeout=10)
-        url['content'] = res.text
-        url['status']  = res.status_code
-        url['get_error']  = ''
-        url['response_time'] = res.elapsed.total_seconds()
-    except Exception as e:
-        print(str(e),file=sys.stderr)
-        url['content'] = ''
-        url['status']  = -1
-        url['get_error'] = str(e)
-    finally:
-        end = time()
-        url['total_time'] = end - start
-        q.put(url)
-        return url
+        if text[-1] in units: return float(text[:-1]) * units[text[-1]]
+        return float(text)
+    except (TypeError, ValueError, IndexError): return default
 
 valid_chars = re.compile('^[a-zA-Z0-9.\-]{1,128}$')
 def isValidObjectName(name):
@@ -83,84 +64,190 @@ class OSMDB:
         self.configuration = configuration
         self.logger = logger
         self.configuration['ping_chunk_size'] = self.configuration.get('ping_chunk_size', 32)
+        default_ping_configuration = {
+            'rate': 1000,
+            'timeout': 2,
+            'window': 4096,
+            'dns_workers': 32,
+            'processes': 4,
+            'min_interval': 60,
+            'base_interval': 300,
+            'max_interval': 86400,
+            'reload_interval': 3600
+        }
+        self.configuration['ping'] = self.configuration.get('ping', default_ping_configuration)
         default_url_configuration = {
             'chunk_size': 2,
             'verify_ssl': 'False'
         }
         self.configuration['url'] = self.configuration.get('url', default_url_configuration)
+        self.snmp = None
+        self.http = None
+        # Set to stop the sweeps after the shard being read (see pingShards).
+        self.stopping = Event()
         
     def __repr__(self): return 'OSMDB'
+
+    def close(self):
+        """Release the probe engines and the database connection."""
+        if self.snmp: self.snmp.close()
+        if self.http: self.http.close()
+        if getattr(self, 'ssh', None): self.ssh.close()
+        self.db.close()
     
-    def pingAddr(self, addresses):
-        
-        hosts = []
-        remaining = len(addresses)
-        queue = Queue(remaining)
-        self.logger.log('Processing {} addresses in batches of {}.'.format(remaining, str(self.configuration['ping_chunk_size'])), 0)
+    def sweep(self, addresses):
+        """Ping a shard of addresses from its own socket and resolve their names in the meantime.
+           Host names are resolved to their address first: a name which can’t be is down.
+           Return a list of (hostname, fqdn, ping_delay, address) tuples."""
+        from concurrent.futures import ThreadPoolExecutor
+        conf = self.configuration['ping']
+        rate = max(1, int(conf['rate']) // int(conf['processes']))
+        sweep = Sweep(rate, conf['timeout'], conf['window'], self.logger)
+        try:
+            with ThreadPoolExecutor(max_workers=int(conf['dns_workers'])) as dns:
+                hosts = []
+                # A block only holds addresses, other shards may hold names.
+                if isinstance(addresses, Addresses.Block): targets = {}
+                else:
+                    targets = dict(zip(addresses, dns.map(Host.lookup, addresses)))
+                    for name in [name for name, address in targets.items() if not address]:
+                        self.logger.log('{}: can’t resolve the name.'.format(name), 0)
+                        Metrics.probe_errors.inc(probe='ping')
+                        hosts.append((dns.submit(Host.resolve, name), -1, name))
+                    addresses = [(name, address) for name, address in targets.items() if address]
+                for name, delay in sweep.run(addresses):
+                    if delay == -1: Metrics.probe_timeouts.inc(probe='ping')
+                    else: Metrics.probe_seconds.observe(delay, probe='ping')
+                    address = targets.get(name, name)
+                    hosts.append((dns.submit(Host.resolve, address), delay, address))
+                return [resolution.result() + (delay, address) for resolution, delay, address in hosts]
+        except PermissionError as e:
+            self.logger.log('Can’t open an ICMP socket: {}'.format(e), 5)
+            return []
+
+    def pingShards(self, shards, total = None, checkpoint = None):
+        """Sweep shards of addresses (lists, or Addresses.Block), several of them at the same time. The shards are read
+           as the slots free up: only a few of them are in memory, however many there are.
+           Yield (hostname, fqdn, ping_delay, address) tuples, a shard at a time, as soon as it’s swept.
+           The checkpoint, if any, moves past each shard once its results are all read, and is finished with the sweep.
+           When self.stopping is set, the sweep ends after the shard being read: the other shards are dropped, and the
+           checkpoint left unfinished so the sweep can be resumed."""
+        from Scheduler import Scheduler
+        conf = self.configuration['ping']
+        self.logger.log('Processing {} addresses in batches of {}, {} at a time, at {} p/s (timeout: {}s).'.format('?' if total is None else total, self.configuration['ping_chunk_size'], conf['processes'], conf['rate'], conf['timeout']), 0)
+        scheduler = Scheduler(conf['processes'], logger=self.logger, name='ping')
+        shards = iter(shards)
+        def submit(count):
+            for shard in islice(shards, count):
+                scheduler.submit(self.sweep, (shard,), key=(shard[0], shard[-1], len(shard), checkpoint.issue(shard) if checkpoint else None), fallback=lambda task, reason: [])
+        submit(2 * scheduler.slots)
         batch_index = 1
+        scanned = 0
         start = time()
+        runs = scheduler.run()
         try:
-            for chunk in chunks(addresses, self.configuration['ping_chunk_size']):
-                remaining -= len(chunk)
-                first = chunk[0]
-                last = chunk[-1:][0]
-                self.logger.log('Batch #{:03d} ({}) {} → {}, ({} left)'.format(batch_index, str(len(chunk)), first, last, str(remaining)), 0)
-                for address in chunk:
-                    host = Host.Host()
-                    Process(target=host.process, args=(address, queue)).start()
-                for host in chunk:
-                    hosts.append(queue.get())
+            for (first, last, size, entry), batch in runs:
+                submit(1)
+                scanned += size
+                self.logger.log('Batch #{:03d} ({}) {} → {}, ({} left)'.format(batch_index, size, first, last, '?' if total is None else total - scanned), 0)
                 batch_index += 1
+                yield from batch
+                if checkpoint: checkpoint.complete(entry)
+                if self.stopping.is_set():
+                    runs.close()
+                    self.logger.log('Sweep stopped after {} addresses.'.format(scanned), 1)
+                    return
             end = time()
             elapsed = str(timedelta(seconds=(end - start)))
-            rate = len(addresses) / (end - start)
-            self.logger.log('{} addresses scanned in {} ({:.2f} a/s)'.format(len(addresses), elapsed, rate), 0)
+            rate = scanned / (end - start)
+            self.logger.log('{} addresses scanned in {} ({:.2f} a/s)'.format(scanned, elapsed, rate), 0)
+            if checkpoint: checkpoint.finish()
 
         except KeyboardInterrupt:
             self.logger.log('Host update cancelled by keyboard interrupt!', 5)
-        
-        return hosts
+
+    def pingAddr(self, addresses, checkpoint = None):
+        """Ping addresses in shards of `ping_chunk_size`, several shards being swept at the same time.
+           Yield (hostname, fqdn, ping_delay, address) tuples, a shard at a time (see pingShards)."""
+        return self.pingShards(chunks(addresses, int(self.configuration['ping_chunk_size'])), len(addresses) if hasattr(addresses, '__len__') else None, checkpoint)
+
+    def checkpoint(self, name, resume = False):
+        """Return a Checkpoint for the sweep of a network or a selection. With resume, it goes on from where the last sweep
+           of the same name stopped, unless that one was over."""
+        checkpoint = Checkpoint(name)
+        record = self.db.sweepCursor(name) if resume else None
+        if record and not record['finished']:
+            checkpoint.resume(record)
+            self.logger.log('Resuming the sweep of {} started on {} ({} addresses swept).'.format(name, humanTime(record['started']), record['swept']), 1)
+        elif resume: self.logger.log('No interrupted sweep of {} to resume, starting from the beginning.'.format(name), 1)
+        return checkpoint
     
-    def pingHosts(self, network = '127.0.0.0/8'):
-        """Ping all hosts in a given network and update the database. It returns the list
-           of hosts, each host being a triplet (hostname, fqdn, ping_delay).
+    def pingHosts(self, network = '127.0.0.0/8', hitlist = None, checkpoint = None):
+        """Ping all hosts in a given network. Yield (hostname, fqdn, ping_delay, address) tuples as they are swept:
+           the addresses are generated as they are sent to, the memory used doesn’t depend on the size of the network.
+           IPv6 prefixes larger than a /112 can’t be swept address by address: only the addresses of the hitlist file
+           which are in the prefix are pinged then. A hitlist may restrict an IPv4 network as well.
+           A checkpoint (see checkpoint) records the progress, and tells where to start from.
            If network is False the `ip route` external command will be called
            to get the default route and use it."""
         
         if not network: network = getDefaultRoute()
-        try: net = ipaddress.IPv4Network(network)
+        try: net = Addresses.network(network)
         except ValueError as e:
             print('Invalid network specification: '+str(e), file=sys.stderr)
             return []
-        addresses = list(net.hosts())
-        return self.pingAddr(addresses)
+        size = int(self.configuration['ping_chunk_size'])
+        if hitlist:
+            if hitlist != '-' and not os.access(hitlist, os.R_OK):
+                print('Can’t read the hit list {}.'.format(hitlist), file=sys.stderr)
+                return []
+            addresses = Addresses.hitlist(hitlist, net)
+            # Positions are ranks in the hit list.
+            if checkpoint: addresses = islice(addresses, checkpoint.start(0), None)
+            return self.pingShards(chunks(addresses, size), None, checkpoint)
+        first, last = Addresses.hostRange(net)
+        if net.version == 6 and last - first + 1 > Addresses.MAX_IPV6_HOSTS:
+            print('{} is too large to be swept address by address: give the addresses to ping in a hit list (--hitlist).'.format(net), file=sys.stderr)
+            return []
+        start = checkpoint.start(first, lambda block: (block.first, block.last), last - first + 1) if checkpoint else first
+        return self.pingShards(Addresses.blocks(net, size, start), last - start + 1, checkpoint)
 
-    def pingAddresses(self, addresses = []):
-        """Ping all addresses and update the database. It returns the list
-           of hosts, each host being a triplet (hostname, fqdn, ping_delay)."""
-        return self.pingAddr(addresses)
+    def pingAddresses(self, addresses = [], checkpoint = None):
+        """Ping all addresses, or host names. Yield (hostname, fqdn, ping_delay, address) tuples, a shard at a time.
+           With a checkpoint, IPv4 then IPv6 addresses are swept in their numeric order, then host names in alphabetical order.
+           Positions are ranks in that order, as in a hit list: hosts added to or removed from the list before a sweep
+           is resumed shift it by as many."""
+        if checkpoint:
+            addresses = sorted(set(map(str, addresses)), key=lambda address: (0, ':' in address, Addresses.aton(address), '') if Addresses.isAddress(address) else (1, False, 0, address))
+            addresses = addresses[checkpoint.start(0, None, len(addresses)):]
+        return self.pingAddr(addresses, checkpoint)
+
+    def updateDue(self, queue = None):
+        """Probe the known addresses whose next check time has come, and update them. Return the number of addresses probed."""
+        if queue is None:
+            queue = ProbeQueue(self.db, self.logger)
+            queue.load()
+        addresses = queue.due()
+        self.logger.log('{} addresses due for a check, {} not due yet.'.format(len(addresses), len(queue)), 0)
+        if not addresses: return 0
+        self.updateHosts(self.pingAddresses(addresses), 'due')
+        queue.reschedule(addresses)
+        return len(addresses)
 
     def getURLs(self):
-        
-        _urls = []
+        """Check all the URLs. Yield each one as soon as it’s checked."""
         urls = list(map(URL.URL, self.db.urls()))
-        self.logger.log('GET request on {} URLs in chunks of {}'.format(len(urls),self.configuration['url']['chunk_size']), 0)
-        if self.configuration['url']['verify_ssl'] == 'True': verify = True
-        else: verify = False
-        chunk_list = list(chunks(urls, self.configuration['url']['chunk_size']))
-        for url_chunk in chunk_list:
-            queue = Queue(self.configuration['url']['chunk_size'])
-            for url in url_chunk:
-                self.logger.log('GET: {} …'.format(url), 0)
-                Process(target=GetURL,args=((url,queue,verify))).start()
-            for _ in range(1, len(url_chunk)):
-                item = queue.get()
-                self.logger.log('GET: {} [{}]'.format(item,item['status']), 0)
-                _urls.append(item)
-        return _urls
+        self.logger.log('GET request on {} URLs, {} at a time'.format(len(urls),self.configuration['url']['chunk_size']), 0)
+        if not self.http:
+            from HTTP import HTTP
+            self.http = HTTP(self.configuration['url'], self.logger)
+            self.http.certificates = self.db.certificateExpiries()
+        for item in self.http.check(urls, self.configuration['url'].get('timeout', 60)):
+            self.logger.log('GET: {} [{}{}]'.format(item, item['status'], ', not modified' if item.get('not_modified') else ''), 0)
+            yield item
         
     
-    def updateHosts(self, ping_delays, network_name = None): self.db.updateHosts(ping_delays, network_name)
+    def updateHosts(self, ping_delays, network_name = None, checkpoint = None): return self.db.updateHosts(ping_delays, network_name, checkpoint)
 
     def updateURLs(self):
         try:
@@ -176,29 +263,57 @@ class OSMDB:
         for host in hosts:
             _hosts.append(self.db.hostByName(host))
         hosts = list(map(Host.Host, _hosts))
-        executions = list(map(Execution.Execution, self.ssh.execute(command, hosts)))
-        lprint(executions)
-        self.db.addExecutions(executions)
-    def listHosts(self, hosts):
-        lprint(hosts)
-    def listHostsByNames(self, hostnames):
-        lprint(self.db.listHostsByName(hostnames))
-    def listHostUpdates(self):
-        lprint(self.db.listHostUpdates())
+        self.sshParameters(hosts)
+        for runs in self.ssh.execute(command, hosts):
+            executions = list(map(Execution.Execution, runs))
+            lprint(executions)
+            self.db.addExecutions(executions)
+    def output(self, rows, text, listing = None):
+        """Write listed rows as they are read, in the listing format (see Listing.options). text formats a row for the text format.
+           When a page is full, the --after argument giving the next one is printed on stderr. Return the number of rows written."""
+        if not listing: listing = {}
+        writer = Listing.Writer(listing.get('format', 'text'))
+        row = None
+        try:
+            for row in rows: writer.write(Listing.record(row), text(row))
+        finally: writer.close()
+        if listing.get('limit') and writer.count == listing['limit']:
+            print('Next page: --after \'{}\''.format(Listing.encodeKey(Listing.key(row))), file=sys.stderr)
+        return writer.count
+    def listHosts(self, query = '', seen_up = True, listing = None):
+        if not listing: listing = {}
+        rows = self.db.listHosts(query, seen_up, listing.get('limit'), listing.get('offset'), listing.get('after'))
+        return self.output(rows, self.db.format_host_record, listing)
+    def listHostsByNames(self, hostnames, listing = None):
+        return self.output(self.db.listHostsByName(hostnames), self.db.format_host_record, dict(listing or {}, limit=None))
+    def listHostUpdates(self, listing = None):
+        if not listing: listing = {}
+        rows = self.db.listHostUpdates(listing.get('limit'), listing.get('offset'), listing.get('after'))
+        return self.output(rows, self.db.format_update_record, listing)
     def deploy(self, key, hosts):
         """Add the public key of OSMDB in the authorized_keys file of the given hosts."""
-        if len(hosts) > 0: self.ssh.deploy(key, list(map(Host.Host,hosts)))
+        hosts = list(map(Host.Host,hosts))
+        self.sshParameters(hosts)
+        if len(hosts) > 0: self.ssh.deploy(key, hosts)
+    def sshParameters(self, hosts):
+        """Override the SSH user and key of Host objects with the “ssh_user” and “ssh_key” parameters, resolved for all hosts at once."""
+        fqdn_list = [host.fqdn for host in hosts]
+        users = self.db.getParameters(fqdn_list, 'ssh_user')
+        keys = self.db.getParameters(fqdn_list, 'ssh_key')
+        for host in hosts:
+            host.user = users.get(host.fqdn, getattr(host, 'user', None))
+            host.key_file = keys.get(host.fqdn, getattr(host, 'key_file', None))
     def selectHosts(self, query = '', status = 'UP'):
         return self.db.hosts(query=query, status=status)
     def selectHostsByTags(self, tags = ''):
         return self.db.hostsByTags(tags)
-    def listExecutions(self):
-        for execution in self.db.listExecutions():
-            execution_l = list(execution)
-            execution_l[1] = Host.Host((execution[1],execution[1],None))
-            execution_l[4] = execution[4].split('\n')
-            execution_l[5] = execution[5].split('\n')
-            print(Execution.Execution(execution_l))
+    def listExecutions(self, listing = None):
+        if not listing: listing = {}
+        def text(execution):
+            return repr(Execution.Execution((execution['user'], Host.Host((execution['fqdn'],execution['fqdn'],None)), execution['cmdline'], execution['return_code'],
+                                             execution['stdout'].split('\n'), execution['stderr'].split('\n'), execution['status'], execution['start'], execution['end'])))
+        rows = self.db.listExecutions(listing.get('limit'), listing.get('offset'), listing.get('after'))
+        return self.output(rows, text, listing)
     def purgeHosts(self, addresses = '%'):
         self.db.purgeHosts(addresses)
     
@@ -235,36 +350,41 @@ class OSMDB:
 
     def listURL(self): return list(map(URL.URL, self.db.urls()))
 
+    def listCertificates(self, days = None):
+        for fingerprint, not_valid_after, subject, san, issuer, urls in self.db.certificates(days):
+            print('{} {} {:<40} {:<40} {} URL(s) [{}]'.format(fingerprint[:16], humanTime(not_valid_after), subject, san[:40], urls, issuer))
+
+    def listHistory(self, kind = 'ping', window = 86400):
+        """Print the availability and the min/avg/max values of the series of a kind (ping, uptime or url) over the last window seconds."""
+        for name, count, lost, minimum, average, maximum in self.db.history(kind, window):
+            if average is None: values = '-'
+            else: values = '{:.3f}/{:.3f}/{:.3f}'.format(minimum, average, maximum)
+            print('{:<50} {:>10.4f}% {:>8} samples {:>6} lost  {}'.format(name, (count - lost) * 100 / count, count, lost, values))
+
+    def listSweeps(self):
+        """Print the progress of the sweeps of the networks and selections."""
+        for name, position, swept, total, started, updated, finished in self.db.sweeps():
+            progress = '{:>6.2f}%'.format(swept * 100 / total) if total else '{:>7}'.format(swept)
+            print('{:<40} {} {} → {} {}'.format(name, progress, humanTime(started), humanTime(updated), 'finished' if finished else 'unfinished'))
+
+    def listURLChanges(self):
+        for proto, host, port, path, change_time, previous, digest in self.db.urlChanges():
+            print('{:<80} {} {} → {}'.format('{}://{}:{}{}'.format(proto, host, port, path), humanTime(change_time), (previous or '-')[:12], (digest or '-')[:12]))
+
     def deleteURLs(self, query): return self.db.deleteURLs(query)
 
-    def getSNMP(self, hosts, mib, oid):
-        
+    def getSNMP(self, hosts, objects):
+        """Query the (mib, oid) objects on hosts. Return a list of (host, mib, oid, time, value) tuples."""
         responses = []
-        procs = []
-        remaining = len(hosts)
-        self.logger.log('Querying SNMP for {}:{} on {} hosts in batches of {}.'.format(mib, oid, remaining, self.configuration['snmp']['chunk_size']), 0)
-        batch_index = 1
+        names = ', '.join(['{}:{}'.format(mib, oid) for mib, oid in objects])
+        self.logger.log('Querying SNMP for {} on {} hosts, {} at a time.'.format(names, len(hosts), self.configuration['snmp']['chunk_size']), 0)
         start = time()
-        queue = Queue(remaining)
+        communities = self.db.getParameters(hosts, 'snmp_community')
+        if not self.snmp:
+            from SNMP import SNMP
+            self.snmp = SNMP(self.configuration['snmp'], self.logger)
         try:
-            for chunk in chunks(hosts, self.configuration['snmp']['chunk_size']):
-                remaining -= len(chunk)
-                first = chunk[0]
-                last = chunk[-1:][0]
-                self.logger.log('Batch #{:03d} ({}) {} → {}, ({} left)'.format(batch_index, len(chunk), first, last, remaining), 0)
-                for host in chunk:
-                    community = self.db.getParameter(host,'snmp_community')
-                    if community is False: community = self.configuration['snmp']['community']
-                    self.logger.log('Querying {}:{} for {} (community: {})'.format(mib,oid,host,community), 0)
-                    p = Process(target=getSNMP, args=(host, queue, mib, oid, community, self.configuration['snmp']['port'], self.logger))
-                    p.start()
-                    procs.append(p)
-                for proc in procs:
-                    proc.join()
-
-                for host in chunk:
-                    responses.append(queue.get())
-                batch_index += 1
+            responses = self.snmp.get(hosts, objects, communities)
             end = time()
             elapsed = str(timedelta(seconds=(end - start)))
             rate = len(hosts) / (end - start)
@@ -275,6 +395,34 @@ class OSMDB:
 
         return responses
 
+    def walkSNMP(self, hosts, table):
+        """Walk a `MIB::table` SNMP table on hosts with GETBULK requests and record the samples of each host as soon as its walk is over."""
+        try: mib, table = table.split('::')
+        except ValueError:
+            self.logger.log('“{}” is not a valid table name, expected <MIB>::<table>.'.format(table), 2)
+            return False
+        self.logger.log('Walking SNMP table {}::{} on {} hosts, {} at a time.'.format(mib, table, len(hosts), self.configuration['snmp']['chunk_size']), 0)
+        start = time()
+        communities = self.db.getParameters(hosts, 'snmp_community')
+        if not self.snmp:
+            from SNMP import SNMP
+            self.snmp = SNMP(self.configuration['snmp'], self.logger)
+        count = 0
+        try:
+            for samples in self.snmp.walk(hosts, mib, table, communities):
+                self.db.addSnmpSamples(samples)
+                count += len(samples)
+            end = time()
+            self.logger.log('{} samples from {} hosts in {}'.format(count, len(hosts), str(timedelta(seconds=(end - start)))), 0)
+        except KeyboardInterrupt:
+            self.logger.log('Table walk cancelled by keyboard interrupt! {} samples recorded.'.format(count), 5)
+            return False
+        return True
+
+    def listRates(self, column = None):
+        for host, mib, name, index, sample_time, rate in self.db.snmpRates(column):
+            print('{:30s} {}::{}.{:<8} {} {:.2f}/s'.format(host, mib, name, str(index), humanTime(sample_time), rate))
+
     def updateSNMP(self, snmp_responses, selname):
         
         return self.db.updateSNMP(snmp_responses, selname)
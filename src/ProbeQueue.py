@@ -0,0 +1,64 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB adaptive probe scheduling."""
+import sys
+try:
+    import heapq
+    from time import time
+    import Logger
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+def probeInterval(now, first_up, adjacent_up, adjacent_down, last_change, minimum = 60, base = 300, maximum = 86400):
+    """Return the number of seconds until a host should be probed again, from the counters of the host table:
+        - an address never seen up backs off exponentially with its consecutive failures, from base;
+        - a host which changed state within the last 4 base intervals (it came back, was lost or flaps) is probed every minimum;
+        - a host seen before but down for a while backs off exponentially, from minimum;
+        - a host up is probed less often the longer it stays up: the interval doubles every 12 consecutive successes, from base."""
+    if not first_up: interval = base * 2 ** min(adjacent_down or 0, 20)
+    elif last_change and now - last_change < 4 * base: interval = minimum
+    elif adjacent_down: interval = minimum * 2 ** min(adjacent_down, 20)
+    else: interval = base * 2 ** min((adjacent_up or 0) // 12, 20)
+    return min(maximum, max(minimum, interval))
+
+class ProbeQueue:
+    """Priority queue of the known addresses, ordered by their next check time."""
+
+    def __init__(self, db, logger = Logger.Logger()):
+
+        self.db = db
+        self.logger = logger
+        self.heap = []
+        self.loaded = None
+
+    def __repr__(self): return 'ProbeQueue'
+
+    def __len__(self): return len(self.heap)
+
+    def load(self):
+        """(Re)build the queue from the database."""
+        self.heap = [(next_check or 0, address) for address, next_check in self.db.nextChecks()]
+        heapq.heapify(self.heap)
+        self.loaded = time()
+        self.logger.log('{} addresses in the probe queue.'.format(len(self.heap)), 0)
+
+    def due(self, now = None):
+        """Pop and return the addresses due for a check."""
+        if now is None: now = time()
+        addresses = []
+        while self.heap and self.heap[0][0] <= now: addresses.append(heapq.heappop(self.heap)[1])
+        return addresses
+
+    def reschedule(self, addresses):
+        """Push addresses back in the queue, at the next check time the database gives them."""
+        for address, next_check in self.db.nextChecks(addresses): heapq.heappush(self.heap, (next_check or 0, address))
+
+    def wait(self):
+        """Return the number of seconds until the next check is due, None if the queue is empty."""
+        if not self.heap: return None
+        return max(0, self.heap[0][0] - time())
+
+if __name__ == '__main__': sys.exit(100)
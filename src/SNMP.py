@@ -4,47 +4,160 @@
 import sys
 try:
     from time import time
-    from multiprocessing import Queue
-    from pysnmp.hlapi import *
+    import socket
+    import asyncio
+    from pysnmp.hlapi.asyncio import *
     from pysnmp.error import *
+    from pysnmp.smi import view
+    from pysnmp.proto.rfc1905 import EndOfMibView
+    from pysnmp.proto.rfc1902 import Counter32, Counter64
+    from pyasn1.error import PyAsn1Error
     import Logger
+    import Metrics
 
 except ImportError as e:
     print(str(e), file=sys.stderr)
     print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
     sys.exit(1)
 
-def getSNMP(host, queue = Queue(), mib = 'SNMPv2-MIB', oid = 'sysDescr', community = 'public', port = '161', logger = Logger.Logger()):
+class SNMP:
+    """SNMP poller. A single engine and event loop keep many requests in flight.
+       All the objects asked for a host are fetched with a single GET."""
 
+    def __init__(self, configuration, logger = Logger.Logger()):
 
-    try:
+        self.configuration = configuration
+        self.logger = logger
+        self.port = int(self.configuration.get('port', 161))
+        self.timeout = float(self.configuration.get('timeout', 1))
+        self.retries = int(self.configuration.get('retries', 5))
+        self.concurrency = int(self.configuration.get('chunk_size', 256))
+        self.max_repetitions = int(self.configuration.get('max_repetitions', 25))
+        self.loop = asyncio.new_event_loop()
+        self.engine = SnmpEngine()
+        self.mib_view = view.MibViewController(self.engine.getMibBuilder())
 
-        errorIndication, errorStatus, errorIndex, varBinds = next(
-            getCmd(SnmpEngine(),
-                   CommunityData(community, mpModel=0),
-                   UdpTransportTarget((host, port)),
-                   ContextData(),
-                   ObjectType(ObjectIdentity(mib, oid, 0)))
-        )
+    def __repr__(self): return 'SNMP'
 
-        if errorIndication:
-            logger.log(host+': '+str(errorIndication), 3)
-        elif errorStatus:
-            logger.log('%s at %s' % (errorStatus.prettyPrint(),
-                                errorIndex and varBinds[int(errorIndex) - 1][0] or '?'), 4)
+    def close(self): self.loop.close()
 
-        
+    async def address(self, host):
+        """Resolve host without blocking the loop. Return None if it can’t be resolved."""
+        try:
+            with Metrics.dns_seconds.time(kind='forward'):
+                return (await self.loop.getaddrinfo(host, self.port, family=socket.AF_INET, type=socket.SOCK_DGRAM))[0][4][:2]
+        except (socket.gaierror, UnicodeError) as e:
+            self.logger.log('{}: {}'.format(host, e), 3)
+            return None
 
-        ret = varBinds[0].prettyPrint().split('=')[1].strip().replace('\n',' ').replace('\r',' ')
-        queue.put((host,mib,oid,int(time()),ret))
+    async def _get(self, host, community, objects, semaphore):
+        """Return a (host, mib, oid, time, value) tuple for each (mib, oid) of objects, value being empty for the objects which could not be fetched.
+           SNMPv1 fails the whole request if one object is missing: the faulty object is then dropped and the request sent again."""
+        values = {}
+        async with semaphore:
+            with Metrics.in_flight.track(probe='snmp'):
+                address = await self.address(host)
+                remaining = list(objects) if address else []
+                while remaining:
+                    start = time()
+                    try:
+                        errorIndication, errorStatus, errorIndex, varBinds = await getCmd(self.engine,
+                            CommunityData(community, mpModel=0),
+                            UdpTransportTarget(address, timeout=self.timeout, retries=self.retries),
+                            ContextData(),
+                            *[ObjectType(ObjectIdentity(mib, oid, 0)) for mib, oid in remaining])
+                    except (PySnmpError, BrokenPipeError) as e:
+                        Metrics.probe_errors.inc(probe='snmp')
+                        self.logger.log('{}: {}'.format(host, e), 4)
+                        break
+                    if errorIndication:
+                        if 'timeout' in str(errorIndication).lower(): Metrics.probe_timeouts.inc(probe='snmp')
+                        else: Metrics.probe_errors.inc(probe='snmp')
+                        self.logger.log('{}: {}'.format(host, errorIndication), 3)
+                        break
+                    Metrics.probe_seconds.observe(time() - start, probe='snmp')
+                    if errorStatus:
+                        self.logger.log('{}: {} at {}'.format(host, errorStatus.prettyPrint(), errorIndex and varBinds[int(errorIndex) - 1][0] or '?'), 4)
+                        if not errorIndex: break
+                        del remaining[int(errorIndex) - 1]
+                        continue
+                    for (mib, oid), (_, value) in zip(remaining, varBinds):
+                        values[(mib, oid)] = value.prettyPrint().strip().replace('\n',' ').replace('\r',' ')
+                    break
+        now = int(time())
+        return [(host, mib, oid, now, values.get((mib, oid), '')) for mib, oid in objects]
 
-    except BrokenPipeError as e:
-        logger.log(host+': '+str(e),4)
-        queue.put((host,mib,oid,int(time()),''))
+    async def _getAll(self, hosts, objects, communities):
 
-    except IndexError as e:
-        queue.put((host,mib,oid,int(time()),''))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self._get(host, communities.get(host, self.configuration['community']), objects, semaphore) for host in hosts])
 
-    except PySnmpError as e:
-        logger.log(host+': '+str(e),4)
-        queue.put((host,mib,oid,int(time()),''))
+    def get(self, hosts, objects = [('SNMPv2-MIB', 'sysDescr')], communities = {}):
+        """Query (mib, oid) objects on every host. `communities` maps hosts to their community, the configured one being the default.
+           Return a list of (host, mib, oid, time, value) tuples."""
+        responses = []
+        for host_responses in self.loop.run_until_complete(self._getAll(hosts, objects, communities)): responses += host_responses
+        return responses
+
+    async def _walk(self, host, community, prefix, semaphore):
+        """Walk the table whose OID is prefix with GETBULK requests (SNMPv2c).
+           Return a list of (host, mib, column, index, time, value, counter) tuples, value being an integer whenever possible
+           and counter telling if it’s a Counter32 or Counter64."""
+        samples = []
+        async with semaphore:
+            address = await self.address(host)
+            if not address: return samples
+            target = UdpTransportTarget(address, timeout=self.timeout, retries=self.retries)
+            last = prefix
+            while True:
+                try:
+                    errorIndication, errorStatus, errorIndex, varBindTable = await bulkCmd(self.engine,
+                        CommunityData(community, mpModel=1), target, ContextData(),
+                        0, self.max_repetitions, ObjectType(ObjectIdentity('.'.join(map(str, last)))))
+                except (PySnmpError, BrokenPipeError) as e:
+                    self.logger.log('{}: {}'.format(host, e), 4)
+                    break
+                if errorIndication or errorStatus:
+                    self.logger.log('{}: {}'.format(host, errorIndication or errorStatus.prettyPrint()), 3)
+                    break
+                now = int(time())
+                varBinds = [varBind for row in varBindTable for varBind in (row if isinstance(row, list) else [row])]
+                walked = False
+                for name, value in varBinds:
+                    oid = tuple(name.getOid())
+                    if oid[:len(prefix)] != prefix or isinstance(value, EndOfMibView):
+                        walked = True
+                        break
+                    # <table>.<entry>.<column>.<index>
+                    column = name.getMibSymbol()[1]
+                    index = oid[len(prefix) + 2:]
+                    if len(index) == 1: index = index[0]
+                    else: index = '.'.join(map(str, index))
+                    counter = isinstance(value, (Counter32, Counter64))
+                    try: value = int(value)
+                    except (TypeError, ValueError, PyAsn1Error): value = value.prettyPrint()
+                    samples.append((host, name.getMibSymbol()[0], column, index, now, value, counter))
+                    last = oid
+                if walked or not varBinds: break
+        return samples
+
+    async def _startWalks(self, hosts, prefix, communities):
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return [self.loop.create_task(self._walk(host, communities.get(host, self.configuration['community']), prefix, semaphore)) for host in hosts]
+
+    def walk(self, hosts, mib = 'IF-MIB', table = 'ifTable', communities = {}):
+        """Walk a table on every host. Yield the list of (host, mib, column, index, time, value, counter) samples of a host
+           as soon as its walk is over: only the samples of the hosts being walked are in memory."""
+        prefix = tuple(ObjectIdentity(mib, table).resolveWithMib(self.mib_view).getOid())
+        pending = self.loop.run_until_complete(self._startWalks(hosts, prefix, communities))
+        try:
+            while pending:
+                done, pending = self.loop.run_until_complete(asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED))
+                for task in done: yield task.result()
+        finally:
+            # Walks left behind by an interruption are cancelled.
+            for task in pending: task.cancel()
+            if pending: self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+if __name__ == '__main__': sys.exit(100)
@@ -6,8 +6,14 @@ try:
         from time import time
         from os import path
         import datetime
-        import urllib3
+        import zlib
+        from collections import OrderedDict
+        from itertools import islice
+        from hashlib import sha256
         import Logger
+        import Metrics
+        from Tags import TagQuery
+        from ProbeQueue import probeInterval
 
 except ImportError as e:
     print(str(e), file=sys.stderr)
@@ -19,10 +25,257 @@ def humanTime(timestamp):
     try: return datetime.datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S')
     except Exception as e: return datetime.datetime.fromtimestamp(0).strftime('%Y-%m-%d %H:%M:%S')
 
-def intersection(words, d):
-    """Return a set of the values of dict `d` which are present at every key of the `words` list."""
-    return set.intersection(*(set(d.get(word, set())) for word in words))
 
+# Schema migrations. Migration N brings a database from version N-1 to N, the version being stored in
+# PRAGMA user_version. A migration is a list of SQL statements or of callables taking the SQLite object.
+host_table = """CREATE TABLE IF NOT EXISTS host (
+                    hostname TEXT,
+                    fqdn TEXT PRIMARY KEY,
+                    ip TEXT,
+                    ping_delay FLOAT DEFAULT -1,
+                    first_up INT,
+                    last_check INT,
+                    last_up INT DEFAULT 0,
+                    last_down INT DEFAULT 0,
+                    last_change INT,
+                    adjacent_up INT DEFAULT 0,
+                    adjacent_down INT DEFAULT 0,
+                    up INT DEFAULT 0,
+                    down INT DEFAULT 0,
+                    user TEXT,
+                    ssh_key_file TEXT)"""
+
+host_update_table = """CREATE TABLE IF NOT EXISTS host_update (
+                               update_time FLOAT,
+                               network TEXT,
+                               selection TEXT,
+                               up INT, down INT, back INT, lost INT, new INT,
+                               duration FLOAT)"""
+
+execution_table = """CREATE TABLE IF NOT EXISTS execution (
+                               user TEXT,
+                               fqdn TEXT,
+                               cmdline TEXT,
+                               return_code INT,
+                               stdout,stderr TEXT,
+                               status TEXT,
+                               start,end FLOAT,
+                               FOREIGN KEY(fqdn) REFERENCES host(fqdn))"""
+
+url_table = """CREATE TABLE IF NOT EXISTS url (
+                               host TEXT,
+                               proto TEXT,
+                               path TEXT,
+                               port INT,
+                               user TEXT,
+                               password TEXT,
+                               check_time INTEGER,
+                               response_time INTEGER,
+                               total_time INTEGER,
+                               status TEXT,
+                               headers TEXT,
+                               content TEXT,
+                               certificate TEXT,
+                               expire INT,
+                               get_error TEXT,
+                               PRIMARY KEY(proto,host,path,port,user))"""
+
+host_tag_table = """CREATE TABLE IF NOT EXISTS host_tag (
+                               host TEXT,
+                               tag TEXT,
+                               description TEXT,
+                               tag_time INTEGER,
+                               FOREIGN KEY(host) REFERENCES host(fqdn),
+                               PRIMARY KEY(host, tag))"""
+
+snmp_table = """CREATE TABLE IF NOT EXISTS snmp (
+                               host TEXT,
+                               mib TEXT,
+                               oid TEXT,
+                               value TEXT,
+                               check_time INTEGER,
+                               selection TEXT,
+                               FOREIGN KEY(host) REFERENCES host(fqdn),
+                               PRIMARY KEY(host, mib, oid))"""
+
+param_table = """CREATE TABLE IF NOT EXISTS param (
+                               name TEXT,
+                               param TEXT,
+                               value TEXT,
+                               PRIMARY KEY(name, param))"""
+
+host_view = """CREATE VIEW IF NOT EXISTS host_view AS SELECT fqdn, tag FROM
+                        host INNER JOIN host_tag ON host.fqdn = host_tag.host"""
+
+# Rate between consecutive samples of a counter, NULL on the first sample or when the counter wrapped or was reset.
+# Only the columns walked as Counter32 or Counter64 have rates: gauges, strings and indexes don’t.
+snmp_rate_view = """CREATE VIEW IF NOT EXISTS snmp_rate AS
+            SELECT host_id.fqdn AS host, snmp_column.mib AS mib, snmp_column.name AS name, idx, time, value,
+                   CASE WHEN typeof(value) = 'integer' AND typeof(previous_value) = 'integer' AND value >= previous_value AND time > previous_time
+                        THEN (value - previous_value) * 1.0 / (time - previous_time) END AS rate
+            FROM (SELECT *, LAG(value) OVER series AS previous_value, LAG(time) OVER series AS previous_time
+                  FROM snmp_sample WHERE column_id IN (SELECT id FROM snmp_column WHERE counter)
+                  WINDOW series AS (PARTITION BY host_id, column_id, idx ORDER BY time))
+            INNER JOIN host_id ON host_id.id = host_id
+            INNER JOIN snmp_column ON snmp_column.id = column_id"""
+
+# Periods of the history rollups, in seconds.
+rollup_periods = [300, 3600, 86400]
+
+def rollupPeriod(window):
+    """Return the period of the rollups to read for a time window: the finest one giving at most a few hundred points per series."""
+    for period in rollup_periods:
+        if window <= period * 576: return period
+    return rollup_periods[-1]
+
+def moveToBlobs(db):
+    """Move the execution outputs and the URL contents into the blob table, a thousand rows at a time."""
+    for table, columns in [('execution', ['stdout', 'stderr']), ('url', ['content'])]:
+        last = 0
+        while True:
+            rows = db.cursor.execute("""SELECT rowid, {} FROM {} WHERE rowid > ? ORDER BY rowid LIMIT 1000""".format(', '.join(columns), table), (last,)).fetchall()
+            if not rows: break
+            for row in rows:
+                hashes = [db.putBlob(text) for text in row[1:]]
+                db.cursor.execute("""UPDATE {} SET {} WHERE rowid = ?""".format(table, ', '.join(['{0}_hash = ?, {0} = NULL'.format(column) for column in columns])), hashes + [row[0]])
+            last = rows[-1][0]
+
+def moveCertificates(db):
+    """Move the certificates of the URL rows into the certificate table."""
+    rows = db.cursor.execute("""SELECT rowid, certificate FROM url WHERE certificate IS NOT NULL AND certificate != ''""").fetchall()
+    # cryptography is only imported if there are certificates to parse.
+    if rows: import Certificate
+    for rowid, pem in rows:
+        try: certificate = Certificate.record(Certificate.splitPEM(pem))
+        except (ValueError, IndexError): continue
+        db.addCertificate(certificate)
+        db.cursor.execute("""UPDATE url SET fingerprint = ?, certificate = NULL WHERE rowid = ?""", (certificate['fingerprint'], rowid))
+
+migrations = [
+    # 1: base schema
+    [host_table, host_update_table, execution_table, url_table, host_tag_table, snmp_table, param_table, host_view],
+    # 2: indexes on the hot lookup columns
+    ["""CREATE INDEX IF NOT EXISTS host_hostname ON host (hostname)""",
+     """CREATE INDEX IF NOT EXISTS host_ip ON host (ip)""",
+     """CREATE INDEX IF NOT EXISTS host_first_up ON host (first_up)""",
+     """CREATE INDEX IF NOT EXISTS host_tag_tag ON host_tag (tag, host)""",
+     """CREATE INDEX IF NOT EXISTS execution_fqdn ON execution (fqdn)""",
+     """CREATE INDEX IF NOT EXISTS execution_end ON execution (end)""",
+     """CREATE INDEX IF NOT EXISTS param_param ON param (param, name)"""],
+    # 3: SNMP table samples, keyed by integers
+    ["""CREATE TABLE IF NOT EXISTS host_id (
+            id INTEGER PRIMARY KEY,
+            fqdn TEXT UNIQUE)""",
+     """CREATE TABLE IF NOT EXISTS snmp_column (
+            id INTEGER PRIMARY KEY,
+            mib TEXT,
+            name TEXT,
+            UNIQUE(mib, name))""",
+     """CREATE TABLE IF NOT EXISTS snmp_sample (
+            host_id INTEGER,
+            column_id INTEGER,
+            idx,
+            time INTEGER,
+            value,
+            PRIMARY KEY(host_id, column_id, idx, time)) WITHOUT ROWID""",
+     # Rate between consecutive samples of a counter, NULL on the first sample or when the counter wrapped or was reset.
+     """CREATE VIEW IF NOT EXISTS snmp_rate AS
+            SELECT host_id.fqdn AS host, snmp_column.mib AS mib, snmp_column.name AS name, idx, time, value,
+                   CASE WHEN value >= previous_value AND time > previous_time
+                        THEN (value - previous_value) * 1.0 / (time - previous_time) END AS rate
+            FROM (SELECT *, LAG(value) OVER series AS previous_value, LAG(time) OVER series AS previous_time
+                  FROM snmp_sample WINDOW series AS (PARTITION BY host_id, column_id, idx ORDER BY time))
+            INNER JOIN host_id ON host_id.id = host_id
+            INNER JOIN snmp_column ON snmp_column.id = column_id"""],
+    # 4: execution outputs and URL contents stored once, compressed, in a table keyed by their hash
+    ["""CREATE TABLE IF NOT EXISTS blob (
+            hash TEXT PRIMARY KEY,
+            size INTEGER,
+            data BLOB)""",
+     """ALTER TABLE execution ADD COLUMN stdout_hash TEXT REFERENCES blob(hash)""",
+     """ALTER TABLE execution ADD COLUMN stderr_hash TEXT REFERENCES blob(hash)""",
+     """ALTER TABLE url ADD COLUMN content_hash TEXT REFERENCES blob(hash)""",
+     """CREATE INDEX IF NOT EXISTS execution_stdout_hash ON execution (stdout_hash)""",
+     """CREATE INDEX IF NOT EXISTS execution_stderr_hash ON execution (stderr_hash)""",
+     """CREATE INDEX IF NOT EXISTS url_content_hash ON url (content_hash)""",
+     moveToBlobs],
+    # 5: URL content changes, as digests
+    ["""CREATE TABLE IF NOT EXISTS url_change (
+            proto TEXT,
+            host TEXT,
+            path TEXT,
+            port INT,
+            user TEXT,
+            change_time INTEGER,
+            previous_hash TEXT,
+            content_hash TEXT)""",
+     """CREATE INDEX IF NOT EXISTS url_change_time ON url_change (change_time)"""],
+    # 6: certificates stored once, keyed by their SHA-256 fingerprint
+    ["""CREATE TABLE IF NOT EXISTS certificate (
+            fingerprint TEXT PRIMARY KEY,
+            pem TEXT,
+            subject TEXT,
+            san TEXT,
+            issuer TEXT,
+            chain TEXT,
+            not_valid_after INTEGER)""",
+     """CREATE INDEX IF NOT EXISTS certificate_not_valid_after ON certificate (not_valid_after)""",
+     """ALTER TABLE url ADD COLUMN fingerprint TEXT REFERENCES certificate(fingerprint)""",
+     """CREATE INDEX IF NOT EXISTS url_fingerprint ON url (fingerprint)""",
+     moveCertificates],
+    # 7: next check time of each host, for adaptive probing
+    ["""ALTER TABLE host ADD COLUMN next_check INTEGER DEFAULT 0""",
+     """CREATE INDEX IF NOT EXISTS host_next_check ON host (next_check)"""],
+    # 8: history of ping delays, SNMP uptimes and URL response times, with 5 minutes, hourly and daily rollups
+    ["""CREATE TABLE IF NOT EXISTS series (
+            id INTEGER PRIMARY KEY,
+            kind TEXT,
+            name TEXT,
+            UNIQUE(kind, name))""",
+     # A NULL value is a loss: no reply, failed request.
+     """CREATE TABLE IF NOT EXISTS sample (
+            series_id INTEGER,
+            time INTEGER,
+            value REAL,
+            PRIMARY KEY(series_id, time)) WITHOUT ROWID""",
+     """CREATE INDEX IF NOT EXISTS sample_time ON sample (time)""",
+     """CREATE TABLE IF NOT EXISTS rollup (
+            series_id INTEGER,
+            period INTEGER,
+            time INTEGER,
+            count INTEGER,
+            lost INTEGER,
+            min REAL,
+            sum REAL,
+            max REAL,
+            PRIMARY KEY(series_id, period, time)) WITHOUT ROWID""",
+     """CREATE INDEX IF NOT EXISTS rollup_period_time ON rollup (period, time)"""],
+    # 9: indexes in the order of the listings, so their pages are read without sorting the whole table
+    ["""CREATE INDEX IF NOT EXISTS host_last_change ON host (COALESCE(last_change, 0))""",
+     """CREATE INDEX IF NOT EXISTS host_update_time ON host_update (update_time)"""],
+    # 10: progress of the sweeps, to resume them (see Checkpoint). IPv6 positions don’t fit in an INTEGER: they are stored as text.
+    ["""CREATE TABLE IF NOT EXISTS sweep (
+            name TEXT PRIMARY KEY,
+            position TEXT,
+            swept INTEGER DEFAULT 0,
+            total INTEGER,
+            started INTEGER,
+            updated INTEGER,
+            finished INTEGER)"""],
+    # 11: SNMP table columns flagged as counters, the only ones having rates
+    ["""ALTER TABLE snmp_column ADD COLUMN counter INTEGER DEFAULT 0""",
+     """DROP VIEW IF EXISTS snmp_rate""",
+     snmp_rate_view],
+    # 12: URL checks answered by a 304, the status being left to 200
+    ["""ALTER TABLE url ADD COLUMN not_modified INTEGER DEFAULT 0"""]
+    ]
+
+class Connection(sqlite3.Connection):
+    """SQLite connection whose commits are timed."""
+
+    def commit(self):
+
+        with Metrics.commit_seconds.time(): super().commit()
 
 class SQLite:
     def __init__(self, configuration, logger = Logger.Logger()):
@@ -34,7 +287,26 @@ class SQLite:
                 'default_user': 'root'
                 }
             self.configuration['ssh'] = self.configuration.get('ssh', default_ssh_configuration)
-            self.connection = sqlite3.connect(self.configuration['db_file'])
+            default_db_configuration = {
+                'journal_mode': 'WAL',
+                'synchronous': 'NORMAL',
+                'mmap_size': 268435456,
+                'cache_size': -65536,
+                'temp_store': 'MEMORY',
+                'compression_level': 6,
+                'batch_size': 10000
+                }
+            self.configuration['db'] = self.configuration.get('db', default_db_configuration)
+            self.parameters = {}
+            default_history_configuration = {
+                'raw_retention': 172800,
+                'retention': {'300': 2592000, '3600': 31536000, '86400': 315360000},
+                'availability_window': 86400
+                }
+            self.configuration['history'] = self.configuration.get('history', default_history_configuration)
+            self.series = {}
+            self.pruned = 0
+            self.connection = sqlite3.connect(self.configuration['db_file'], factory=Connection)
             self.cursor = self.connection.cursor()
             self.initialize_db()
         except KeyError as e:
@@ -43,121 +315,104 @@ class SQLite:
     def __repr__(self): return path.basename(self.configuration['db_file'])
 
     def initialize_db(self):
-        host_table = """CREATE TABLE IF NOT EXISTS host (
-                            hostname TEXT,
-                            fqdn TEXT PRIMARY KEY,
-                            ip TEXT,
-                            ping_delay FLOAT DEFAULT -1,
-                            first_up INT,
-                            last_check INT,
-                            last_up INT DEFAULT 0,
-                            last_down INT DEFAULT 0,
-                            last_change INT,
-                            adjacent_up INT DEFAULT 0,
-                            adjacent_down INT DEFAULT 0,
-                            up INT DEFAULT 0,
-                            down INT DEFAULT 0,
-                            user TEXT,
-                            ssh_key_file TEXT)"""
-        
-        self.cursor.execute(host_table)
-        
-        host_update_table = """CREATE TABLE IF NOT EXISTS host_update (
-                                       update_time FLOAT,
-                                       network TEXT,
-                                       selection TEXT,
-                                       up INT, down INT, back INT, lost INT, new INT,
-                                       duration FLOAT)"""
-        
-        self.cursor.execute(host_update_table)
-
-        execution_table = """CREATE TABLE IF NOT EXISTS execution (
-                                       user TEXT,
-                                       fqdn TEXT,
-                                       cmdline TEXT,
-                                       return_code INT,
-                                       stdout,stderr TEXT,
-                                       status TEXT,
-                                       start,end FLOAT,
-                                       FOREIGN KEY(fqdn) REFERENCES host(fqdn))"""
-        
-        self.cursor.execute(execution_table)
-
-        url_table = """CREATE TABLE IF NOT EXISTS url (
-                                       host TEXT,
-                                       proto TEXT,
-                                       path TEXT,
-                                       port INT,
-                                       user TEXT,
-                                       password TEXT,
-                                       check_time INTEGER,
-                                       response_time INTEGER,
-                                       total_time INTEGER,
-                                       status TEXT,
-                                       headers TEXT,
-                                       content TEXT,
-                                       certificate TEXT,
-                                       expire INT,
-                                       get_error TEXT,
-                                       PRIMARY KEY(proto,host,path,port,user))"""
-
-        self.cursor.execute(url_table)
-
-        host_tag_table = """CREATE TABLE IF NOT EXISTS host_tag (
-                                       host TEXT,
-                                       tag TEXT,
-                                       description TEXT,
-                                       tag_time INTEGER,
-                                       FOREIGN KEY(host) REFERENCES host(fqdn),
-                                       PRIMARY KEY(host, tag))"""
-
-        self.cursor.execute(host_tag_table)
-
-        snmp_table = """CREATE TABLE IF NOT EXISTS snmp (
-                                       host TEXT,
-                                       mib TEXT,
-                                       oid TEXT,
-                                       value TEXT,
-                                       check_time INTEGER,
-                                       selection TEXT,
-                                       FOREIGN KEY(host) REFERENCES host(fqdn),
-                                       PRIMARY KEY(host, mib, oid))"""
-
-        self.cursor.execute(snmp_table)
-
-        param_table = """CREATE TABLE IF NOT EXISTS param (
-                                       name TEXT,
-                                       param TEXT,
-                                       value TEXT,
-                                       PRIMARY KEY(name, param))"""
-
-        self.cursor.execute(param_table)
-
-        host_view = """CREATE VIEW IF NOT EXISTS host_view AS SELECT fqdn, tag FROM
-                                host INNER JOIN host_tag ON host.fqdn = host_tag.host"""
-
-        self.cursor.execute(host_view)
-
-        self.connection.commit()
-
-    def format_host_records(self, records):
-        """Return host records as a list of strings. The string shows FQDN, status, check time, etc…"""
-        hosts = []
-        for record in records:
-            hostname = record[0]
-            if record[3] in [-1,'']: status = self.configuration['icons']['host_down']
-            else: status = self.configuration['icons']['host_up']
+        """Tune the connection and upgrade the database schema to the last version."""
+        self.pragmas()
+        self.migrate()
+
+    def pragmas(self):
+        """Set the connection pragmas from the “db” configuration section."""
+        for pragma in ['journal_mode', 'synchronous', 'mmap_size', 'cache_size', 'temp_store']:
+            if pragma in self.configuration['db']:
+                self.cursor.execute('PRAGMA {} = {}'.format(pragma, self.configuration['db'][pragma]))
+
+    def migrate(self):
+        """Apply the migrations this database has not been through yet, each one in its own transaction."""
+        version = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(migrations[version:], version + 1):
+            self.logger.log('Upgrading database schema to version {}.'.format(number), 1)
+            try:
+                self.cursor.execute('BEGIN')
+                for statement in migration:
+                    if callable(statement): statement(self)
+                    else: self.cursor.execute(statement)
+                self.cursor.execute('PRAGMA user_version = {}'.format(number))
+                self.connection.commit()
+            except sqlite3.Error as err:
+                self.connection.rollback()
+                self.logger.log('Can’t upgrade database schema to version {}! ({})'.format(number, err), 12)
+                raise
+            if number == 4: self.logger.log('Outputs and contents moved to the blob table, run VACUUM on {} to reclaim the space they used.'.format(self), 1)
+
+    def putBlob(self, text):
+        """Store text in the blob table, compressed, unless it’s already there. Return its hash, None for an empty text."""
+        if not text: return None
+        data = str(text).encode('utf-8')
+        digest = sha256(data).hexdigest()
+        if not self.cursor.execute("""SELECT 1 FROM blob WHERE hash = ?""", (digest,)).fetchone():
+            self.cursor.execute("""INSERT INTO blob (hash, size, data) VALUES (?,?,?)""",
+                                (digest, len(data), zlib.compress(data, int(self.configuration['db'].get('compression_level', 6)))))
+        return digest
+
+    def getBlob(self, digest):
+        """Return the text stored under a hash, an empty string if there is none."""
+        if not digest: return ''
+        row = self.cursor.execute("""SELECT data FROM blob WHERE hash = ?""", (digest,)).fetchone()
+        if not row: return ''
+        return zlib.decompress(row[0]).decode('utf-8', 'replace')
+
+    def purgeBlobs(self, digests = None):
+        """Delete the blobs no execution nor URL refers to anymore, among digests or among all of them."""
+        query = """DELETE FROM blob WHERE {}
+                       AND NOT EXISTS (SELECT 1 FROM execution WHERE stdout_hash = blob.hash)
+                       AND NOT EXISTS (SELECT 1 FROM execution WHERE stderr_hash = blob.hash)
+                       AND NOT EXISTS (SELECT 1 FROM url WHERE content_hash = blob.hash)"""
+        if digests is None: self.cursor.execute(query.format('1'))
+        else: self.cursor.executemany(query.format('hash = ?'), [(digest,) for digest in set(digests) if digest])
+
+    def page(self, query, params = (), limit = None, offset = 0, after = None):
+        """Yield the rows (sqlite3.Row) of a query as they are read, most recent first. The query must have an `_order` and an `_id` column, which
+           make the key of a row. A page starts after the row whose key is `after` (keyset pagination), skips `offset` rows and holds at most `limit` rows.
+           The rows whose `_order` is NULL come last, in their own `_id` order."""
+        if not after: condition, after = '', ()
+        elif after[0] is None: condition, after = 'WHERE _order IS NULL AND _id < ?', after[1:]
+        else: condition = 'WHERE ((_order, _id) < (?, ?) OR _order IS NULL)'
+        query = 'SELECT * FROM ({}) {} ORDER BY _order DESC, _id DESC LIMIT ? OFFSET ?'.format(query, condition)
+        params = tuple(params) + tuple(after) + (-1 if limit is None else limit, offset or 0)
+        # A cursor of its own: the rows are read while other queries run on self.cursor.
+        cursor = self.connection.cursor()
+        cursor.row_factory = sqlite3.Row
+        try: cursor.execute(query, params)
+        except (sqlite3.OperationalError, sqlite3.Warning, sqlite3.ProgrammingError) as e:
+            self.logger.log('Misformed listing query ({}).'.format(e), 3)
+            return
+        for row in cursor: yield row
+
+    def hostAvailability(self, fqdn):
+        """Return the availability of a host, from its ping history over `history.availability_window` seconds, None if it has none."""
+        return self.availability('ping', fqdn, float(self.configuration['history'].get('availability_window', 86400)))
+
+    def format_host_record(self, record):
+        """Return a host record as a string showing FQDN, status, check time, etc…"""
+        hostname = record[0]
+        if record[3] in [-1,'']: status = self.configuration['icons']['host_down']
+        else: status = self.configuration['icons']['host_up']
+        # Availability over the window if there is some history, else since the host is known.
+        availability = self.hostAvailability(record[1])
+        if availability is None:
             try: availability = record[11] * 100 / (record[11] + record[12])
             except ZeroDivisionError: availability = 0
-            check = humanTime(record[5])
-            if status == self.configuration['icons']['host_down']:
-                last = humanTime(record[6])
-                last_nb = record[10]
-            else:
-                last = humanTime(record[7])
-                last_nb = record[9]
-            hosts.append('{:30s} {:4s}\t{}\t{}\t{}\t{:.6f}%'.format(hostname,status,check,last_nb,last,availability))  
-        return hosts
+        check = humanTime(record[5])
+        if status == self.configuration['icons']['host_down']:
+            last = humanTime(record[6])
+            last_nb = record[10]
+        else:
+            last = humanTime(record[7])
+            last_nb = record[9]
+        return '{:30s} {:4s}\t{}\t{}\t{}\t{:.6f}%'.format(hostname,status,check,last_nb,last,availability)
+
+    def format_host_records(self, records):
+        """Yield host records as strings (see format_host_record)."""
+        for record in records: yield self.format_host_record(record)
 
     def hostAliveOrSeenOnce(self, hostname):
         query = """SELECT ping_delay, first_up FROM host WHERE hostname = ?"""
@@ -182,7 +437,7 @@ class SQLite:
                 self.connection.commit()
                 return True
             else:
-                print(self.listHosts('hostname LIKE "{}"'.format(hostname), seen_up=False)[0])
+                for host in self.format_host_records(self.listHosts('hostname LIKE "{}"'.format(hostname), seen_up=False, limit=1)): print(host)
                 return False
         except sqlite3.OperationalError as err:
             self.logger.log('Cant’t insert into host table! ({})'.format(err),12)
@@ -199,77 +454,179 @@ class SQLite:
         if res: return res[0]
         else: return self.configuration['ssh']['default_user']
             
-    def updateHosts(self, ping_delays, network_name = None):
-        """Update table “host”"""
-        nb_up = nb_down = nb_new = nb_lost = nb_back = 0
+    def updateHosts(self, ping_delays, network_name = None, checkpoint = None):
+        """Update table “host” from the (hostname, fqdn, delay, ip) tuples of a sweep. ping_delays may be any iterable: it’s read
+           in batches of `batch_size` results (“db” configuration section), each one being applied and committed as soon as it’s complete,
+           together with the checkpoint of the sweep if there is one."""
         start = time()
-        for hostname,fqdn,delay,ip in ping_delays:
-            alive, seen_once = self.hostAliveOrSeenOnce(hostname)
-            user = self.hostUser(fqdn)
-            self.addHost(hostname, fqdn, delay, user, ip)
-            now = int(start)
-            try:
-                query = """UPDATE host SET last_check = ?, ping_delay = ? WHERE hostname = ?"""
-                self.cursor.execute(query, (now, delay, hostname))                
-                if delay is -1:
-                    nb_down += 1
-                    query = """UPDATE host SET down = down + 1 WHERE hostname = ?"""
-                    self.cursor.execute(query, (hostname,))
-                    if not alive:
-                        query = """UPDATE host SET adjacent_down = adjacent_down + 1, last_down = ? WHERE hostname = ?"""
-                        self.cursor.execute(query, (now,hostname,))
-                    else:
-                        nb_lost += 1
-                        self.logger.log('Host “'+hostname+'” became unreachable.',2)
-                        query = """UPDATE host SET last_change = ?, adjacent_down = 1 WHERE hostname = ?"""
-                        self.cursor.execute(query, (now, hostname))
-                else:
-                    nb_up += 1
-                    query = """UPDATE host SET up = up + 1, ping_delay = ? WHERE hostname = ?"""
-                    self.cursor.execute(query, (delay,hostname,))
-                    if alive:
-                        query = """UPDATE host SET adjacent_up = adjacent_up + 1, last_up = ? WHERE hostname = ?"""
-                        self.cursor.execute(query, (now,hostname,))
-                    else:
-                        
-                        if not seen_once:
-                            self.logger.log('Host “'+hostname+'” showed up for the first time.',1)
-                            nb_new += 1
-                            query = """UPDATE host SET first_up = ?, last_up = ?, adjacent_down = 0, down = 0 WHERE hostname = ?"""
-                            self.cursor.execute(query, (now, now, hostname))
-                        else: 
-                            nb_back += 1
-                            self.logger.log('Host “'+hostname+'” is back.',1)   
-                        query = """UPDATE host SET last_change = ?, adjacent_up = 1 WHERE hostname = ?"""
-                        self.cursor.execute(query, (now, hostname))
-            except sqlite3.OperationalError as err:
-                self.logger.log('Cant’t update host table! ({})'.format(err),12)
-                return False
+        counts = {}
+        total = 0
+        batch_size = max(1, int(self.configuration['db'].get('batch_size', 10000)))
+        ping_delays = iter(ping_delays)
+        while True:
+            batch = list(islice(ping_delays, batch_size))
+            if not self.updateHostBatch(batch, counts, checkpoint): return False
+            total += len(batch)
+            if len(batch) < batch_size: break
+        nb_new  = counts.get('new', 0)
+        nb_back = counts.get('back', 0)
+        nb_lost = counts.get('lost', 0)
+        nb_up   = counts.get('up', 0) + nb_new + nb_back
+        nb_down = counts.get('down', 0) + nb_lost
         try:
-            self.connection.commit()
             end = time()
             elapsed = str(datetime.timedelta(seconds=(end - start)))
             self.recordUpdate((time(), network_name, None, nb_up, nb_down, nb_back, nb_lost, nb_new, elapsed))
-            self.logger.log('{} hosts updated in {} (UP:{} DOWN:{} BACK:{} LOST:{} NEW:{})'.format(len(ping_delays), elapsed, nb_up, nb_down, nb_back, nb_lost, nb_new), 1)
+            self.logger.log('{} hosts updated in {} (UP:{} DOWN:{} BACK:{} LOST:{} NEW:{})'.format(total, elapsed, nb_up, nb_down, nb_back, nb_lost, nb_new), 1)
         except Exception as e:
             print('** Fix me! ** '+str(e))
             return False
             
         return True
 
-    def listHosts(self, query = '', seen_up = True):
+    @Metrics.timed(Metrics.sql_seconds, method='updateHostBatch')
+    def updateHostBatch(self, ping_delays, counts, checkpoint = None):
+        """Apply a batch of sweep results and commit it. The results are loaded in a staging table, then every host state transition
+           is applied with one statement. The number of hosts of each state is added to counts."""
+        now = int(time())
+        try:
+            self.cursor.execute("""CREATE TEMP TABLE IF NOT EXISTS host_staging (
+                                       hostname TEXT, fqdn TEXT, delay FLOAT, ip TEXT,
+                                       alive INT DEFAULT 0, seen_once INT DEFAULT 0, state TEXT)""")
+            self.cursor.execute("""CREATE INDEX IF NOT EXISTS host_staging_hostname ON host_staging (hostname)""")
+            self.cursor.execute("""DELETE FROM host_staging""")
+            self.cursor.executemany("""INSERT INTO host_staging (hostname, fqdn, delay, ip) VALUES (?,?,?,?)""", ping_delays)
+            # A host reached at several addresses keeps its last result, as when the results were applied one by one.
+            self.cursor.execute("""DELETE FROM host_staging WHERE rowid NOT IN (SELECT MAX(rowid) FROM host_staging GROUP BY hostname)""")
+            # State of each host before the update, as seen from the first record having its hostname.
+            self.cursor.execute("""UPDATE host_staging SET
+                                       alive = COALESCE((SELECT ping_delay IS NOT -1 FROM host WHERE host.hostname = host_staging.hostname ORDER BY rowid LIMIT 1), 0),
+                                       seen_once = COALESCE((SELECT COALESCE(first_up, 0) <> 0 FROM host WHERE host.hostname = host_staging.hostname ORDER BY rowid LIMIT 1), 0)""")
+            self.cursor.execute("""UPDATE host_staging SET state = CASE
+                                       WHEN delay = -1 THEN CASE WHEN alive THEN 'lost' ELSE 'down' END
+                                       WHEN alive THEN 'up'
+                                       WHEN seen_once THEN 'back'
+                                       ELSE 'new' END""")
+            self.cursor.execute("""INSERT OR IGNORE INTO host (hostname, fqdn, ping_delay, user, ip)
+                                       SELECT hostname, fqdn, delay, ?, ip FROM host_staging""", (self.configuration['ssh']['default_user'],))
+            self.cursor.execute("""UPDATE host SET last_check = ?,
+                                       ping_delay = (SELECT delay FROM host_staging WHERE host_staging.hostname = host.hostname)
+                                   WHERE hostname IN (SELECT hostname FROM host_staging)""", (now,))
+            transitions = {
+                'down': """down = down + 1, adjacent_down = adjacent_down + 1, last_down = :now""",
+                'lost': """down = down + 1, adjacent_down = 1, last_change = :now""",
+                'up':   """up = up + 1, adjacent_up = adjacent_up + 1, last_up = :now""",
+                'back': """up = up + 1, adjacent_up = 1, last_change = :now""",
+                'new':  """up = up + 1, down = 0, adjacent_up = 1, adjacent_down = 0, first_up = :now, last_up = :now, last_change = :now"""
+                }
+            for state, assignments in transitions.items():
+                query = """UPDATE host SET {} WHERE hostname IN (SELECT hostname FROM host_staging WHERE state = :state)""".format(assignments)
+                self.cursor.execute(query, {'now': now, 'state': state})
+            self.scheduleHosts(now)
+            self.addSamples('ping', [(fqdn, now, None if delay == -1 else delay) for fqdn, delay in self.cursor.execute("""SELECT fqdn, delay FROM host_staging""")])
+            for state, count in self.cursor.execute("""SELECT state, COUNT(*) FROM host_staging GROUP BY state""").fetchall(): counts[state] = counts.get(state, 0) + count
+            query = """SELECT hostname, state FROM host_staging WHERE state IN ('lost', 'back', 'new')"""
+            for hostname, state in self.cursor.execute(query).fetchall():
+                if state == 'lost': self.logger.log('Host “'+hostname+'” became unreachable.',2)
+                elif state == 'back': self.logger.log('Host “'+hostname+'” is back.',1)
+                else: self.logger.log('Host “'+hostname+'” showed up for the first time.',1)
+            if checkpoint: self.saveCheckpoint(checkpoint)
+            self.connection.commit()
+        except sqlite3.OperationalError as err:
+            self.logger.log('Cant’t update host table! ({})'.format(err),12)
+            self.connection.rollback()
+            return False
+        return True
 
+    def listHosts(self, query = '', seen_up = True, limit = None, offset = 0, after = None):
+        """Yield the host records, last changed first (see page)."""
         if not query or query == '*': query = ''
         else: query = 'AND '+query
         if seen_up is True:
-            query = 'SELECT * FROM host WHERE first_up NOT NULL {} ORDER BY last_change DESC'.format(query)
+            query = 'SELECT *, COALESCE(last_change, 0) AS _order, rowid AS _id FROM host WHERE first_up NOT NULL {}'.format(query)
         else:
-            query = 'SELECT * FROM host WHERE fqdn NOT NULL {} ORDER BY last_change DESC '.format(query)
-
-        try: results = self.cursor.execute(query).fetchall()
-        except (sqlite3.OperationalError,sqlite3.Warning): results = []
-        return self.format_host_records(results)
-
+            query = 'SELECT *, COALESCE(last_change, 0) AS _order, rowid AS _id FROM host WHERE fqdn NOT NULL {}'.format(query)
+        return self.page(query, (), limit, offset, after)
+
+
+    @Metrics.timed(Metrics.sql_seconds, method='scheduleHosts')
+    def scheduleHosts(self, now):
+        """Set the next check time of the hosts of the staging table from their counters (see ProbeQueue.probeInterval)."""
+        conf = self.configuration.get('ping', {})
+        bounds = [int(conf.get('min_interval', 60)), int(conf.get('base_interval', 300)), int(conf.get('max_interval', 86400))]
+        query = """SELECT hostname, first_up, adjacent_up, adjacent_down, last_change FROM host WHERE hostname IN (SELECT hostname FROM host_staging)"""
+        self.cursor.executemany("""UPDATE host SET next_check = ? WHERE hostname = ?""",
+                                [(now + probeInterval(now, *counters, *bounds), hostname) for hostname, *counters in self.cursor.execute(query).fetchall()])
+
+    @Metrics.timed(Metrics.sql_seconds, method='nextChecks')
+    def nextChecks(self, addresses = None):
+        """Return (address, next check time) couples, for the given addresses or for all of them."""
+        query = """SELECT ip, MIN(next_check) FROM host WHERE {} GROUP BY ip"""
+        if addresses is None: return self.cursor.execute(query.format("""ip IS NOT NULL AND ip != ''""")).fetchall()
+        addresses = list(set(map(str, addresses)))
+        results = []
+        for i in range(0, len(addresses), 500):
+            chunk = addresses[i:i + 500]
+            results += self.cursor.execute(query.format('ip IN ({})'.format(','.join('?' * len(chunk)))), chunk).fetchall()
+        return results
+
+    def seriesIds(self, kind, names):
+        """Return a dictionary of the integer ids of the history series of names, creating the missing ones."""
+        missing = [name for name in set(names) if (kind, name) not in self.series]
+        self.cursor.executemany("""INSERT OR IGNORE INTO series (kind, name) VALUES (?,?)""", [(kind, name) for name in missing])
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            query = """SELECT id, name FROM series WHERE kind = ? AND name IN ({})""".format(','.join('?' * len(chunk)))
+            for series_id, name in self.cursor.execute(query, [kind] + chunk): self.series[(kind, name)] = series_id
+        return {name: self.series[(kind, name)] for name in names}
+
+    @Metrics.timed(Metrics.sql_seconds, method='addSamples')
+    def addSamples(self, kind, samples):
+        """Record (name, time, value) samples of a kind of series (ping, uptime, url), value being None for a loss,
+           and add them to the rollups. A series has at most a sample per second: the first one is kept, and only the
+           samples actually recorded are added to the rollups. Expired samples and rollups are pruned at most once an hour."""
+        if not samples: return
+        ids = self.seriesIds(kind, [name for name, _, _ in samples])
+        query = """INSERT OR IGNORE INTO sample (series_id, time, value) VALUES (?,?,?)"""
+        rows = [row for row in ((ids[name], int(sample_time), value) for name, sample_time, value in samples) if self.cursor.execute(query, row).rowcount == 1]
+        query = """INSERT INTO rollup (series_id, period, time, count, lost, min, sum, max) VALUES (:id, :period, :time, 1, :lost, :value, :value, :value)
+                       ON CONFLICT (series_id, period, time) DO UPDATE SET
+                           count = count + 1,
+                           lost = lost + excluded.lost,
+                           min = CASE WHEN min IS NULL OR excluded.min < min THEN excluded.min ELSE min END,
+                           sum = COALESCE(sum, 0) + COALESCE(excluded.sum, 0),
+                           max = CASE WHEN max IS NULL OR excluded.max > max THEN excluded.max ELSE max END"""
+        for period in rollup_periods:
+            self.cursor.executemany(query, [{'id': series_id, 'period': period, 'time': sample_time - sample_time % period, 'lost': int(value is None), 'value': value}
+                                            for series_id, sample_time, value in rows])
+        if time() - self.pruned > 3600: self.pruneHistory()
+
+    @Metrics.timed(Metrics.sql_seconds, method='pruneHistory')
+    def pruneHistory(self):
+        """Delete the raw samples and the rollups older than their retention time."""
+        now = time()
+        self.cursor.execute("""DELETE FROM sample WHERE time < ?""", (now - float(self.configuration['history'].get('raw_retention', 172800)),))
+        for period, retention in self.configuration['history'].get('retention', {}).items():
+            self.cursor.execute("""DELETE FROM rollup WHERE period = ? AND time < ?""", (int(period), now - float(retention)))
+        self.pruned = now
+
+    def history(self, kind = 'ping', window = 86400):
+        """Return (name, count, lost, min, avg, max) tuples for the series of a kind, over the last window seconds, from the rollups."""
+        query = """SELECT series.name, SUM(count), SUM(lost), MIN(min), SUM(sum) / NULLIF(SUM(count) - SUM(lost), 0), MAX(max)
+                   FROM rollup INNER JOIN series ON series.id = rollup.series_id
+                   WHERE series.kind = ? AND rollup.period = ? AND rollup.time >= ?
+                   GROUP BY series.name ORDER BY series.name"""
+        period = rollupPeriod(window)
+        return self.cursor.execute(query, (kind, period, int(time() - window) // period * period)).fetchall()
+
+    def availability(self, kind, name, window = 86400):
+        """Return the availability, in percent, of a series over the last window seconds, None if it has no sample.
+           Only the rollups of this series are read, on their primary key: a listing computes it for the rows it writes."""
+        query = """SELECT SUM(count), SUM(lost) FROM rollup
+                   WHERE series_id = (SELECT id FROM series WHERE kind = ? AND name = ?) AND period = ? AND time >= ?"""
+        period = rollupPeriod(window)
+        count, lost = self.cursor.execute(query, (kind, name, period, int(time() - window) // period * period)).fetchone()
+        return (count - lost) * 100 / count if count else None
 
     def recordUpdate(self, values):
         
@@ -278,17 +635,32 @@ class SQLite:
         self.cursor.execute(query, values)
         self.connection.commit()
 
-    def listHostUpdates(self):
-        
-        query = """SELECT * FROM host_update ORDER BY update_time DESC"""
-        results = self.cursor.execute(query).fetchall()
-        updates = []
-        for record in results:
-            update_time = humanTime(record[0])
-            if not record[2]: source = record[1]
-            else: source = record[2]
-            updates.append('{} {:18} {}/{} {}/{}/{} {}'.format(update_time,source,record[3],record[4],record[5],record[6],record[7],record[8]))
-        return updates
+    def saveCheckpoint(self, checkpoint):
+        """Write the progress of a sweep, in the transaction of the batch of results it follows."""
+        self.cursor.execute("""INSERT OR REPLACE INTO sweep (name, position, swept, total, started, updated, finished) VALUES (?,?,?,?,?,?,?)""",
+                            (checkpoint.name, str(checkpoint.position), checkpoint.swept, checkpoint.total, checkpoint.started, int(time()), checkpoint.finished))
+
+    def sweepCursor(self, name):
+        """Return the `sweep` record of a network or selection, None if it was never swept."""
+        cursor = self.connection.cursor()
+        cursor.row_factory = sqlite3.Row
+        return cursor.execute("""SELECT * FROM sweep WHERE name = ?""", (name,)).fetchone()
+
+    def sweeps(self):
+        """Return the `sweep` records, last updated first."""
+        return self.cursor.execute("""SELECT name, position, swept, total, started, updated, finished FROM sweep ORDER BY updated DESC""").fetchall()
+
+    def listHostUpdates(self, limit = None, offset = 0, after = None):
+        """Yield the host update records, most recent first (see page)."""
+        query = """SELECT *, update_time AS _order, rowid AS _id FROM host_update"""
+        return self.page(query, (), limit, offset, after)
+
+    def format_update_record(self, record):
+
+        update_time = humanTime(record[0])
+        if not record[2]: source = record[1]
+        else: source = record[2]
+        return '{} {:18} {}/{} {}/{}/{} {}'.format(update_time,source,record[3],record[4],record[5],record[6],record[7],record[8])
 
     def hosts(self, query = '', status = 'UP'):
 
@@ -315,35 +687,32 @@ class SQLite:
         query = """SELECT * FROM host WHERE fqdn = ?"""
         return self.cursor.execute(query, (fqdn,)).fetchone()
 
+    @Metrics.timed(Metrics.sql_seconds, method='hostsByTags')
     def hostsByTags(self, query):
-
-        candidates = []
-        try:
-            for ored in query.split('|'):
-                subcandidates = {}
-                for tag in ored.split('&'):
-                    query = """SELECT host FROM host_tag WHERE tag = ?"""
-                    subcandidates[tag] = self.cursor.execute(query,(tag,)).fetchall()
-                for hostname in intersection(subcandidates.keys(),subcandidates):
-                    candidates.append(hostname)
-        except AttributeError: return []
-        return candidates
+        """Return the (fqdn,) records of the hosts matching a tag query (see Tags.TagQuery), evaluated by a single SQL query."""
+        if not query or query is True: return []
+        try: query, params = TagQuery(query).sql()
+        except ValueError as e:
+            self.logger.log(str(e), 3)
+            return []
+        return self.cursor.execute(query, params).fetchall()
 
     def listHostsByName(self, names):
-        hosts = []
-        results = []
-        query = """SELECT * FROM host WHERE fqdn = ?"""
+        """Yield the host records of the given FQDN, in the order of names."""
+        query = """SELECT *, COALESCE(last_change, 0) AS _order, rowid AS _id FROM host WHERE fqdn = ?"""
+        cursor = self.connection.cursor()
+        cursor.row_factory = sqlite3.Row
         for name in names:
-            try: results += self.cursor.execute(query,(name,)).fetchall()
-            except (sqlite3.OperationalError,sqlite3.Warning): results += []
-        return self.format_host_records(results)
+            try: yield from cursor.execute(query, (name,))
+            except (sqlite3.OperationalError,sqlite3.Warning): pass
 
+    @Metrics.timed(Metrics.sql_seconds, method='addExecutions')
     def addExecutions(self, executions):
         """Add executions in database."""
-        query = """INSERT INTO execution (user,fqdn,cmdline,return_code,stdout,stderr,status,start,end) VALUES 
-                         (:user,:host,:cmdline,:return_code,:stdout,:stderr,:status,:start,:end)"""
+        query = """INSERT INTO execution (user,fqdn,cmdline,return_code,stdout_hash,stderr_hash,status,start,end) VALUES 
+                         (:user,:host,:cmdline,:return_code,:stdout_hash,:stderr_hash,:status,:start,:end)"""
         try:
-            self.cursor.executemany(query, executions)
+            self.cursor.executemany(query, [dict(execution, stdout_hash=self.putBlob(execution['stdout']), stderr_hash=self.putBlob(execution['stderr'])) for execution in executions])
             self.connection.commit()
             return True
         except sqlite3.OperationalError as err:
@@ -353,11 +722,21 @@ class SQLite:
             print(' **!!** '+str(e), file=sys.stderr)
             return False
 
-    def listExecutions(self):
-        
-        query = """SELECT * FROM execution ORDER BY end DESC"""
-        return self.cursor.execute(query).fetchall()
+    def listExecutions(self, limit = None, offset = 0, after = None):
+        """Yield the executions, most recent first (see page), as dictionaries whose outputs are read from the blob table.
+           The outputs shared by many executions are kept in a small cache."""
+        query = """SELECT user,fqdn,cmdline,return_code,stdout_hash,stderr_hash,status,start,end, end AS _order, rowid AS _id FROM execution"""
+        blobs = OrderedDict()
+        def blob(digest):
+            if digest in blobs: blobs.move_to_end(digest)
+            else:
+                blobs[digest] = self.getBlob(digest)
+                if len(blobs) > 256: blobs.popitem(last=False)
+            return blobs[digest]
+        for execution in self.page(query, (), limit, offset, after):
+            yield {(name[:-5] if name in ['stdout_hash', 'stderr_hash'] else name): (blob(execution[name]) if name in ['stdout_hash', 'stderr_hash'] else execution[name]) for name in execution.keys()}
         
+    @Metrics.timed(Metrics.sql_seconds, method='purgeHosts')
     def purgeHosts(self, addresses):
         # First, purge ALL addresses which never responded.
         # One could still pin an addresse which is down, just make an insert with first_up is not null.
@@ -388,6 +767,10 @@ class SQLite:
         self.logger.log('{} hosts are left in the database after a purge on addresses like “{}”'.format(res,addresses), 1)
         return deleted
 
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
     def commit(self):
         try:
             self.connection.commit()
@@ -401,8 +784,11 @@ class SQLite:
         ored = []
         for fqdn in fqdn_list:
             ored.append('fqdn = "{}"'.format(fqdn))
+        # Only the blobs of the deleted outputs may be left unreferenced.
+        digests = [digest for row in self.cursor.execute('SELECT stdout_hash, stderr_hash FROM execution WHERE '+' OR '.join(ored)).fetchall() for digest in row]
         query = 'DELETE FROM execution WHERE '+' OR '.join(ored)
         self.cursor.execute(query)
+        self.purgeBlobs(digests)
 
     def deleteHosts(self, fqdn_list):
         if len(fqdn_list) == 0: return False
@@ -424,25 +810,72 @@ class SQLite:
             return str(e)
             
     def urls(self):
-        query = """SELECT * FROM url"""
+        """Return the URL records. Contents and certificates are not loaded: the last columns are their digest and fingerprint, and the not modified flag."""
+        query = """SELECT host,proto,path,port,user,password,check_time,response_time,total_time,status,headers,NULL,NULL,expire,get_error,content_hash,fingerprint,not_modified FROM url"""
         return self.cursor.execute(query).fetchall()
 
+    @Metrics.timed(Metrics.sql_seconds, method='updateURLs')
     def updateURLs(self, urls):
-
+        """Record URL checks as they come. A content of None means it did not change (or could not be fetched).
+           A change event is recorded each time the digest of a content differs from the previous one."""
         query = """UPDATE url SET host=:host,proto=:proto,path=:path,port=:port,
                                   user=:user,password=:password,check_time=:check_time,response_time=:response_time,total_time=:total_time,status=:status,
-                                  headers=:headers,content=:content,certificate=:certificate,expire=:expire,get_error=:get_error
+                                  headers=:headers,content_hash=:digest,certificate=NULL,fingerprint=:fingerprint,expire=:expire,get_error=:get_error,
+                                  not_modified=:not_modified
                               WHERE host = :host AND proto = :proto AND path = :path AND port = :port"""
-
-        self.cursor.executemany(query, map(dict,urls))
+        change_query = """INSERT INTO url_change (proto,host,path,port,user,change_time,previous_hash,content_hash)
+                                 VALUES (:proto,:host,:path,:port,:user,:check_time,:previous,:digest)"""
+        count = 0
+        samples = []
+        for url in urls:
+            url = dict(url, previous=url.get('digest'), not_modified=int(bool(url.get('not_modified'))))
+            if url['content'] is not None: url['digest'] = self.putBlob(url['content'])
+            if url['certificate']: self.addCertificate(url['certificate'])
+            self.cursor.execute(query, url)
+            samples.append(('{}://{}:{}{}'.format(url['proto'], url['host'], url['port'], url['path']), url['check_time'], None if url['status'] == -1 else url['response_time']))
+            if url['digest'] != url['previous']:
+                self.cursor.execute(change_query, url)
+                self.purgeBlobs([url['previous']])
+            count += 1
+            # The samples are recorded together, with each commit.
+            if count % 500 == 0:
+                self.addSamples('url', samples)
+                samples = []
+                self.connection.commit()
+        self.addSamples('url', samples)
         self.connection.commit()
         return True
 
+    def addCertificate(self, certificate):
+        """Add a certificate record (see Certificate.record) unless its fingerprint is known."""
+        self.cursor.execute("""INSERT OR IGNORE INTO certificate (fingerprint,pem,subject,san,issuer,chain,not_valid_after)
+                                      VALUES (:fingerprint,:pem,:subject,:san,:issuer,:chain,:not_valid_after)""", certificate)
+
+    def certificateExpiries(self):
+        """Return a dictionary of the expiry times of the known certificates, by fingerprint."""
+        return dict(self.cursor.execute("""SELECT fingerprint, not_valid_after FROM certificate""").fetchall())
+
+    def certificates(self, days = None):
+        """Return the certificates expiring within days (all of them if days is None), soonest first, with the number of URLs using them."""
+        query = """SELECT fingerprint, not_valid_after, subject, san, issuer,
+                          (SELECT COUNT(*) FROM url WHERE url.fingerprint = certificate.fingerprint)
+                   FROM certificate WHERE not_valid_after <= ? ORDER BY not_valid_after"""
+        if days is None: limit = 2**62
+        else: limit = int(time() + float(days) * 86400)
+        return self.cursor.execute(query, (limit,)).fetchall()
+
+    def urlChanges(self):
+
+        query = """SELECT proto,host,port,path,change_time,previous_hash,content_hash FROM url_change ORDER BY change_time DESC"""
+        return self.cursor.execute(query).fetchall()
+
     def deleteURLs(self, where_clause = 'hostname not like "%"'):
         query = 'DELETE FROM url WHERE '+where_clause
         try:
+            digests = [row[0] for row in self.cursor.execute('SELECT content_hash FROM url WHERE '+where_clause).fetchall()]
             if self.cursor.execute(query):
                 self.logger.log('DELETE FROM url WHERE '+where_clause,1)
+                self.purgeBlobs(digests)
                 self.connection.commit()
                 return True
             else: return False
@@ -450,6 +883,7 @@ class SQLite:
             print('Invalid SQL query!',file=sys.stderr)
             return False
 
+    @Metrics.timed(Metrics.sql_seconds, method='updateSNMP')
     def updateSNMP(self, snmp_responses, selname):
         snmp = {}
         for response in snmp_responses:
@@ -457,14 +891,52 @@ class SQLite:
             snmp['host'] = response[0]
             snmp['mib'] = response[1]
             snmp['oid'] = response[2]
-            urllib3.disable_warnings()
             self.cursor.execute("""INSERT OR IGNORE INTO snmp (host,mib,oid) VALUES (?,?,?)""", (snmp['host'],snmp['mib'],snmp['oid']))
             snmp['check_time'] = response[3]
             snmp['value'] = response[4]
             snmp['selection'] = selname
             query = """UPDATE snmp SET check_time=:check_time,value=:value WHERE host = :host AND mib = :mib AND oid = :oid"""
             self.cursor.execute(query, snmp)
+        # sysUpTime is in hundredths of a second.
+        uptimes = []
+        for host, mib, oid, check_time, value in snmp_responses:
+            if oid != 'sysUpTime': continue
+            try: uptimes.append((host, check_time, int(value) / 100))
+            except ValueError: uptimes.append((host, check_time, None))
+        self.addSamples('uptime', uptimes)
+        self.connection.commit()
+
+    def hostIds(self, fqdn_list):
+        """Return a dictionary of the integer ids of hosts, giving one to the hosts which have none yet."""
+        fqdn_list = list(set(fqdn_list))
+        self.cursor.executemany("""INSERT OR IGNORE INTO host_id (fqdn) VALUES (?)""", [(fqdn,) for fqdn in fqdn_list])
+        ids = {}
+        for i in range(0, len(fqdn_list), 500):
+            chunk = fqdn_list[i:i + 500]
+            ids.update(self.cursor.execute("""SELECT fqdn, id FROM host_id WHERE fqdn IN ({})""".format(','.join('?' * len(chunk))), chunk).fetchall())
+        return ids
+
+    @Metrics.timed(Metrics.sql_seconds, method='addSnmpSamples')
+    def addSnmpSamples(self, samples):
+        """Add (host, mib, column, index, time, value, counter) samples of SNMP tables and commit them.
+           A column is flagged as a counter as soon as one of its samples is."""
+        if not samples: return
+        hosts = self.hostIds([sample[0] for sample in samples])
+        self.cursor.executemany("""INSERT OR IGNORE INTO snmp_column (mib, name) VALUES (?,?)""", set([(sample[1], sample[2]) for sample in samples]))
+        self.cursor.executemany("""UPDATE snmp_column SET counter = 1 WHERE mib = ? AND name = ? AND NOT counter""", set([(sample[1], sample[2]) for sample in samples if sample[6]]))
+        columns = {(mib, name): column_id for column_id, mib, name in self.cursor.execute("""SELECT id, mib, name FROM snmp_column""")}
+        query = """INSERT OR REPLACE INTO snmp_sample (host_id, column_id, idx, time, value) VALUES (?,?,?,?,?)"""
+        self.cursor.executemany(query, ((hosts[host], columns[(mib, column)], index, sample_time, value) for host, mib, column, index, sample_time, value, _ in samples))
         self.connection.commit()
+        self.logger.log('{} SNMP samples recorded.'.format(len(samples)), 0)
+
+    def snmpRates(self, column = None):
+        """Return the last rate of every SNMP table counter (of a given column if any), as (host, mib, column, index, time, rate) tuples."""
+        query = """SELECT host, mib, name, idx, time, rate FROM
+                       (SELECT *, ROW_NUMBER() OVER (PARTITION BY host, mib, name, idx ORDER BY time DESC) AS age FROM snmp_rate WHERE {})
+                   WHERE age = 1 AND rate IS NOT NULL ORDER BY host, name, idx"""
+        if column: return self.cursor.execute(query.format('name = ?'), (column,)).fetchall()
+        else: return self.cursor.execute(query.format('1')).fetchall()
 
     def tagHost(self,host,tag,descr):
         query = """INSERT OR IGNORE INTO host_tag (host,tag) VALUES (?,?)"""
@@ -484,22 +956,30 @@ class SQLite:
             else: self.logger.log('“{}” is not tagged “{}”'.format(host[1],tag),1)
 
     def getParameter(self, name, param):
-        
-        query = """SELECT name, value FROM param WHERE name = ? AND param = ?"""
-        try:
-            candidate = self.cursor.execute(query, (name,param)).fetchone()[1]
-            return candidate
-        except (IndexError, TypeError):
-            try:
-                domain = name.split('.',1)[1]
-                candidate = self.cursor.execute(query, (domain,param)).fetchone()[1]
-                return candidate
-            except (IndexError, TypeError):
-                try:
-                    candidate = self.cursor.execute(query, ('*',param)).fetchone()[1]
-                    return candidate
-                except (IndexError, TypeError): return False
-                
+        """Return the value of a parameter for a name, or False if it’s not set."""
+        return self.getParameters([name], param).get(name, False)
+
+    def getParameters(self, names, param):
+        """Resolve a parameter for many names at once. A name inherits the value set for its domain, then the one set for “*”.
+           Return a dictionary of the names having a value."""
+        values = self.parameterValues(param)
+        resolved = {}
+        for name in names:
+            if name in values: resolved[name] = values[name]
+            else:
+                try: domain = name.split('.',1)[1]
+                except (IndexError, AttributeError): domain = None
+                if domain in values: resolved[name] = values[domain]
+                elif '*' in values: resolved[name] = values['*']
+        return resolved
+
+    def parameterValues(self, param):
+        """Return a dictionary of the values of a parameter by name. It’s loaded once, until the parameter is set again."""
+        if param not in self.parameters:
+            query = """SELECT name, value FROM param WHERE param = ?"""
+            self.parameters[param] = dict(self.cursor.execute(query, (param,)).fetchall())
+        return self.parameters[param]
+
     def setParameter(self, name, param, value):
         try:
             query = """INSERT INTO param (name,param,value) VALUES (?,?,?)"""
@@ -508,6 +988,7 @@ class SQLite:
             pass
         query = """UPDATE param SET value = ? WHERE name = ? AND param = ?"""
         self.cursor.execute(query,(value,name,param))
+        self.parameters.pop(param, None)
 
 
         
@@ -4,34 +4,130 @@
 import sys
 try:
     from os import chmod
-    from multiprocessing import Process, Queue
+    from Scheduler import Scheduler
+    from Host import Host
     from cryptography.hazmat.primitives import serialization as crypto_serialization
     from cryptography.hazmat.primitives.asymmetric import rsa
     from cryptography.hazmat.backends import default_backend as crypto_default_backend
     from time import time, strftime
     from hashlib import sha512 as blake2b
-    from signal import SIGALRM
-    from time import time
     import paramiko
     from socket import timeout
     from io import StringIO
-    import signal
     from getpass import getpass
     from binascii import b2a_base64
+    from collections import OrderedDict
+    from contextlib import contextmanager
+    from threading import Condition
+    import select
+    import Metrics
 
 except ImportError as e:
     print(str(e), file=sys.stderr)
     print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
     sys.exit(1)
 
-def chunks(l, n):
-    """Yield successive n-sized chunks from list l."""
-    for i in range(0, len(l), n): yield l[i:i + n]
-
 class WithdrawException(Exception):
     
     def __init__(self, message): super().__init__(message)
 
+class Output:
+    """Bounded capture of a command output stream: the first `limit` bytes are kept, the next ones are only counted."""
+
+    def __init__(self, limit = 1048576):
+
+        self.limit   = int(limit)
+        self.chunks  = []
+        self.size    = 0
+        self.dropped = 0
+
+    def write(self, data):
+
+        keep = data[:max(0, self.limit - self.size)]
+        if keep:
+            self.chunks.append(keep)
+            self.size += len(keep)
+        self.dropped += len(data) - len(keep)
+
+    def lines(self):
+        """Return the captured output as a list of stripped lines, with a truncation marker if some bytes were dropped."""
+        lines = [line.strip() for line in b''.join(self.chunks).decode('utf-8', 'replace').splitlines()]
+        if self.dropped: lines.append('[… {} bytes truncated]'.format(self.dropped))
+        return lines
+
+class ConnectionPool:
+    """Authenticated SSH connections kept open, to be shared by several commands, SFTP transfers and deploy steps.
+       Connections are keyed by (user, host, key). The ones idle for more than `idle_timeout` seconds are closed.
+       When `max_connections` are open, the least recently used idle one is closed, or the caller waits for one to be released."""
+
+    def __init__(self, max_connections = 64, idle_timeout = 300, logger = None):
+
+        self.max_connections = max(1, int(max_connections))
+        self.idle_timeout = float(idle_timeout)
+        self.logger = logger
+        self.connections = OrderedDict() # key → [client, users, last use]
+        self.condition = Condition()
+
+    def __repr__(self): return 'SSHPool'
+
+    def __len__(self): return len(self.connections)
+
+    def acquire(self, key, connect):
+        """Return an open connection for key, calling connect() to open it if needed. It must be released after use."""
+        with self.condition:
+            while True:
+                entry = self.connections.get(key)
+                if entry and entry[0] is None: pass # Being opened by another thread.
+                elif entry and entry[0].get_transport() and entry[0].get_transport().is_active():
+                    entry[1] += 1
+                    self.connections.move_to_end(key)
+                    return entry[0]
+                elif entry and entry[1] == 0: self.close(key)
+                if not entry or entry[1] == 0:
+                    self.evict()
+                    if len(self.connections) < self.max_connections:
+                        self.connections[key] = [None, 1, time()]
+                        break
+                self.condition.wait(1)
+        try: client = connect()
+        except BaseException:
+            with self.condition:
+                del self.connections[key]
+                self.condition.notify_all()
+            raise
+        with self.condition:
+            self.connections[key][0] = client
+            self.condition.notify_all()
+        if self.logger: self.logger.log('Connected to {}@{} ({} connections open).'.format(key[0], key[1], len(self.connections)), 0)
+        return client
+
+    def release(self, key, discard = False):
+        """Give a connection back to the pool. It’s closed if discard is True (after an error)."""
+        with self.condition:
+            entry = self.connections.get(key)
+            if not entry: return
+            entry[1] -= 1
+            entry[2] = time()
+            if discard and entry[1] == 0: self.close(key)
+            self.condition.notify_all()
+
+    def evict(self):
+        """Close the idle connections which timed out, then the least recently used idle ones while the pool is full."""
+        now = time()
+        for key, (client, users, last_use) in list(self.connections.items()):
+            if users > 0: continue
+            if now - last_use > self.idle_timeout or len(self.connections) >= self.max_connections: self.close(key)
+
+    def close(self, key):
+
+        client = self.connections.pop(key)[0]
+        if client: client.close()
+
+    def closeAll(self):
+
+        with self.condition:
+            for key in list(self.connections.keys()): self.close(key)
+
 class SSHClient:
     """SSH client."""
 
@@ -40,12 +136,17 @@ class SSHClient:
 
         self.configuration = configuration
         default_ssh_configuration = {
+            'port': 22,
             'client_timeout': 30,
             'auth_timeout': 30,
             'banner_timeout': 30,
             'exec_timeout': 60,
             'default_key': './osmdb_id',
-            'default_pubkey': './osmdb_id.pub'
+            'default_pubkey': './osmdb_id.pub',
+            'max_connections': 64,
+            'idle_timeout': 300,
+            'read_size': 32768,
+            'max_output': 1048576
         }
         self.configuration['ssh'] = self.configuration.get('ssh', default_ssh_configuration)
         self.configuration['exec_timeout'] = self.configuration.get('exec_timeout', 60)
@@ -56,17 +157,59 @@ class SSHClient:
         if not self.key: self.newkey()
         message = 'Using key "{}"'.format(self.keyhash())
         logger.log(message, 1)
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        self.client.load_system_host_keys()
+        self.pool = ConnectionPool(self.configuration['ssh'].get('max_connections', 64), self.configuration['ssh'].get('idle_timeout', 300), logger)
 
     def __str__(self):
         return 'SSH'
 
-    def handleSignal(self, signum, frame):
-        
-        if signum == SIGALRM: raise WithdrawException('Execution was still running after {} seconds.'.format(self.configuration['exec_timeout']))
-        else: raise Exception('Signal: '+str(signum)+' at: '+str(frame))
+    def close(self): self.pool.closeAll()
+
+    def connect(self, host, user, password = None):
+        """Open a new connection to host, authenticated by password if one is given, else by key."""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.load_system_host_keys()
+        if password: auth = {'password': password}
+        else: auth = self.hostKey(host)
+        client.connect(host.hostname, port=int(self.configuration['ssh'].get('port', 22)), username=user, timeout=float(self.configuration['ssh']['client_timeout']),
+                       banner_timeout=float(self.configuration['ssh']['banner_timeout']), auth_timeout=float(self.configuration['ssh']['auth_timeout']), **auth)
+        return client
+
+    @contextmanager
+    def session(self, host, user, password = None):
+        """Borrow a pooled connection to host. It’s discarded if an error occurs while it’s used."""
+        if password: key = (user, host.hostname, 'password')
+        else: key = (user, host.hostname, getattr(host, 'key_file', None))
+        client = self.pool.acquire(key, lambda: self.connect(host, user, password))
+        try: yield client
+        except BaseException:
+            self.pool.release(key, discard=True)
+            raise
+        self.pool.release(key)
+
+    def run(self, client, cmdline):
+        """Run a command on a new channel of an open connection. Return (return_code, stdout, stderr), outputs being lists of lines.
+           Outputs are read as they come, in chunks of `ssh.read_size` bytes. Only the first `ssh.max_output` bytes of each are kept."""
+        exec_timeout = float(self.configuration['exec_timeout'])
+        read_size = int(self.configuration['ssh'].get('read_size', 32768))
+        stdout = Output(self.configuration['ssh'].get('max_output', 1048576))
+        stderr = Output(self.configuration['ssh'].get('max_output', 1048576))
+        deadline = time() + exec_timeout
+        channel = client.get_transport().open_session(timeout=exec_timeout)
+        try:
+            channel.exec_command(cmdline)
+            channel.shutdown_write()
+            while True:
+                while channel.recv_ready(): stdout.write(channel.recv(read_size))
+                while channel.recv_stderr_ready(): stderr.write(channel.recv_stderr(read_size))
+                # The exit status comes after the output on the channel.
+                if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready(): break
+                if channel.closed: break
+                remaining = deadline - time()
+                if remaining <= 0: raise WithdrawException('Execution was still running after {} seconds.'.format(exec_timeout))
+                select.select([channel], [], [], remaining)
+            return (channel.recv_exit_status(), stdout.lines(), stderr.lines())
+        finally: channel.close()
 
     def newkey(self):
         """Generate a RSA key."""
@@ -115,91 +258,86 @@ class SSHClient:
 
         return h.hexdigest()
 
-    def _execute(self, host, cmdline, q):
-        """Execute a command on a host and put the result in a queue."""
-        start  = time()
-        try:
-            exec_status = ''
-            return_code = 0
-            self.client.connect(host.hostname, username=host.user, pkey=self.sshkey(), timeout=float(self.configuration['ssh']['client_timeout']),
-                                banner_timeout=float(self.configuration['ssh']['banner_timeout']), auth_timeout=float(self.configuration['ssh']['auth_timeout']))
-            std    = self.client.exec_command(cmdline, timeout=float(self.configuration['ssh']['exec_timeout']))
-            signal.alarm(int(self.configuration['exec_timeout']))
-            signal.signal(signal.SIGALRM, self.handleSignal)
-            self.logger.log('{}@{}> {}'.format(host.user,host.hostname,cmdline), 0)
-            return_code = std[1].channel.recv_exit_status()
-            stdout = list(std[1])
-            stderr = list(std[2])
-            end    = time()
-            q.put((host.user, host, cmdline, return_code, map(str.strip,stdout), map(str.strip,stderr), exec_status, start, end))
-            self.client.close()
-
-        except (paramiko.ssh_exception.AuthenticationException,
-                paramiko.ssh_exception.NoValidConnectionsError,
-                paramiko.ssh_exception.SSHException,
-                timeout,OSError,EOFError,ConnectionResetError,AttributeError) as error:
-            end = time()
-            self.logger.log('[{}@{}] `{}` {}'.format(host.user,host.hostname,cmdline,error),3)
-            q.put((host.user , host, cmdline, -1, [], [], str(error), start, end))
-            self.client.close()
-            return False
-            
-        except WithdrawException as error:
+    def _execute(self, host, cmdlines):
+        """Execute commands on a host, over a single connection, and return the list of results."""
+        runs = []
+        for cmdline in cmdlines:
+            start  = time()
+            try:
+                exec_status = ''
+                with self.session(host, host.user) as client:
+                    self.logger.log('{}@{}> {}'.format(host.user,host.hostname,cmdline), 0)
+                    return_code, stdout, stderr = self.run(client, cmdline)
+                end    = time()
+                Metrics.probe_seconds.observe(end - start, probe='ssh')
+                runs.append((host.user, host, cmdline, return_code, stdout, stderr, exec_status, start, end))
+
+            except WithdrawException as error:
+
+                end = time()
+                exec_status = 'Execution discarded: {}'.format(error)
+                Metrics.probe_timeouts.inc(probe='ssh')
+                self.logger.log('[{}@{}] `{}` {}'.format(host.user, host.hostname, cmdline, exec_status),3)
+                runs.append((host.user, host, cmdline, -2, [], [], exec_status, start, end))
+
+            except (paramiko.ssh_exception.AuthenticationException,
+                    paramiko.ssh_exception.NoValidConnectionsError,
+                    paramiko.ssh_exception.SSHException,
+                    timeout,OSError,EOFError,ConnectionResetError,AttributeError) as error:
+                end = time()
+                if isinstance(error, timeout): Metrics.probe_timeouts.inc(probe='ssh')
+                else: Metrics.probe_errors.inc(probe='ssh')
+                self.logger.log('[{}@{}] `{}` {}'.format(host.user,host.hostname,cmdline,error),3)
+                runs.append((host.user , host, cmdline, -1, [], [], str(error), start, end))
 
-            end = time()
-            exec_status = 'Execution discarded: {}'.format(error)
-            self.logger.log('[{}@{}] `{}` {}'.format(host.user, host.hostname, cmdline, exec_status),3)
-            q.put((host.user, host, cmdline, -2, [], [], 'Execution discarded: {}'.format(error), start, end))
-            self.client.close()
-            return False  
+        return runs
 
-        return True
+    def hostKey(self, host):
+        """Return the key argument of a connection to host: its own key file if it has one, else the OSMDB key."""
+        if getattr(host, 'key_file', None): return {'key_filename': host.key_file}
+        else: return {'pkey': self.sshkey()}
 
     def hostUser(self,hostname):
         """Return the user to use for a given host. TODO: check in database for overriding."""
         return self.configuration['ssh']['default_user']
 
-    def execute(self, cmdline, hosts):
-        """Execute a command on hosts in parallel."""
-        q = Queue()
-        runs = []
-        processes = []
-        if cmdline is '': return []
+    def execute(self, cmdlines, hosts):
+        """Execute a command, or a list of commands, on hosts in parallel. The commands of a host share one connection.
+           Yield the list of results of each host as soon as it’s done."""
+        if isinstance(cmdlines, str): cmdlines = [cmdlines]
+        cmdlines = [cmdline for cmdline in cmdlines if cmdline != '']
+        if not cmdlines: return
         try: chunk_size = int(self.configuration['ssh']['chunk_size'])
         except KeyError: chunk_size = 4
-        self.logger.log('Executing `{}` on {} hosts in chunks of {} hosts.'.format(cmdline,len(hosts),chunk_size),0)
-        chunk_k = 1
-        for chunk in chunks(hosts, chunk_size):
-            nb_hosts = len(chunk)
-            self.logger.log('Chunk #{:<3} {}'.format(chunk_k,', '.join(map(str,chunk))),0)
-            for host in chunk:
-                host.user = self.configuration['ssh']['default_user']
-                proc = Process(target=self._execute, args=(host, cmdline, q))
-                proc.start()
-                processes.append(proc)
-            for p in processes: p.join()
-            for _ in range(0, nb_hosts):
-                runs.append(q.get())
-            chunk_k += 1
-
-        return runs
+        self.logger.log('Executing `{}` on {} hosts, {} at a time.'.format('`, `'.join(cmdlines),len(hosts),chunk_size),0)
+        scheduler = Scheduler(chunk_size, self.timeout(len(cmdlines)), self.logger, threads=True, name='ssh')
+        for host in hosts:
+            if not getattr(host, 'user', None): host.user = self.configuration['ssh']['default_user']
+            scheduler.submit(self._execute, (host, cmdlines), key=host,
+                             fallback=lambda task, reason: [(task.key.user, task.key, cmdline, -2, [], [], 'Execution discarded: {}'.format(reason), task.start, time()) for cmdline in cmdlines])
+        for _, host_runs in scheduler.run(): yield host_runs
+
+    def timeout(self, commands = 1):
+        """Deadline of a task: connection, authentication and execution timeouts, plus some slack."""
+        ssh = self.configuration['ssh']
+        return float(ssh['client_timeout']) + float(ssh['banner_timeout']) + float(ssh['auth_timeout']) + float(self.configuration['exec_timeout']) * commands + 5
 
     def executeScripts(self, hostname, scripts):
-        """Copy and execute some shell scripts on a host."""
+        """Copy and execute some shell scripts on a host, over a single connection."""
+        user = self.hostUser(hostname)
+        host = Host((hostname, hostname, hostname))
+        host.user = user
         try:
             executions = []
-            user = self.hostUser(hostname)
-            transport = paramiko.Transport((hostname, 22))
-            transport.connect(username=user, pkey=self.sshkey())
-            sftp = paramiko.SFTPClient.from_transport(transport)
-            for script in scripts:
-                localname = self.configuration['host_dir']+'/'+hostname+'/'+script+'.sh'
-                remotename = '/tmp/'+script+'.sh'
-                sftp.put(localname, remotename)
-                executions.append(self.execute('sh '+remotename, [hostname]))
-                sftp.remove(remotename)
-            sftp.close()
-            transport.close()
+            with self.session(host, user) as client:
+                sftp = client.open_sftp()
+                for script in scripts:
+                    localname = self.configuration['host_dir']+'/'+hostname+'/'+script+'.sh'
+                    remotename = '/tmp/'+script+'.sh'
+                    sftp.put(localname, remotename)
+                    executions += self._execute(host, ['sh '+remotename])
+                    sftp.remove(remotename)
+                sftp.close()
             return executions
 
         except (paramiko.ssh_exception.AuthenticationException,
@@ -208,16 +346,11 @@ class SSHClient:
                 timeout,OSError,EOFError,ConnectionResetError,AttributeError) as error:
 
             self.logger.log('['+user+'@'+hostname+'] `'+str(scripts)+'` '+str(error),3)
-            try:
-                sftp.close()
-                transport.close()
-            except Exception: pass
-            self.client.close()
             return [(user, hostname, scripts, str(error))]
 
-    def _deploy(self, key, user, host, password, q):
+    def _deploy(self, key, user, host, password):
         """Connect to remote host using password, to put the client key in ~/.ssh/authorized_keys.
-           Put result in queue.
+           Return the result.
            It roughly works like the "ssh-copy-id" OpenSSL command."""
         pubkey = self.pubkey()
         start = time()
@@ -225,26 +358,21 @@ class SSHClient:
         return_code = 0
         try:
 
-            self.client.connect(host.hostname, username=user, password=password, timeout=float(self.configuration['ssh']['client_timeout']),
-                                                                        banner_timeout=float(self.configuration['ssh']['banner_timeout']),
-                                                                        auth_timeout=float(self.configuration['ssh']['auth_timeout']))
-
-            self.client.exec_command('mkdir .ssh', timeout=float(self.configuration['ssh']['exec_timeout']))
-            self.client.exec_command('chmod 0700 .ssh', timeout=float(self.configuration['ssh']['exec_timeout']))
-            self.client.exec_command('echo "ssh-rsa '+pubkey+' ## OSMDB KEY ## '+strftime("%Y-%m-%d %H:%M:%S")+'" >> .ssh/authorized_keys', \
-                                              timeout=float(self.configuration['ssh']['exec_timeout']))
-            std = self.client.exec_command('chmod 0600 .ssh/authorized_keys', timeout=float(self.configuration['exec_timeout']))
-            signal.alarm(int(self.configuration['exec_timeout']))
-            signal.signal(signal.SIGALRM, self.handleSignal)
-            stdout = list(std[1])
-            stderr = list(std[2])
-            return_code = std[1].channel.recv_exit_status()
+            with self.session(host, user, password) as client:
+                self.run(client, 'mkdir -p .ssh')
+                self.run(client, 'chmod 0700 .ssh')
+                self.run(client, 'echo "ssh-rsa '+pubkey+' ## OSMDB KEY ## '+strftime("%Y-%m-%d %H:%M:%S")+'" >> .ssh/authorized_keys')
+                return_code, stdout, stderr = self.run(client, 'chmod 0600 .ssh/authorized_keys')
 
             end = time()
             self.logger.log('Key {} deployed for {}@{}'.format(b2a_base64(key.get_fingerprint()).decode('utf-8').strip(),user,host.hostname),1)
-            q.put((user, host, return_code, stdout, stderr, exec_status, start, end))
-            self.client.close()
-            return True
+            return (user, host, return_code, stdout, stderr, exec_status, start, end)
+
+        except WithdrawException as error:
+
+            end = time()
+            self.logger.log('Deployement for {}@{} reached timemout! ({})'.format(user, host, error),3)
+            return (user, host, -2, [], [], str(error), start, end)
 
         except (paramiko.ssh_exception.AuthenticationException,
                 paramiko.ssh_exception.NoValidConnectionsError,
@@ -253,38 +381,19 @@ class SSHClient:
             
             end = time()
             self.logger.log('Error in deployement for {}@{}: {}'.format(user, host, e), 3)
-            q.put((user, host, -1, [], [], str(e), start, end))
-            self.client.close()
-            return False
-
-        except WithdrawException as error:
-
-            end = time()
-            self.logger.log('Deployement for {}@{} reached timemout! ('+str(error)+')',3)
-            q.put((user, host, -2, [], [], str(error), start, end))
-            self.client.close()
-            return False  
+            return (user, host, -1, [], [], str(e), start, end)
 
     def deploy(self, key, hosts):
         
-        q = Queue()
         runs = []
-        processes = []
         try: chunk_size = int(self.configuration['ssh']['chunk_size'])
         except KeyError: chunk_size = 4
-        self.logger.log('Deploying key {} on {} hosts in chunks of {} hosts.'.format(b2a_base64(key.get_fingerprint()).decode('utf-8').strip(),len(hosts),chunk_size),0)
-        chunk_k = 1
+        self.logger.log('Deploying key {} on {} hosts, {} at a time.'.format(b2a_base64(key.get_fingerprint()).decode('utf-8').strip(),len(hosts),chunk_size),0)
         password = getpass('Password: ')
-        for chunk in chunks(hosts, chunk_size):
-            nb_hosts = len(chunk)
-            self.logger.log('Chunk #{:<3} {}'.format(chunk_k,', '.join(map(str,chunk))),0)
-            for host in chunk:
-                proc = Process(target=self._deploy, args=(key, host.user, host, password, q))
-                proc.start()
-                processes.append(proc)
-            for p in processes: p.join()
-            for _ in range(0, nb_hosts):
-                runs.append(q.get())
-            chunk_k += 1
+        scheduler = Scheduler(chunk_size, self.timeout(4), self.logger, threads=True)
+        for host in hosts:
+            scheduler.submit(self._deploy, (key, host.user, host, password), key=host,
+                             fallback=lambda task, reason: (task.key.user, task.key, -2, [], [], reason, task.start, time()))
+        for _, run in scheduler.run(): runs.append(run)
 
         return runs
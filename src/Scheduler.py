@@ -0,0 +1,165 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB work scheduler."""
+import sys
+try:
+    import signal
+    from time import time
+    from collections import deque
+    from multiprocessing import Process, Pipe
+    from multiprocessing.connection import wait
+    from threading import Thread
+    from queue import Queue, Empty
+    import Logger
+    import Metrics
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+def _run(conn, target, args):
+    """Run target in a child process and send its result (or the error) to the parent, with the metrics it recorded."""
+    Metrics.registry.reset()
+    # A child is terminated by SIGTERM, whatever handler its parent set.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    try: conn.send((True, target(*args), Metrics.registry.snapshot()))
+    except KeyboardInterrupt: pass
+    except Exception as e: conn.send((False, '{}: {}'.format(type(e).__name__, e), Metrics.registry.snapshot()))
+    finally: conn.close()
+
+def _thread(queue, task):
+    """Run target in a thread and put the task, with its result (or the error), in queue."""
+    try: queue.put((task, True, task.target(*task.args)))
+    except Exception as e: queue.put((task, False, '{}: {}'.format(type(e).__name__, e)))
+
+class Task:
+    """A call to run in a child process or a thread. `fallback(task, reason)` gives the result of a task which timed out, failed or was cancelled."""
+
+    def __init__(self, target, args = (), key = None, timeout = None, fallback = None):
+
+        self.target   = target
+        self.args     = args
+        self.key      = key
+        self.timeout  = timeout
+        self.fallback = fallback
+        self.queued   = time()
+        self.start    = None
+        self.deadline = None
+        self.proc     = None
+        self.conn     = None
+
+    def __repr__(self): return str(self.key)
+
+class Scheduler:
+    """Run tasks in child processes (or threads) with at most `slots` of them in flight.
+       A task is started as soon as a slot frees up, so a slow task only holds its own slot.
+       A task still running past its deadline is terminated; a thread can’t be, so its late result is ignored.
+       The tasks in flight and the time they waited for a slot are recorded under the name of the scheduler."""
+
+    def __init__(self, slots = 32, timeout = None, logger = Logger.Logger(), threads = False, name = 'tasks'):
+
+        self.slots     = max(1, int(slots))
+        self.timeout   = timeout
+        self.logger    = logger
+        self.threads   = threads
+        self.name      = name
+        self.queued    = deque()
+        self.running   = set()
+        self.results   = Queue()
+        self.cancelled = False
+
+    def __repr__(self): return 'Scheduler'
+
+    def submit(self, target, args = (), key = None, timeout = None, fallback = None):
+        """Queue a call to target(*args). The scheduler timeout is used if no timeout is given."""
+        if timeout is None: timeout = self.timeout
+        task = Task(target, args, key, timeout, fallback)
+        self.queued.append(task)
+        return task
+
+    def cancel(self):
+        """Do not start any more task and terminate the running ones."""
+        self.cancelled = True
+
+    def __len__(self): return len(self.queued) + len(self.running)
+
+    def start(self, task):
+
+        task.start = time()
+        Metrics.queue_wait_seconds.observe(task.start - task.queued, scheduler=self.name)
+        if task.timeout: task.deadline = task.start + float(task.timeout)
+        if self.threads:
+            task.proc = Thread(target=_thread, args=(self.results, task), daemon=True)
+            task.proc.start()
+        else:
+            # The child sends its log records to the logger of this process.
+            self.logger.share()
+            reader, writer = Pipe(duplex=False)
+            task.conn = reader
+            task.proc = Process(target=_run, args=(writer, task.target, task.args))
+            task.proc.start()
+            writer.close()
+        self.running.add(task)
+        Metrics.in_flight.set(len(self.running), probe=self.name)
+
+    def stop(self, task):
+        """Forget a running task, terminating its process if it has one."""
+        self.running.discard(task)
+        Metrics.in_flight.set(len(self.running), probe=self.name)
+        if self.threads: return
+        if task.proc.is_alive(): task.proc.terminate()
+        task.proc.join()
+        task.conn.close()
+
+    def wait(self, timeout):
+        """Wait for some running tasks to finish. Return a list of (task, ok, result) tuples."""
+        done = []
+        if self.threads:
+            try:
+                done.append(self.results.get(timeout=timeout))
+                while True: done.append(self.results.get_nowait())
+            except Empty: pass
+            # Results of the tasks which already timed out are dropped.
+            return [item for item in done if item[0] in self.running]
+        by_conn = {task.conn: task for task in self.running}
+        for conn in wait(list(by_conn.keys()), timeout):
+            task = by_conn[conn]
+            try:
+                ok, result, metrics = conn.recv()
+                Metrics.registry.merge(metrics)
+            except (EOFError, OSError):
+                task.proc.join()
+                ok, result = False, 'Process exited with code {}'.format(task.proc.exitcode)
+            done.append((task, ok, result))
+        return done
+
+    def finish(self, task, ok = False, result = None):
+        """Reap a task and return its result, or its fallback result if it did not succeed (result being the reason)."""
+        self.stop(task)
+        if ok: return result
+        self.logger.log('Task {}: {}'.format(task.key, result), 3)
+        return task.fallback(task, result) if task.fallback else None
+
+    def run(self):
+        """Run the queued tasks. Yield (key, result) couples as soon as each task finishes."""
+        try:
+            while self.queued or self.running:
+                if self.cancelled:
+                    self.queued.clear()
+                    for task in list(self.running): yield (task.key, self.finish(task, False, 'Cancelled'))
+                    break
+                while self.queued and len(self.running) < self.slots: self.start(self.queued.popleft())
+                deadlines = [task.deadline for task in self.running if task.deadline]
+                timeout = max(0, min(deadlines) - time()) if deadlines else None
+                for task, ok, result in self.wait(timeout):
+                    yield (task.key, self.finish(task, ok, result))
+                now = time()
+                for task in [task for task in self.running if task.deadline and task.deadline <= now]:
+                    yield (task.key, self.finish(task, False, 'Still running after {} seconds'.format(task.timeout)))
+        except (KeyboardInterrupt, GeneratorExit):
+            self.queued.clear()
+            for task in list(self.running): self.stop(task)
+            raise
+
+if __name__ == '__main__': sys.exit(100)
@@ -0,0 +1,153 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB ICMP sweep engine."""
+import sys
+try:
+    import socket
+    from socket import AF_INET, AF_INET6
+    import struct
+    import select
+    import random
+    from time import time
+    from collections import deque
+    from Host import csum, fold, icmpSocket, pingGroupAllowed
+    import Logger
+
+except ImportError as e:
+    print(str(e), file=sys.stderr)
+    print('Cannot find the module(s) listed above. Exiting.', file=sys.stderr)
+    sys.exit(1)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY   = 0
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY   = 129
+PAYLOAD = b'OSMDB'
+
+class Sweep:
+    """Send ICMP echo requests to many addresses from a single socket, at a paced rate.
+       Replies are matched by source address, ICMP identifier and sequence number: host names must be resolved
+       beforehand, a (name, address) couple standing for a host whose address is known.
+       Without the privilege to open a raw socket, a datagram ICMP socket is used: the kernel then
+       chooses the identifier and only the sequence number is matched.
+       IPv6 addresses are pinged with ICMPv6 from a socket of their own, opened when the first one comes."""
+
+    def __init__(self, rate = 1000, timeout = 2, window = 4096, logger = Logger.Logger()):
+
+        self.rate    = max(1, int(rate))
+        self.timeout = float(timeout)
+        self.window  = max(1, int(window))
+        self.logger  = logger
+        self.ident   = random.SystemRandom().randrange(0, 65536)
+        self.raw     = {} # family → raw socket or not
+        # Sum of the constant words of every packet (type, code and payload), computed once.
+        self.base_sum = csum(struct.pack('!BBH', ICMP_ECHO_REQUEST, 0, 0) + PAYLOAD)
+
+    def __repr__(self): return 'Sweep'
+
+    def socket(self, family = AF_INET):
+        """Return a non-blocking ICMP socket of a family, raw if allowed."""
+        try: conn, self.raw[family] = icmpSocket(family)
+        except PermissionError as e:
+            if not pingGroupAllowed(): e.strerror = '{} (raw sockets need CAP_NET_RAW, datagram ICMP sockets need one of our groups in sysctl net.ipv4.ping_group_range)'.format(e.strerror)
+            raise
+        if not self.raw[family]: self.logger.log('No raw socket allowed, using a datagram ICMP socket.', 0)
+        conn.setblocking(False)
+        try: conn.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except OSError: pass
+        return conn
+
+    def packet(self, ident, seq, family = AF_INET):
+        """Build an echo request. Only the identifier and sequence words are summed per packet.
+           The kernel computes the checksum of ICMPv6 packets."""
+        ids = struct.pack('!HH', ident, seq)
+        if family == AF_INET6: return struct.pack('!BBH', ICMP6_ECHO_REQUEST, 0, 0) + ids + PAYLOAD
+        return struct.pack('!BB', ICMP_ECHO_REQUEST, 0) + fold(self.base_sum + csum(ids)) + ids + PAYLOAD
+
+    def parse(self, data, family = AF_INET):
+        """Return (ident, seq) of an echo reply, or None for any other packet. Raw ICMPv6 sockets get no IP header."""
+        try:
+            if self.raw[family] and family == AF_INET: ihl = (data[0] & 0x0F) * 4
+            else: ihl = 0
+            icmp_type, _, _, ident, seq = struct.unpack_from('!BBHHH', data, ihl)
+        except (IndexError, struct.error): return None
+        if icmp_type != (ICMP6_ECHO_REPLY if family == AF_INET6 else ICMP_ECHO_REPLY): return None
+        if not self.raw[family]: ident = 0
+        return (ident, seq)
+
+    def run(self, addresses):
+        """Ping every address, or (name, address) couple, once. Yield (address, delay), or (name, delay), as soon as a reply
+           is received or the request timed out, delay being -1 in the latter case."""
+
+        interval = 1.0 / self.rate
+        pending  = {}      # (address, ident, seq) → (send time, name)
+        expiry   = deque() # (deadline, key), in send order thus in deadline order
+        index    = 0
+        retry    = None
+        addresses = iter(addresses)
+        exhausted = False
+        sockets   = {AF_INET: self.socket()} # family → socket
+        try:
+            next_send = time()
+            while not exhausted or pending:
+                now = time()
+                # Send the requests which are due, without exceeding the window.
+                while not exhausted and now >= next_send and len(pending) < self.window:
+                    if retry: name, address = retry
+                    else:
+                        try: target = next(addresses)
+                        except StopIteration:
+                            exhausted = True
+                            break
+                        if isinstance(target, tuple): name, address = target
+                        else: name = address = str(target)
+                    family = AF_INET6 if ':' in address else AF_INET
+                    if family not in sockets: sockets[family] = self.socket(family)
+                    ident = (self.ident + (index >> 16)) & 0xFFFF
+                    seq = index & 0xFFFF
+                    try: sockets[family].sendto(self.packet(ident, seq, family), (address, 0))
+                    except (BlockingIOError, InterruptedError):
+                        retry = (name, address)
+                        next_send = now + interval
+                        break
+                    except OSError as e:
+                        if e.errno == 105: # ENOBUFS: try again later.
+                            retry = (name, address)
+                            next_send = now + interval
+                            break
+                        self.logger.log('{}: {}'.format(name, e), 0)
+                        retry = None
+                        index += 1
+                        yield (name, -1)
+                        continue
+                    retry = None
+                    if not self.raw[family]: ident = 0
+                    key = (address, ident, seq)
+                    pending[key] = (now, name)
+                    expiry.append((now + self.timeout, key))
+                    index += 1
+                    next_send += interval
+                    # Do not try to catch up after a stall, it would burst.
+                    if next_send < now - interval: next_send = now
+                # Expire the requests which got no reply.
+                while expiry and expiry[0][0] <= now:
+                    _, key = expiry.popleft()
+                    sent = pending.pop(key, None)
+                    if sent is not None: yield (sent[1], -1)
+                if exhausted and not pending: break
+                # Wait for replies until something else is due.
+                if not exhausted and len(pending) < self.window: wait = next_send - now
+                else: wait = expiry[0][0] - now
+                for conn in select.select(list(sockets.values()), [], [], max(0, wait))[0]:
+                    while True:
+                        try: data, source = conn.recvfrom(65536)
+                        except (BlockingIOError, InterruptedError): break
+                        received = time()
+                        ids = self.parse(data, conn.family)
+                        if not ids: continue
+                        sent = pending.pop((source[0], ids[0], ids[1]), None)
+                        if sent is not None: yield (sent[1], received - sent[0])
+        finally:
+            for conn in sockets.values(): conn.close()
+
+if __name__ == '__main__': sys.exit(100)
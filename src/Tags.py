@@ -0,0 +1,77 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB tag queries.
+
+A tag query combines tags with `&` (and), `|` (or), `!` (not) and parentheses, `&` binding tighter than `|`:
+
+    linux&(web|db)&!decommissioned
+"""
+import sys
+import re
+
+token_re = re.compile(r'\s*(?:([a-zA-Z0-9.\-]{1,128})|(.))')
+
+def tokenize(expression):
+    """Yield the tokens of a tag query: tag names and operators."""
+    for match in token_re.finditer(expression.strip()):
+        if match.group(1): yield ('tag', match.group(1))
+        elif match.group(2) in '&|!()': yield (match.group(2), match.group(2))
+        else: raise ValueError('Unexpected character “{}” in tag query.'.format(match.group(2)))
+
+class TagQuery:
+    """Compile a tag query into a single parameterized SQL condition on a host name, `fqdn`."""
+
+    def __init__(self, expression):
+
+        self.expression = expression
+        self.tokens = list(tokenize(expression))
+        self.position = 0
+        self.params = []
+        self.condition = self.parseOr()
+        if self.position < len(self.tokens): raise ValueError('Unexpected “{}” in tag query.'.format(self.tokens[self.position][1]))
+
+    def __repr__(self): return self.expression
+
+    def peek(self):
+        try: return self.tokens[self.position][0]
+        except IndexError: return None
+
+    def take(self, kind):
+        if self.peek() != kind: raise ValueError('Expected “{}” in tag query “{}”.'.format(kind, self.expression))
+        self.position += 1
+        return self.tokens[self.position - 1][1]
+
+    def parseOr(self):
+        terms = [self.parseAnd()]
+        while self.peek() == '|':
+            self.take('|')
+            terms.append(self.parseAnd())
+        if len(terms) == 1: return terms[0]
+        return '(' + ' OR '.join(terms) + ')'
+
+    def parseAnd(self):
+        factors = [self.parseNot()]
+        while self.peek() == '&':
+            self.take('&')
+            factors.append(self.parseNot())
+        if len(factors) == 1: return factors[0]
+        return '(' + ' AND '.join(factors) + ')'
+
+    def parseNot(self):
+        if self.peek() == '!':
+            self.take('!')
+            return 'NOT ' + self.parseNot()
+        if self.peek() == '(':
+            self.take('(')
+            condition = self.parseOr()
+            self.take(')')
+            return condition
+        self.params.append(self.take('tag'))
+        return 'fqdn IN (SELECT host FROM host_tag WHERE tag = ?)'
+
+    def sql(self):
+        """Return the (query, parameters) couple selecting the FQDN of the matching hosts: those of the host table,
+           and the tagged names which were never swept."""
+        return ('SELECT fqdn FROM (SELECT fqdn FROM host WHERE fqdn NOT NULL UNION SELECT host FROM host_tag) WHERE {} ORDER BY fqdn'.format(self.condition), self.params)
+
+if __name__ == '__main__': sys.exit(100)
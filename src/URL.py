@@ -61,6 +61,9 @@ class URL(dict):
             self['certificate']   = url[12]
             self['expire']        = url[13]
             self['get_error']     = url[14]
+            self['digest']        = url[15]
+            self['fingerprint']   = url[16]
+            self['not_modified']  = url[17]
 
         except IndexError: pass # Let crash later…
 
@@ -0,0 +1,24 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""OSMDB tests. Run with `python3 -m pytest tests` from the top of the tree: the modules are imported from src/."""
+import sys
+from os import path
+sys.path.insert(0, path.join(path.dirname(path.abspath(__file__)), '..', 'src'))
+import pytest
+
+@pytest.fixture
+def logger():
+    """A logger writing to /dev/null. A logger closes its file when it’s deleted: it must not be the captured stderr."""
+    import os
+    import Logger
+    logger = Logger.Logger()
+    logger.setLogfile(os.devnull)
+    return logger
+
+@pytest.fixture
+def db(tmp_path, logger):
+    """An empty database, at the last schema version."""
+    from SQLite import SQLite
+    database = SQLite({'db_file': str(tmp_path / 'osmdb.db'), 'icons': {'host_up': '✓', 'host_down': '❌'}}, logger)
+    yield database
+    database.close()
@@ -0,0 +1,50 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Address ranges."""
+import ipaddress
+import pytest
+import Addresses
+
+@pytest.mark.parametrize('text', ['192.168.1.0/24', '10.0.0.0/30', '10.0.0.0/31', '10.0.0.1/32', '2001:db8::/120', '2001:db8::/127', '2001:db8::1/128'])
+def test_hostRange(text):
+    """The range is the one of ipaddress’ hosts()."""
+    net = Addresses.network(text)
+    hosts = list(net.hosts())
+    assert Addresses.hostRange(net) == (int(hosts[0]), int(hosts[-1]))
+
+def test_network():
+    with pytest.raises(ValueError): Addresses.network('192.168.1.1/24')
+    with pytest.raises(ValueError): Addresses.network('example.com')
+
+def test_conversions():
+    assert Addresses.ntoa(Addresses.aton('10.1.2.3')) == '10.1.2.3'
+    assert Addresses.ntoa(Addresses.aton('2001:db8::1'), 6) == '2001:db8::1'
+    assert Addresses.isAddress('10.1.2.3') and Addresses.isAddress('::1')
+    assert not Addresses.isAddress('localhost') and not Addresses.isAddress('10.1.2')
+
+def test_block():
+    block = Addresses.Block(Addresses.aton('10.0.0.254'), Addresses.aton('10.0.1.1'))
+    assert len(block) == 4
+    assert list(block) == ['10.0.0.254', '10.0.0.255', '10.0.1.0', '10.0.1.1']
+    assert block[0] == '10.0.0.254' and block[-1] == '10.0.1.1'
+    with pytest.raises(IndexError): block[4]
+    assert repr(block) == '10.0.0.254-10.0.1.1'
+    block = Addresses.Block(Addresses.aton('2001:db8::ffff'), Addresses.aton('2001:db8::1:0'), 6)
+    assert list(block) == ['2001:db8::ffff', '2001:db8::1:0']
+
+def test_blocks():
+    net = Addresses.network('192.168.1.0/24')
+    chunks = list(Addresses.blocks(net, 100))
+    assert [len(chunk) for chunk in chunks] == [100, 100, 54]
+    assert [address for chunk in chunks for address in chunk] == [str(host) for host in net.hosts()]
+    # Resume from an address, never before the first host.
+    chunks = list(Addresses.blocks(net, 100, Addresses.aton('192.168.1.250')))
+    assert [list(chunk) for chunk in chunks] == [['192.168.1.250', '192.168.1.251', '192.168.1.252', '192.168.1.253', '192.168.1.254']]
+    assert list(Addresses.blocks(net, 100, 1))[0][0] == '192.168.1.1'
+    assert list(Addresses.blocks(Addresses.network('10.0.0.1/32'), 100, 0))[0][0] == '10.0.0.1'
+
+def test_hitlist(tmp_path):
+    filename = tmp_path / 'hitlist'
+    filename.write_text('# Hit list\n2001:DB8::1  # router\n\n2001:db8:1::1\nexample.com\n10.0.0.1\n')
+    assert list(Addresses.hitlist(str(filename))) == ['2001:db8::1', '2001:db8:1::1', '10.0.0.1']
+    assert list(Addresses.hitlist(str(filename), ipaddress.ip_network('2001:db8::/48'))) == ['2001:db8::1']
@@ -0,0 +1,31 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Compressed, deduplicated storage of execution outputs and URL contents."""
+
+def blobs(db): return [row[0] for row in db.cursor.execute("""SELECT hash FROM blob ORDER BY hash""")]
+
+def execution(fqdn, stdout):
+    return {'user': 'root', 'host': fqdn, 'cmdline': 'uname', 'return_code': 0, 'stdout': stdout, 'stderr': '', 'status': 'OK', 'start': 0, 'end': 1}
+
+def test_blob_round_trip(db):
+    digest = db.putBlob('Linux\n' * 1000)
+    assert db.putBlob('Linux\n' * 1000) == digest
+    assert db.getBlob(digest) == 'Linux\n' * 1000
+    assert db.putBlob('') is None and db.getBlob(None) == ''
+
+def test_delete_executions_purges_their_blobs_only(db):
+    db.addExecutions([execution('a', 'Linux'), execution('b', 'Linux'), execution('b', 'BSD')])
+    orphan = db.putBlob('not referenced')
+    linux, bsd = db.putBlob('Linux'), db.putBlob('BSD')
+    db.deleteExecutions(['b'])
+    # The output a still refers to is kept, the other one deleted. Blobs of other rows are not looked at.
+    assert blobs(db) == sorted([linux, orphan])
+    db.deleteExecutions(['a'])
+    assert blobs(db) == [orphan]
+    assert bsd not in blobs(db)
+
+def test_delete_urls_purges_their_blobs(db):
+    for host, content in [('a', 'page'), ('b', 'page'), ('c', 'other')]:
+        db.cursor.execute("""INSERT INTO url (proto, host, path, port, content_hash) VALUES ('http', ?, '/', 80, ?)""", (host, db.putBlob(content)))
+    db.deleteURLs('host IN ("a", "c")')
+    assert blobs(db) == [db.putBlob('page')]
@@ -0,0 +1,78 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Sweep checkpoints."""
+import pytest
+from Checkpoint import Checkpoint
+from OSMDB import OSMDB
+
+def test_low_water_mark():
+    """The position only moves past a shard once all the shards started before it are over."""
+    checkpoint = Checkpoint('test')
+    assert checkpoint.start(10, None, 30) == 10
+    shards = [checkpoint.issue(range(10)) for _ in range(3)]
+    checkpoint.complete(shards[1])
+    assert (checkpoint.position, checkpoint.swept) == (10, 0)
+    checkpoint.complete(shards[0])
+    assert (checkpoint.position, checkpoint.swept) == (30, 20)
+    checkpoint.complete(shards[2])
+    assert (checkpoint.position, checkpoint.swept) == (40, 30)
+
+def test_span():
+    checkpoint = Checkpoint('test')
+    checkpoint.start(100, lambda shard: (shard[0], shard[-1]))
+    checkpoint.complete(checkpoint.issue([100, 150, 199]))
+    assert checkpoint.position == 200
+
+def test_save_and_resume(db):
+    checkpoint = Checkpoint('10.0.0.0/8')
+    checkpoint.start(2**64)
+    checkpoint.complete(checkpoint.issue(range(5)))
+    db.saveCheckpoint(checkpoint)
+    resumed = Checkpoint('10.0.0.0/8')
+    resumed.resume(db.sweepCursor('10.0.0.0/8'))
+    assert (resumed.start(0), resumed.swept) == (2**64 + 5, 5)
+
+@pytest.fixture
+def osmdb(db, logger):
+    """An OSMDB whose pingAddr returns the addresses it’s given instead of pinging them."""
+    osmdb = OSMDB({'ping_chunk_size': 2}, db, logger)
+    osmdb.pingAddr = lambda addresses, checkpoint = None: list(addresses)
+    return osmdb
+
+def test_ping_addresses_order(osmdb):
+    """Addresses come first, in numeric order, then host names."""
+    checkpoint = Checkpoint('test')
+    assert osmdb.pingAddresses(['b.example.com', '10.0.0.10', 'a.example.com', '10.0.0.9', '::1', 'a.example.com'], checkpoint) == ['10.0.0.9', '10.0.0.10', '::1', 'a.example.com', 'b.example.com']
+    assert checkpoint.total == 5
+
+def test_ping_host_names_resumed(osmdb):
+    """A sweep of host names goes on from the rank it stopped at."""
+    checkpoint = Checkpoint('known')
+    checkpoint.position = 2
+    assert osmdb.pingAddresses(['host1.example.com', 'host2.example.com', 'host3.example.com'], checkpoint) == ['host3.example.com']
+
+def test_ping_host_names(db, logger):
+    """Host names are pinged at their address, with a checkpoint."""
+    import Host
+    try: socket, _ = Host.icmpSocket()
+    except PermissionError: pytest.skip('no ICMP socket allowed')
+    socket.close()
+    osmdb = OSMDB({'ping_chunk_size': 2, 'ping': {'rate': 100, 'timeout': 1, 'window': 10, 'dns_workers': 4, 'processes': 1}}, db, logger)
+    checkpoint = osmdb.checkpoint('known')
+    results = {address: delay for _, _, delay, address in osmdb.pingAddresses(['localhost', 'no-such-host.invalid', '127.0.0.2'], checkpoint)}
+    assert results == {'127.0.0.1': results['127.0.0.1'], '127.0.0.2': results['127.0.0.2'], 'no-such-host.invalid': -1}
+    assert results['127.0.0.1'] >= 0 and results['127.0.0.2'] >= 0
+    assert (checkpoint.position, checkpoint.swept, checkpoint.finished is not None) == (3, 3, True)
+
+def test_stopped_sweep(db, logger):
+    """A stopped sweep ends after the shard being read, its checkpoint left unfinished where it stopped."""
+    osmdb = OSMDB({'ping_chunk_size': 2, 'ping': {'rate': 100, 'timeout': 1, 'window': 10, 'dns_workers': 4, 'processes': 1}}, db, logger)
+    osmdb.sweep = lambda shard: [(str(address), str(address), 0.001, str(address)) for address in shard]
+    checkpoint = osmdb.checkpoint('test')
+    checkpoint.start(0, None, 8)
+    results = []
+    for result in osmdb.pingShards([[0, 1], [2, 3], [4, 5], [6, 7]], 8, checkpoint):
+        results.append(result[0])
+        osmdb.stopping.set()
+    assert results == ['0', '1']
+    assert (checkpoint.position, checkpoint.swept, checkpoint.finished) == (2, 2, None)
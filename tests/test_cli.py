@@ -0,0 +1,38 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Command line, run from a copy of the tree with a database of its own."""
+import os
+import sys
+import json
+import subprocess
+from os import path
+import pytest
+
+root = path.abspath(path.join(path.dirname(__file__), '..'))
+
+@pytest.fixture
+def osmdb(tmp_path):
+    """Return a function running the command line with some arguments, and returning its exit code and its output."""
+    os.symlink(path.join(root, 'src'), str(tmp_path / 'src'))
+    os.symlink(path.join(root, 'osmdb'), str(tmp_path / 'osmdb'))
+    with open(path.join(root, 'osmdb.conf')) as f: configuration = json.load(f)
+    configuration.update(db_file=str(tmp_path / 'osmdb.db'), log_file='&2', metrics={'textfile': '', 'port': 0})
+    with open(str(tmp_path / 'osmdb.conf'), 'w') as f: json.dump(configuration, f)
+    def run(*arguments):
+        process = subprocess.run([sys.executable, './osmdb'] + list(arguments), cwd=str(tmp_path), stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True, timeout=120)
+        return process.returncode, process.stdout
+    return run
+
+def test_expiring_certificates(osmdb):
+    code, output = osmdb('--list', 'certs', '--expiring', '30')
+    assert code == 0 and 'Traceback' not in output
+    for days in ['abc', 'nan', 'inf']:
+        code, output = osmdb('--list', 'certs', '--expiring', days)
+        assert code == 99 and 'Invalid number of days' in output and 'Traceback' not in output
+
+def test_after(osmdb):
+    code, output = osmdb('--list', 'hosts', '--limit', '1', '--after', '[0, 10]')
+    assert code == 0 and 'Traceback' not in output
+    for after in ['5', '[1]', '"a"']:
+        code, output = osmdb('--list', 'hosts', '--after', after)
+        assert code == 99 and 'Invalid listing option' in output and 'Traceback' not in output
@@ -0,0 +1,26 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Daemon jobs."""
+import pytest
+import Host
+from OSMDB import OSMDB
+from Daemon import Daemon, Job
+
+@pytest.fixture
+def daemon(db, logger):
+    """A daemon whose database knows localhost, by name, as up."""
+    try: socket, _ = Host.icmpSocket()
+    except PermissionError: pytest.skip('no ICMP socket allowed')
+    socket.close()
+    configuration = {'ping_chunk_size': 16, 'ping': {'rate': 100, 'timeout': 1, 'window': 10, 'dns_workers': 4, 'processes': 1}}
+    db.updateHostBatch([('localhost', 'localhost', 0.001, '127.0.0.1')], {})
+    return Daemon(OSMDB(configuration, db, logger), configuration, logger)
+
+def counters(db): return db.cursor.execute("""SELECT up, down, adjacent_up FROM host WHERE fqdn = 'localhost'""").fetchone()
+
+@pytest.mark.parametrize('spec', [{'update': 'known'}, {'update': 'selection', 'selection': 'fqdn = "localhost"'}, {'update': 'selection', 'tags': 'local'}])
+def test_known_hosts_by_name(daemon, spec):
+    """Known hosts are pinged by name, and found up."""
+    daemon.osmdb.db.tagHost('localhost', 'local', '')
+    daemon.run(Job(spec))
+    assert counters(daemon.osmdb.db) == (2, 0, 2)
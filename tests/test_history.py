@@ -0,0 +1,56 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""History of ping delays, uptimes and URL response times, and its rollups."""
+from time import time
+import SQLite
+
+def test_rollup_period():
+    assert SQLite.rollupPeriod(86400) == 300
+    assert SQLite.rollupPeriod(7 * 86400) == 3600
+    assert SQLite.rollupPeriod(365 * 86400) == 86400
+
+def test_series_ids(db):
+    ids = db.seriesIds('ping', ['a', 'b', 'a'])
+    assert set(ids) == {'a', 'b'}
+    # Known series are not created again, nor read back from the table.
+    db.series.clear()
+    assert db.seriesIds('ping', ['b', 'c'])['b'] == ids['b']
+    assert db.seriesIds('url', ['a'])['a'] not in ids.values()
+
+def test_history(db):
+    now = int(time())
+    db.addSamples('ping', [('a', now - 20, 0.1), ('a', now - 10, None), ('a', now, 0.3), ('b', now, None)])
+    history = {name: rest for name, *rest in db.history('ping', 3600)}
+    assert history['a'][:3] == [3, 1, 0.1]
+    assert round(history['a'][3], 6) == 0.2 and history['a'][4] == 0.3
+    assert history['b'] == [1, 1, None, None, None]
+    assert db.availability('ping', 'a', 3600) == 2 * 100 / 3
+    assert db.availability('ping', 'b', 3600) == 0
+    assert db.availability('ping', 'c', 3600) is None
+    assert db.availability('url', 'a', 3600) is None
+
+def test_host_availability(db):
+    """A listed host shows its availability over the window, or since it is known when it has no history."""
+    db.cursor.execute("""INSERT INTO host (hostname, fqdn, ip, ping_delay, up, down) VALUES ('a', 'a.example.com', '10.0.0.1', 0.1, 1, 3)""")
+    db.cursor.execute("""INSERT INTO host (hostname, fqdn, ip, ping_delay, up, down) VALUES ('b', 'b.example.com', '10.0.0.2', 0.1, 1, 3)""")
+    db.addSamples('ping', [('a.example.com', int(time()), 0.1)])
+    records = list(db.format_host_records(db.listHosts('1', seen_up=False)))
+    assert records[0].endswith('\t100.000000%') or records[1].endswith('\t100.000000%')
+    assert records[0].endswith('\t25.000000%') or records[1].endswith('\t25.000000%')
+
+def test_availability_plan(db):
+    """The availability of a host is read on the primary key of the rollups, not by aggregating every series."""
+    queries = []
+    db.connection.set_trace_callback(queries.append)
+    db.availability('ping', 'a', 86400)
+    db.connection.set_trace_callback(None)
+    plan = ' '.join(row[3] for row in db.cursor.execute('EXPLAIN QUERY PLAN ' + queries[-1]))
+    assert 'USING PRIMARY KEY' in plan and 'TEMP B-TREE' not in plan
+
+def test_samples_in_the_same_second(db):
+    """A second sample of a series in the same second is ignored, by the rollups too."""
+    now = int(time())
+    db.addSamples('ping', [('a', now, 0.1), ('a', now + 0.5, None)])
+    db.addSamples('ping', [('a', now, 0.3)])
+    assert db.cursor.execute("""SELECT value FROM sample""").fetchall() == [(0.1,)]
+    assert db.cursor.execute("""SELECT DISTINCT count, lost, min, sum, max FROM rollup""").fetchall() == [(1, 0, 0.1, 0.1, 0.1)]
@@ -0,0 +1,40 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Host table updates from sweep results."""
+
+def state(db, hostname):
+    """Return the counters of a host."""
+    query = """SELECT ping_delay, up, down, adjacent_up, adjacent_down, first_up IS NOT NULL FROM host WHERE hostname = ?"""
+    return db.cursor.execute(query, (hostname,)).fetchone()
+
+def update(db, *results):
+    """Apply (hostname, delay) results. Return the number of hosts of each state of the last update."""
+    counts = {}
+    assert db.updateHostBatch([(hostname, hostname, delay, '10.0.0.1') for hostname, delay in results], counts)
+    return counts
+
+def test_transitions(db):
+    assert update(db, ('a', 0.1), ('b', -1)) == {'new': 1, 'down': 1}
+    assert state(db, 'a') == (0.1, 1, 0, 1, 0, 1)
+    assert update(db, ('a', 0.2), ('b', -1)) == {'up': 1, 'down': 1}
+    assert state(db, 'a') == (0.2, 2, 0, 2, 0, 1)
+    assert state(db, 'b') == (-1, 0, 2, 0, 2, 0)
+    assert update(db, ('a', -1)) == {'lost': 1}
+    assert state(db, 'a') == (-1, 2, 1, 2, 1, 1)
+    assert update(db, ('a', -1)) == {'down': 1}
+    assert update(db, ('a', 0.3), ('b', 0.3)) == {'back': 1, 'new': 1}
+    assert state(db, 'a') == (0.3, 3, 2, 1, 2, 1)
+
+def test_duplicate_hostname(db):
+    """A host reached at two addresses in a batch keeps its last result only."""
+    update(db, ('a', 0.1))
+    assert update(db, ('a', 0.2), ('a', -1)) == {'lost': 1}
+    assert state(db, 'a') == (-1, 1, 1, 1, 1, 1)
+    assert update(db, ('a', -1), ('a', 0.4)) == {'back': 1}
+    assert state(db, 'a') == (0.4, 2, 1, 1, 1, 1)
+
+def test_update_hosts_batches(db):
+    """Results are read in batches of `batch_size`, each one committed with the update counts summed up."""
+    db.configuration['db']['batch_size'] = 2
+    assert db.updateHosts(iter([('a', 'a', 0.1, 'a'), ('b', 'b', -1, 'b'), ('c', 'c', 0.1, 'c')]), 'test')
+    assert db.cursor.execute("""SELECT up, down, new FROM host_update WHERE network = 'test'""").fetchone() == (2, 1, 2)
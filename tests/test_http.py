@@ -0,0 +1,48 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""URL checker. Needs requests and cryptography."""
+import pytest
+pytest.importorskip('requests')
+pytest.importorskip('cryptography')
+import json
+import HTTP
+
+def test_pool_size():
+    """A pool holds a connection for every thread of the checker."""
+    http = HTTP.HTTP({'chunk_size': 64, 'connections_per_host': 8})
+    assert http.session.get_adapter('https://example.com/')._pool_maxsize == 64
+    http = HTTP.HTTP({'chunk_size': 4, 'connections_per_host': 8})
+    assert http.session.get_adapter('http://example.com/')._pool_maxsize == 8
+
+@pytest.fixture
+def server():
+    """A local server answering 304 to a request validated by its ETag, the ETag being sent as “ETag” or “etag” in turn."""
+    from threading import Thread
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    class Handler(BaseHTTPRequestHandler):
+        count = 0
+        def do_GET(self):
+            Handler.count += 1
+            if self.headers.get('If-None-Match') == '"v1"': self.send_response(304)
+            else: self.send_response(200)
+            self.send_header('ETag' if Handler.count % 2 else 'etag', '"v1"')
+            self.send_header('Content-Length', '0' if self.headers.get('If-None-Match') == '"v1"' else '4')
+            self.end_headers()
+            if self.headers.get('If-None-Match') != '"v1"': self.wfile.write(b'page')
+        def log_message(self, format, *args): pass
+    httpd = HTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+
+def test_not_modified(server):
+    """A 304 keeps the status at 200 and is flagged, the headers being merged whatever the case of their names."""
+    from URL import URL
+    http = HTTP.HTTP({'chunk_size': 2})
+    url = URL(('127.0.0.1', 'http', '/', server, '', '', None, None, None, None, None, None, None, None, None, None, None, 0))
+    first = http.get(url)
+    assert (first['status'], first['content'], first['not_modified']) == (200, 'page', False)
+    first['digest'] = 'digest of page'
+    second = http.get(first)
+    assert (second['status'], second['content'], second['not_modified']) == (200, None, True)
+    assert [name for name in json.loads(second['headers']) if name.lower() == 'etag'] == ['etag']
@@ -0,0 +1,68 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Listing options and output formats."""
+import io
+import json
+import pytest
+import Cmdline
+import Listing
+
+translations = {'--limit': '-limit', '--offset': '-offset', '--after': '-after', '--format': '-format'}
+rows = [{'fqdn': 'a.example.com', 'ip': '10.0.0.1'}, {'fqdn': 'b.example.com', 'ip': None}]
+
+def options(*args): return Listing.options(Cmdline.Cmdline(['osmdb'] + list(args), translations))
+
+def written(format, rows):
+    f = io.StringIO()
+    writer = Listing.Writer(format, f)
+    for row in rows: writer.write(row, row['fqdn'])
+    writer.close()
+    return f.getvalue()
+
+def test_options():
+    assert options() == {'limit': None, 'offset': 0, 'after': None, 'format': 'text'}
+    assert options('--limit', '10', '--offset', '-5', '--after', '[3, 7]', '--format', 'csv') == {'limit': 10, 'offset': 0, 'after': [3, 7], 'format': 'csv'}
+    assert options('--limit') == {'limit': None, 'offset': 0, 'after': None, 'format': 'text'}
+
+    assert options('--after', '[null, 7]')['after'] == [None, 7]
+    assert options('--after', '["2024-01-01", 7]')['after'] == ['2024-01-01', 7]
+
+@pytest.mark.parametrize('args', [('--limit', 'ten'), ('--after', '[3,'), ('--after', '5'), ('--after', '[1]'), ('--after', '[1, 2, 3]'), ('--after', '[1, "a"]'),
+                                  ('--after', '[[1], 2]'), ('--after', '[true, 2]'), ('--after', '{"a": 1}'), ('--format', 'xml')])
+def test_invalid_options(args):
+    with pytest.raises(ValueError): options(*args)
+
+def test_keys():
+    row = {'fqdn': 'a.example.com', '_order': 3, '_id': 7}
+    assert Listing.record(row) == {'fqdn': 'a.example.com'}
+    assert json.loads(Listing.encodeKey(Listing.key(row))) == [3, 7]
+
+def test_json():
+    assert json.loads(written('json', rows)) == rows
+    assert json.loads(written('json', [])) == []
+
+def test_csv():
+    assert written('csv', rows).splitlines() == ['fqdn,ip', 'a.example.com,10.0.0.1', 'b.example.com,']
+    assert written('csv', []) == ''
+
+def test_tsv():
+    assert written('tsv', rows).splitlines() == ['fqdn\tip', 'a.example.com\t10.0.0.1', 'b.example.com\t']
+
+def test_text():
+    assert written('text', rows) == 'a.example.com\nb.example.com\n'
+    f = io.StringIO()
+    writer = Listing.Writer('text', f)
+    writer.write(rows[0])
+    assert f.getvalue() == str(rows[0]) + '\n'
+
+def test_pages(db):
+    """Pages following each other give every row once, those without an order (executions not ended) last."""
+    ends = [10, None, 30, 20, None, 30]
+    db.cursor.executemany("""INSERT INTO execution (user, fqdn, cmdline, start, end) VALUES ('root', 'a.example.com', 'uptime', 0, ?)""", [(end,) for end in ends])
+    rows, after = [], None
+    while True:
+        page = list(db.listExecutions(limit=2, after=after))
+        rows += page
+        if len(page) < 2: break
+        after = json.loads(Listing.encodeKey(Listing.key(page[-1])))
+    assert [(row['end'], row['_id']) for row in rows] == [(30, 6), (30, 3), (20, 4), (10, 1), (None, 5), (None, 2)]
@@ -0,0 +1,29 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Logger."""
+import io
+import os
+import sys
+import Logger
+
+def test_stdout_in_order(monkeypatch):
+    """Records logged to the standard output come in order with what is printed there."""
+    monkeypatch.setattr(sys, 'stdout', io.StringIO())
+    logger = Logger.Logger()
+    logger.setLogfile('&1')
+    logger.log('first')
+    print('listing')
+    logger.log('second')
+    assert sys.stdout.getvalue() == 'first\nlisting\nsecond\n'
+    logger.setLogfile(os.devnull)
+
+def test_file_buffered(tmp_path):
+    """Records logged to a file are written by the writer thread, at the latest when the logger is flushed."""
+    filename = str(tmp_path / 'osmdb.log')
+    logger = Logger.Logger()
+    logger.setLogfile(filename)
+    logger.log('first')
+    logger.log('dropped', -1)
+    logger.flush()
+    with open(filename) as f: assert f.read() == 'first\n'
+    assert logger.writer is not None
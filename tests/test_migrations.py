@@ -0,0 +1,40 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Schema migrations."""
+import sqlite3
+import zlib
+import SQLite
+
+def test_new_database(db):
+    assert db.cursor.execute('PRAGMA user_version').fetchone()[0] == len(SQLite.migrations)
+    assert db.cursor.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+def test_old_database(tmp_path, logger):
+    """A database of the first schema, never versioned, is brought to the last version with its data."""
+    filename = str(tmp_path / 'old.db')
+    old = sqlite3.connect(filename)
+    for statement in SQLite.migrations[0]: old.execute(statement)
+    old.execute("""INSERT INTO host (hostname, fqdn, ip, ping_delay, first_up) VALUES ('a', 'a.example.com', '10.0.0.1', 0.1, 1000)""")
+    old.execute("""INSERT INTO execution (user, fqdn, cmdline, return_code, stdout, stderr, status, start, end) VALUES ('root', 'a.example.com', 'uname', 0, 'Linux', '', 'OK', 0, 1)""")
+    old.execute("""INSERT INTO url (host, proto, path, port, user, status, content) VALUES ('a.example.com', 'https', '/', 443, '', '200', 'page')""")
+    old.commit()
+    old.close()
+    db = SQLite.SQLite({'db_file': filename}, logger)
+    try:
+        assert db.cursor.execute('PRAGMA user_version').fetchone()[0] == len(SQLite.migrations)
+        assert db.cursor.execute("""SELECT hostname, ip, next_check FROM host""").fetchall() == [('a', '10.0.0.1', 0)]
+        # Outputs and contents were moved to the blob table.
+        stdout, stdout_hash = db.cursor.execute("""SELECT stdout, stdout_hash FROM execution""").fetchone()
+        assert stdout is None and db.getBlob(stdout_hash) == 'Linux'
+        content, content_hash = db.cursor.execute("""SELECT content, content_hash FROM url""").fetchone()
+        assert content is None and zlib.decompress(db.cursor.execute("""SELECT data FROM blob WHERE hash = ?""", (content_hash,)).fetchone()[0]) == b'page'
+        indexes = [row[0] for row in db.cursor.execute("""SELECT name FROM sqlite_master WHERE type = 'index'""")]
+        assert {'host_hostname', 'host_ip', 'host_next_check', 'execution_fqdn', 'certificate_not_valid_after'} <= set(indexes)
+    finally: db.close()
+
+def test_migrations_are_applied_once(tmp_path, logger):
+    filename = str(tmp_path / 'osmdb.db')
+    SQLite.SQLite({'db_file': filename}, logger).close()
+    db = SQLite.SQLite({'db_file': filename}, logger)
+    assert db.cursor.execute('PRAGMA user_version').fetchone()[0] == len(SQLite.migrations)
+    db.close()
@@ -0,0 +1,20 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Parameter resolution."""
+
+def test_getParameters(db):
+    """A name takes its own value, then its domain’s, then the one of “*”."""
+    assert db.getParameters(['a.example.com'], 'timeout') == {}
+    assert db.getParameter('a.example.com', 'timeout') is False
+    db.setParameter('*', 'timeout', '10')
+    db.setParameter('example.com', 'timeout', '20')
+    db.setParameter('a.example.com', 'timeout', '30')
+    names = ['a.example.com', 'b.example.com', 'c.example.org', 'localhost', None]
+    assert db.getParameters(names, 'timeout') == {'a.example.com': '30', 'b.example.com': '20', 'c.example.org': '10', 'localhost': '10', None: '10'}
+    assert db.getParameters(names, 'retries') == {}
+
+def test_setParameter_invalidates(db):
+    db.setParameter('*', 'timeout', '10')
+    assert db.getParameter('a.example.com', 'timeout') == '10'
+    db.setParameter('*', 'timeout', '15')
+    assert db.getParameter('a.example.com', 'timeout') == '15'
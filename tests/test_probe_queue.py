@@ -0,0 +1,50 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Adaptive probe scheduling."""
+import ProbeQueue
+from ProbeQueue import probeInterval
+
+now = 1000000
+
+def test_never_up():
+    """An address never seen up backs off from base, up to maximum."""
+    assert probeInterval(now, None, 0, 0, None) == 300
+    assert probeInterval(now, None, 0, 3, None) == 2400
+    assert probeInterval(now, 0, None, 100, None) == 86400
+
+def test_recent_change():
+    assert probeInterval(now, 1, 50, 0, now - 100) == 60
+    assert probeInterval(now, 1, 0, 5, now - 1199) == 60
+
+def test_down():
+    assert probeInterval(now, 1, 0, 1, now - 1200) == 120
+    assert probeInterval(now, 1, 0, 4, None) == 960
+    assert probeInterval(now, 1, 0, 40, None) == 86400
+
+def test_up():
+    """The interval doubles every 12 consecutive successes."""
+    assert probeInterval(now, 1, 0, 0, None) == 300
+    assert probeInterval(now, 1, 11, 0, None) == 300
+    assert probeInterval(now, 1, 12, 0, None) == 600
+    assert probeInterval(now, 1, 36, 0, None) == 2400
+    assert probeInterval(now, 1, 1000, 0, None) == 86400
+
+def test_bounds():
+    assert probeInterval(now, 1, 0, 0, None, minimum=10, base=5, maximum=20) == 10
+    assert probeInterval(now, 1, 24, 0, None, minimum=10, base=5, maximum=15) == 15
+
+def test_queue(db, logger):
+    for hostname, ip, next_check in (('a', '10.0.0.1', 100), ('b', '10.0.0.2', 300), ('c', '10.0.0.3', None), ('d', '', 0), ('e', '10.0.0.2', 200)):
+        db.cursor.execute("""INSERT INTO host (hostname, fqdn, ip, next_check) VALUES (?, ?, ?, ?)""", (hostname, hostname, ip, next_check))
+    queue = ProbeQueue.ProbeQueue(db, logger)
+    queue.load()
+    assert len(queue) == 3
+    assert queue.due(0) == ['10.0.0.3']
+    assert queue.due(250) == ['10.0.0.1', '10.0.0.2']
+    assert queue.due(1000) == []
+    assert queue.wait() is None
+    db.cursor.execute("""UPDATE host SET next_check = 500 WHERE ip = '10.0.0.1'""")
+    queue.reschedule(['10.0.0.1', '10.0.0.2'])
+    assert len(queue) == 2
+    assert queue.due(400) == ['10.0.0.2']
+    assert queue.due(500) == ['10.0.0.1']
@@ -0,0 +1,23 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""SNMP table samples and counter rates."""
+
+def test_rates_of_counters_only(db):
+    """Only the columns walked as counters have rates, and only between integer samples."""
+    samples = []
+    for sample_time, octets, speed in [(1000, 100, 1000), (1010, 600, 2000)]:
+        samples += [('sw1', 'IF-MIB', 'ifInOctets', 1, sample_time, octets, True),
+                    ('sw1', 'IF-MIB', 'ifSpeed', 1, sample_time, speed, False),
+                    ('sw1', 'IF-MIB', 'ifDescr', 1, sample_time, 'eth{}'.format(sample_time), False)]
+    db.addSnmpSamples(samples)
+    assert db.snmpRates() == [('sw1', 'IF-MIB', 'ifInOctets', 1, 1010, 50.0)]
+    assert db.snmpRates('ifSpeed') == []
+
+def test_counter_wrap(db):
+    db.addSnmpSamples([('sw1', 'IF-MIB', 'ifInOctets', 1, 1000, 500, True), ('sw1', 'IF-MIB', 'ifInOctets', 1, 1010, 100, True)])
+    assert db.snmpRates() == []
+
+def test_host_ids(db):
+    """Ids are given once, and only those of the requested hosts are returned."""
+    first = db.hostIds(['a', 'b'])
+    assert db.hostIds(['b', 'c', 'c']) == {'b': first['b'], 'c': max(first.values()) + 1}
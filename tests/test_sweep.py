@@ -0,0 +1,40 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""ICMP sweep engine and name resolution."""
+import pytest
+import Host
+from Sweep import Sweep
+
+def sweep(targets, logger):
+    """Return the results of a sweep of targets, by name. Skip the test if no ICMP socket is allowed."""
+    try: return dict(Sweep(100, 1, 10, logger).run(targets))
+    except PermissionError: pytest.skip('no ICMP socket allowed')
+
+def test_lookup():
+    assert Host.lookup('127.0.0.1') == '127.0.0.1'
+    assert Host.lookup('::1') == '::1'
+    assert Host.lookup('0:0::1') == '::1'
+    assert Host.lookup('localhost') == '127.0.0.1'
+    assert Host.lookup('no-such-host.invalid') is None
+
+def test_sweep_addresses(logger):
+    results = sweep(['127.0.0.1', '127.0.0.2'], logger)
+    assert set(results) == {'127.0.0.1', '127.0.0.2'}
+    assert all(delay >= 0 for delay in results.values())
+
+def test_sweep_names(logger):
+    """Replies come from the address of a name: they are given back under the name."""
+    results = sweep(['127.0.0.1', ('localhost', '127.0.0.1')], logger)
+    assert set(results) == {'127.0.0.1', 'localhost'}
+    assert results['localhost'] >= 0
+
+def test_osmdb_sweep_names(logger):
+    """Names are resolved before the sweep, and stored with the address they were pinged at."""
+    import OSMDB
+    osmdb = OSMDB.OSMDB({'ping': {'rate': 100, 'timeout': 1, 'window': 10, 'dns_workers': 4, 'processes': 1}}, None, logger)
+    try: socket, _ = Host.icmpSocket()
+    except PermissionError: pytest.skip('no ICMP socket allowed')
+    socket.close()
+    results = {address: delay for _, _, delay, address in osmdb.sweep(['localhost', 'no-such-host.invalid'])}
+    assert results['127.0.0.1'] >= 0
+    assert results['no-such-host.invalid'] == -1
@@ -0,0 +1,39 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""Tag queries."""
+import pytest
+from Tags import TagQuery
+
+def test_single_tag():
+    query, params = TagQuery('linux').sql()
+    assert query.endswith(' WHERE fqdn IN (SELECT host FROM host_tag WHERE tag = ?) ORDER BY fqdn') and params == ['linux']
+
+def test_precedence():
+    """`&` binds tighter than `|`, parentheses and `!` are honored and parameters follow the order of the tags."""
+    tag = 'fqdn IN (SELECT host FROM host_tag WHERE tag = ?)'
+    query = TagQuery('a | b & !c')
+    assert query.condition == '({0} OR ({0} AND NOT {0}))'.format(tag)
+    assert query.params == ['a', 'b', 'c']
+    query = TagQuery('(a|b)&!!c')
+    assert query.condition == '(({0} OR {0}) AND NOT NOT {0})'.format(tag)
+    assert query.params == ['a', 'b', 'c']
+
+@pytest.mark.parametrize('expression', ['', 'a&', '&a', 'a|(b', 'a)', 'a b', 'a;b', "a' OR 1"])
+def test_invalid(expression):
+    with pytest.raises(ValueError): TagQuery(expression)
+
+def test_hostsByTags(db):
+    for fqdn in ('a.example.com', 'b.example.com', 'c.example.com'):
+        db.cursor.execute("""INSERT INTO host (hostname, fqdn) VALUES (?, ?)""", (fqdn.split('.')[0], fqdn))
+    for host, tag in (('a.example.com', 'linux'), ('a.example.com', 'web'), ('b.example.com', 'linux'), ('b.example.com', 'db'), ('c.example.com', 'web')):
+        db.tagHost(host, tag, '')
+    assert db.hostsByTags('linux') == [('a.example.com',), ('b.example.com',)]
+    assert db.hostsByTags('linux&(web|db)') == [('a.example.com',), ('b.example.com',)]
+    assert db.hostsByTags('web&!linux') == [('c.example.com',)]
+    assert db.hostsByTags('!web') == [('b.example.com',)]
+    assert db.hostsByTags('linux&') == []
+    # A tagged name never swept is selected too.
+    db.tagHost('d.example.com', 'web', '')
+    assert db.hostsByTags('web') == [('a.example.com',), ('c.example.com',), ('d.example.com',)]
+    assert db.hostsByTags('!linux') == [('c.example.com',), ('d.example.com',)]
+    assert db.hostsByTags(True) == []
@@ -0,0 +1,32 @@
+# pylint: disable=bad-whitespace,bad-continuation,line-too-long,multiple-statements,trailing-whitespace,trailing-newlines,invalid-name,trailing-whitespace
+# -*- coding: UTF-8 -*-
+"""URL check records, content changes and history."""
+from URL import URL
+
+def check(db, content, status = 200, not_modified = False, check_time = 1000):
+    """Record a check of the only URL, as HTTP.get would fill it in."""
+    url = URL(db.urls()[0])
+    url.update(check_time=check_time, response_time=0.1, total_time=0.1, status=status, headers='{}', content=content, certificate=None,
+               expire=None, get_error='', not_modified=not_modified)
+    db.updateURLs([url])
+    return URL(db.urls()[0])
+
+def test_not_modified(db):
+    """A 304 leaves the status (stored as text) and the content as they were, with the not modified flag."""
+    db.addURL(('http', '', '', 'a', 80, '/'))
+    first = check(db, 'page')
+    second = check(db, None, not_modified=True, check_time=1100)
+    assert (second['status'], second['digest'], second['not_modified']) == ('200', first['digest'], 1)
+    assert check(db, 'page', check_time=1200)['not_modified'] == 0
+    assert len(db.urlChanges()) == 1
+
+def test_url_samples(db):
+    """Each check adds a sample to the history of its URL, a failed one being a loss."""
+    from time import time
+    for host in ['a', 'b']: db.addURL(('http', '', '', host, 80, '/'))
+    now = int(time())
+    urls = [URL(row) for row in db.urls()]
+    for url, status in zip(urls, [200, -1]):
+        url.update(check_time=now, response_time=0.5, total_time=0.5, status=status, headers='{}', content=None, certificate=None, expire=None, get_error='')
+    db.updateURLs(urls)
+    assert [(name, count, lost) for name, count, lost, *_ in db.history('url', 3600)] == [('http://a:80/', 1, 0), ('http://b:80/', 1, 1)]